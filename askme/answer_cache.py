@@ -0,0 +1,163 @@
+import collections
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from askme.context import count_text
+
+DEFAULT_PATH = os.path.join(".askme_cache", "answers.sqlite3")
+
+
+# Words, numbers (with decimals) and the operators between them; everything else is dropped
+_TOKENS = re.compile(r"\d+(?:\.\d+)?|[a-z0-9]+|[-+*/^=<>%×÷√]")
+# Words a rewording adds or drops without changing the question; all others must match exactly
+_FILLER = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "do", "does", "did", "please", "can", "could", "would",
+    "you", "me", "i", "tell", "explain",
+}
+
+
+def normalise(prompt):
+    """Lower-case `prompt` and reduce it to its words, numbers and operators, so trivial variations match."""
+    # A hyphen after a letter ("half-life", "carbon-14") is not a minus sign, and "newton's" is "newtons"
+    text = re.sub(r"(?<=[a-z])-(?=[a-z0-9])", " ", re.sub(r"(?<=[a-z])['’](?=[a-z])", "", prompt.lower()))
+    return " ".join(_TOKENS.findall(text))
+
+
+def content_words(key):
+    """The words, numbers and operators of a normalised question other than filler, in order."""
+    return tuple(t for t in key.split(" ") if t not in _FILLER)
+
+
+def system_hash(*parts):
+    """Hash of whatever shapes the answer besides the question (system prompt, model, ...)."""
+    return hashlib.sha256("\x00".join(str(p) for p in parts).encode()).hexdigest()[:16]
+
+
+def _vector(text, n=3):
+    # A cheap local embedding: counts of character trigrams, L2-normalised
+    padded = f" {text} "
+    grams = collections.Counter(padded[i:i + n] for i in range(len(padded) - n + 1))
+    norm = math.sqrt(sum(v * v for v in grams.values())) or 1.0
+    return {g: v / norm for g, v in grams.items()}
+
+
+def _cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(g, 0.0) for g, v in a.items())
+
+
+def replay(answer, words_per_chunk=3, delay=0.01):
+    """Yield a cached answer in small chunks for `st.write_stream`."""
+    words = re.split(r"(\s+)", answer)
+    step = words_per_chunk * 2
+    for i in range(0, len(words), step):
+        yield "".join(words[i:i + step])
+        time.sleep(delay)
+
+
+class AnswerCache:
+    """Answers to standalone questions in SQLite, keyed by `system_hash(...)` and the normalised question."""
+
+    def __init__(self, path=DEFAULT_PATH, ttl=7 * 24 * 3600, max_entries=5000, similarity=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.counts = collections.Counter()
+        self._similar = {}
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers (system TEXT, prompt TEXT, answer TEXT, tokens INTEGER,"
+            " created REAL, used REAL, hits INTEGER DEFAULT 0, PRIMARY KEY (system, prompt))"
+        )
+        self._db.commit()
+
+    def _candidates(self, system):
+        # Cached questions for this system prompt by their content words, with trigram vectors; built once
+        if system not in self._similar:
+            index = self._similar[system] = {}
+            rows = self._db.execute(
+                "SELECT prompt FROM answers WHERE system = ? AND created > ?", (system, time.time() - self.ttl)
+            )
+            for prompt, in rows:
+                index.setdefault(content_words(prompt), {})[prompt] = _vector(prompt)
+        return self._similar[system]
+
+    def _forget(self, system, prompt):
+        # Drop an evicted or expired question from the similarity index
+        index = self._similar.get(system)
+        if index is not None:
+            words = content_words(prompt)
+            index.get(words, {}).pop(prompt, None)
+            if not index.get(words, True):
+                del index[words]
+
+    def get(self, system, prompt):
+        """Return the cached answer for `prompt`, or None."""
+        key = normalise(prompt)
+        with self._lock:
+            self.counts["lookups"] += 1
+            row = self._db.execute(
+                "SELECT prompt, answer, tokens FROM answers WHERE system = ? AND prompt = ? AND created > ?",
+                (system, key, time.time() - self.ttl),
+            ).fetchone()
+            if row is None and self.similarity:
+                # Only a question with exactly the same content words is a rewording of this one
+                query = _vector(key)
+                same = self._candidates(system).get(content_words(key), {})
+                score, best = max(((_cosine(query, v), p) for p, v in same.items()), default=(0.0, None))
+                if score >= self.similarity:
+                    row = self._db.execute(
+                        "SELECT prompt, answer, tokens FROM answers WHERE system = ? AND prompt = ? AND created > ?",
+                        (system, best, time.time() - self.ttl),
+                    ).fetchone()
+                    if row is None:
+                        self._forget(system, best)
+                    else:
+                        self.counts["similar_hits"] += 1
+            if row is None:
+                return None
+            self.counts["hits"] += 1
+            self.counts["saved_tokens"] += row[2]
+            self._db.execute(
+                "UPDATE answers SET used = ?, hits = hits + 1 WHERE system = ? AND prompt = ?",
+                (time.time(), system, row[0]),
+            )
+            self._db.commit()
+            return row[1]
+
+    def put(self, system, prompt, answer, prompt_tokens=0):
+        """Cache `answer`; `prompt_tokens` is added to the tokens a later hit saves."""
+        key = normalise(prompt)
+        if not key or not answer:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (system, prompt, answer, tokens, created, used) VALUES (?, ?, ?, ?, ?, ?)",
+                (system, key, answer, prompt_tokens + count_text(answer), now, now),
+            )
+            stale = "created <= ? OR rowid IN (SELECT rowid FROM answers ORDER BY used DESC LIMIT -1 OFFSET ?)"
+            args = (now - self.ttl, self.max_entries)
+            evicted = self._db.execute(f"SELECT system, prompt FROM answers WHERE {stale}", args).fetchall()
+            self._db.execute(f"DELETE FROM answers WHERE {stale}", args)
+            self._db.commit()
+            for old_system, old_prompt in evicted:
+                self._forget(old_system, old_prompt)
+            if system in self._similar:
+                self._similar[system].setdefault(content_words(key), {})[key] = _vector(key)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        lookups = counts.get("lookups", 0)
+        counts["hit_rate"] = counts.get("hits", 0) / lookups if lookups else 0.0
+        return counts
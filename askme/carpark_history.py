@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+DEFAULT_DIR = os.path.join(".askme_cache", "carparks")
+# Marks a (time, carpark, lot type) cell with no reading
+MISSING = -1
+
+
+def _epoch(timestamp):
+    return int(datetime.fromisoformat(timestamp).timestamp())
+
+
+class CarparkHistory:
+    """Ring buffer of availability readings memory-mapped under `directory`, one column per carpark and lot type."""
+
+    def __init__(self, directory=DEFAULT_DIR, capacity=24 * 60, max_series=6144):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.timestamps = self._open("timestamps.npy", np.int64, (capacity,), 0)
+        self.available = self._open("available.npy", np.int16, (len(self.timestamps), max_series), MISSING)
+        self.capacity, self.max_series = self.available.shape
+        self._series_path = os.path.join(directory, "series.json")
+        if os.path.exists(self._series_path):
+            with open(self._series_path) as f:
+                saved = json.load(f)
+            self.columns, self.total_lots = saved["columns"], saved["total_lots"]
+        else:
+            self.columns, self.total_lots = {}, {}
+        # The slot after the newest reading is where the next one goes
+        self.head = (int(self.timestamps.argmax()) + 1) % self.capacity if self.timestamps.any() else 0
+
+    def _open(self, name, dtype, shape, fill):
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r+")
+        array = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+        array[:] = fill
+        return array
+
+    @staticmethod
+    def key(carpark_number, lot_type):
+        return f"{carpark_number}/{lot_type}"
+
+    @property
+    def last_timestamp(self):
+        return int(self.timestamps[(self.head - 1) % self.capacity])
+
+    def record(self, snapshot):
+        """Store one CarparkSnapshot; returns False if that reading is already stored."""
+        when = _epoch(snapshot.timestamp)
+        with self._lock:
+            if when <= self.last_timestamp:
+                return False
+            row = np.full(self.max_series, MISSING, dtype=np.int16)
+            for number, carpark in snapshot.by_number.items():
+                for info in carpark['carpark_info']:
+                    key = self.key(number, info['lot_type'])
+                    column = self.columns.get(key)
+                    if column is None:
+                        if len(self.columns) >= self.max_series:
+                            continue
+                        column = self.columns[key] = len(self.columns)
+                    row[column] = int(info['lots_available'] or 0)
+                    self.total_lots[key] = int(info['total_lots'] or 0)
+            self.available[self.head] = row
+            self.timestamps[self.head] = when
+            self.head = (self.head + 1) % self.capacity
+            self.available.flush()
+            self.timestamps.flush()
+            with open(self._series_path + ".tmp", "w") as f:
+                json.dump({"columns": self.columns, "total_lots": self.total_lots}, f)
+            os.replace(self._series_path + ".tmp", self._series_path)
+        return True
+
+    def window(self, keys, hours):
+        """Readings of the given series over the last `hours`.
+
+        Returns `(times, values)`: epoch seconds in ascending order and a
+        dict of float arrays per key, with NaN where there was no reading.
+        """
+        with self._lock:
+            since = self.last_timestamp - hours * 3600
+            slots = np.nonzero(self.timestamps > max(since, 0))[0]
+            slots = slots[np.argsort(self.timestamps[slots])]
+            times = self.timestamps[slots].copy()
+            columns = {key: self.columns[key] for key in keys if key in self.columns}
+            block = self.available[np.ix_(slots, list(columns.values()))].astype(float)
+        block[block == MISSING] = np.nan
+        return times, {key: block[:, i] for i, key in enumerate(columns)}
+
+    def lot_types(self, carpark_number):
+        prefix = f"{carpark_number}/"
+        return [key[len(prefix):] for key in self.columns if key.startswith(prefix)]
+
+
+class CarparkPoller:
+    """Background thread that refreshes a CarparkAvailability every `interval` seconds into a CarparkHistory."""
+
+    def __init__(self, availability, history, interval=60.0):
+        self.availability = availability
+        self.history = history
+        self.interval = interval
+        self.polls = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="carpark-poller", daemon=True)
+        self._thread.start()
+
+    def poll(self):
+        snapshot = self.availability.fetch()
+        self.availability.update(snapshot)
+        self.history.record(snapshot)
+        self.polls += 1
+        return snapshot
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self.errors += 1
+                print(f"Carpark poll failed: {e}")
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
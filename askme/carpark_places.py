@@ -0,0 +1,184 @@
+"""Where HDB carparks are, and which are near a point.
+
+    python -m askme.carpark_places download
+"""
+import argparse
+import csv
+import json
+import math
+import os
+
+import numpy as np
+import requests
+
+DEFAULT_CSV = os.path.join("data", "hdb_carpark_info.csv")
+DEFAULT_INDEX_DIR = os.path.join(".askme_cache", "carpark_places")
+DATASET_URL = "https://data.gov.sg/api/action/datastore_search"
+DATASET_ID = "d_23f946fa557947f93a8043bbef41dd09"
+# Side of a grid cell in metres; about the radius people search within
+CELL = 250.0
+# Cell keys pack (column, row) into one int64; SVY21 eastings stay far below this
+ROW_SPAN = 1 << 20
+
+# Places the apps search around, as (latitude, longitude)
+LANDMARKS = {
+    "Temasek Junior College": (1.3573, 103.9536),
+}
+
+# SVY21 projection (Singapore's national grid): WGS84 ellipsoid, transverse Mercator
+_A = 6378137.0
+_F = 1 / 298.257223563
+_ORIGIN_LAT, _ORIGIN_LON = 1.366666, 103.833333
+_FALSE_NORTHING, _FALSE_EASTING = 38744.572, 28001.642
+_SCALE = 1.0
+_E2 = 2 * _F - _F * _F
+_A0 = 1 - _E2 / 4 - 3 * _E2 ** 2 / 64 - 5 * _E2 ** 3 / 256
+_A2 = 3 / 8 * (_E2 + _E2 ** 2 / 4 + 15 * _E2 ** 3 / 128)
+_A4 = 15 / 256 * (_E2 ** 2 + 3 * _E2 ** 3 / 4)
+_A6 = 35 * _E2 ** 3 / 3072
+
+
+def _meridian(lat):
+    lat = math.radians(lat)
+    return _A * (_A0 * lat - _A2 * math.sin(2 * lat) + _A4 * math.sin(4 * lat) - _A6 * math.sin(6 * lat))
+
+
+def latlon_to_svy21(lat, lon):
+    """(easting, northing) in metres for a WGS84 latitude/longitude."""
+    phi = math.radians(lat)
+    sin, cos, t = math.sin(phi), math.cos(phi), math.tan(phi)
+    rho = _A * (1 - _E2) / (1 - _E2 * sin * sin) ** 1.5
+    v = _A / math.sqrt(1 - _E2 * sin * sin)
+    psi, w = v / rho, math.radians(lon - _ORIGIN_LON)
+    t2 = t * t
+
+    north = (
+        w ** 2 / 2 * v * sin * cos
+        + w ** 4 / 24 * v * sin * cos ** 3 * (4 * psi ** 2 + psi - t2)
+        + w ** 6 / 720 * v * sin * cos ** 5 * (
+            8 * psi ** 4 * (11 - 24 * t2) - 28 * psi ** 3 * (1 - 6 * t2) + psi ** 2 * (1 - 32 * t2)
+            - psi * 2 * t2 + t2 ** 2)
+        + w ** 8 / 40320 * v * sin * cos ** 7 * (1385 - 3111 * t2 + 543 * t2 ** 2 - t2 ** 3)
+    )
+    northing = _FALSE_NORTHING + _SCALE * (_meridian(lat) - _meridian(_ORIGIN_LAT) + north)
+    east = (
+        1
+        + w ** 2 / 6 * cos ** 2 * (psi - t2)
+        + w ** 4 / 120 * cos ** 4 * (4 * psi ** 3 * (1 - 6 * t2) + psi ** 2 * (1 + 8 * t2) - psi * 2 * t2 + t2 ** 2)
+        + w ** 6 / 5040 * cos ** 6 * (61 - 479 * t2 + 179 * t2 ** 2 - t2 ** 3)
+    )
+    easting = _FALSE_EASTING + _SCALE * v * w * cos * east
+    return easting, northing
+
+
+def _cell(x, y):
+    return np.floor_divide(x, CELL).astype(np.int64) * ROW_SPAN + np.floor_divide(y, CELL).astype(np.int64)
+
+
+def build_index(csv_path=DEFAULT_CSV, index_dir=DEFAULT_INDEX_DIR):
+    """Parse the carpark CSV and write the grid index files to `index_dir`."""
+    numbers, addresses, xy = [], [], []
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            try:
+                point = float(row["x_coord"]), float(row["y_coord"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            numbers.append(row["car_park_no"])
+            addresses.append(row.get("address", ""))
+            xy.append(point)
+    xy = np.array(xy, dtype=np.float64).reshape(-1, 2)
+    keys = _cell(xy[:, 0], xy[:, 1])
+    order = np.argsort(keys, kind="stable")
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, "keys.npy"), keys[order])
+    np.save(os.path.join(index_dir, "xy.npy"), xy[order])
+    with open(os.path.join(index_dir, "places.json"), "w") as f:
+        json.dump({"numbers": [numbers[i] for i in order], "addresses": [addresses[i] for i in order]}, f)
+
+
+class CarparkPlaces:
+    """Grid index of HDB carpark locations, memory-mapped from `index_dir`.
+
+    The index is (re)built from `csv_path` when it is missing or older than
+    the CSV. Raises FileNotFoundError if neither exists.
+    """
+
+    def __init__(self, csv_path=DEFAULT_CSV, index_dir=DEFAULT_INDEX_DIR):
+        places = os.path.join(index_dir, "places.json")
+        if not os.path.exists(places) or (
+            os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(places)
+        ):
+            build_index(csv_path, index_dir)
+        self.keys = np.load(os.path.join(index_dir, "keys.npy"), mmap_mode="r")
+        self.xy = np.load(os.path.join(index_dir, "xy.npy"), mmap_mode="r")
+        with open(places) as f:
+            saved = json.load(f)
+        self.numbers, self.addresses = saved["numbers"], saved["addresses"]
+        self._position = {number: i for i, number in reversed(list(enumerate(self.numbers)))}
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def address(self, carpark_number, default="Unknown"):
+        i = self._position.get(carpark_number)
+        return default if i is None else self.addresses[i]
+
+    def within(self, easting, northing, metres):
+        """[(carpark number, distance in metres)] within `metres` of an SVY21 point, nearest first."""
+        columns = range(int(math.floor((easting - metres) / CELL)), int(math.floor((easting + metres) / CELL)) + 1)
+        low, high = int(math.floor((northing - metres) / CELL)), int(math.floor((northing + metres) / CELL))
+        # Each grid column's cells are contiguous in key order, so one range per column
+        spans = [
+            (np.searchsorted(self.keys, c * ROW_SPAN + low), np.searchsorted(self.keys, c * ROW_SPAN + high, "right"))
+            for c in columns
+        ]
+        rows = np.concatenate([np.arange(start, stop) for start, stop in spans]) if spans else np.empty(0, int)
+        distances = np.hypot(self.xy[rows, 0] - easting, self.xy[rows, 1] - northing)
+        close = distances <= metres
+        rows, distances = rows[close], distances[close]
+        order = np.argsort(distances, kind="stable")
+        return [(self.numbers[rows[i]], float(distances[i])) for i in order]
+
+    def near(self, lat, lon, metres):
+        """Like `within`, for a latitude/longitude."""
+        return self.within(*latlon_to_svy21(lat, lon), metres)
+
+
+def download(csv_path=DEFAULT_CSV, page=5000):
+    """Fetch the HDB Carpark Information dataset from data.gov.sg into `csv_path`."""
+    session = requests.Session()
+    records, offset, fields = [], 0, None
+    while True:
+        response = session.get(DATASET_URL, params={"resource_id": DATASET_ID, "limit": page, "offset": offset},
+                               timeout=30)
+        response.raise_for_status()
+        result = response.json()["result"]
+        fields = fields or [f["id"] for f in result["fields"] if f["id"] != "_id"]
+        records.extend(result["records"])
+        offset += page
+        if offset >= result.get("total", 0) or not result["records"]:
+            break
+    os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(records)
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the HDB carpark location index.")
+    parser.add_argument("command", choices=("download", "build"))
+    parser.add_argument("--csv", default=DEFAULT_CSV)
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    args = parser.parse_args()
+    if args.command == "download":
+        print(f"Saved {download(args.csv)} carparks to {args.csv}")
+    build_index(args.csv, args.index_dir)
+    print(f"Indexed {len(CarparkPlaces(args.csv, args.index_dir))} carparks in {args.index_dir}")
+
+
+if __name__ == "__main__":
+    main()
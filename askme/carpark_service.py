@@ -0,0 +1,133 @@
+"""Carpark availability over HTTP, without Streamlit.
+
+    python -m askme.carpark_service --port 8600
+"""
+import argparse
+import hashlib
+import json
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+import requests
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from askme.carparks import API_URL, CarparkAvailability, CarparkError
+from askme.tracing import CONTENT_TYPE, metrics_text
+
+# The whole feed in data.gov.sg's schema, so the apps can use this service as $CARPARK_API_URL
+FEED_PATH = "/v1/transport/carpark-availability"
+
+
+class _Validators:
+    # ETag, Last-Modified and the full-feed body of one snapshot, built once
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        tag = f"{snapshot.timestamp}/{snapshot.etag}/{len(snapshot)}"
+        self.etag = '"' + hashlib.sha1(tag.encode()).hexdigest()[:16] + '"'
+        try:
+            self.modified = datetime.fromisoformat(snapshot.timestamp).astimezone(timezone.utc).replace(microsecond=0)
+            self.last_modified = format_datetime(self.modified, usegmt=True)
+        except (TypeError, ValueError):
+            self.modified = self.last_modified = None
+        self._feed = None
+
+    def feed(self):
+        if self._feed is None:
+            payload = {"items": [{"timestamp": self.snapshot.timestamp,
+                                  "carpark_data": list(self.snapshot.by_number.values())}]}
+            self._feed = json.dumps(payload).encode()
+        return self._feed
+
+    def not_modified(self, request):
+        match = request.headers.get("if-none-match")
+        if match is not None:
+            return self.etag in [tag.strip() for tag in match.split(",")] or match.strip() == "*"
+        since = request.headers.get("if-modified-since")
+        if since and self.modified is not None:
+            try:
+                return parsedate_to_datetime(since) >= self.modified
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+def build_app(availability):
+    """The Starlette app serving `availability` (a CarparkAvailability)."""
+    current = None
+
+    async def snapshot():
+        nonlocal current
+        # Fresh snapshots come straight back; a refresh runs off the event loop
+        latest = availability.latest
+        if latest is None or not availability.fresh:
+            latest = await run_in_threadpool(availability.snapshot)
+        if current is None or current.snapshot is not latest:
+            current = _Validators(latest)
+        return current
+
+    def headers(validators):
+        age = time.monotonic() - validators.snapshot.fetched_at
+        result = {"ETag": validators.etag, "Cache-Control": f"max-age={max(int(availability.max_age - age), 0)}"}
+        if validators.last_modified:
+            result["Last-Modified"] = validators.last_modified
+        return result
+
+    async def carparks(request):
+        ids = [i.strip() for i in request.query_params.get("ids", "").split(",") if i.strip()]
+        if not ids:
+            return JSONResponse({"error": "pass carpark numbers as ?ids=TM44,T79"}, status_code=400)
+        try:
+            validators = await snapshot()
+        except CarparkError as e:
+            return JSONResponse({"error": str(e)}, status_code=502)
+        if validators.not_modified(request):
+            return Response(status_code=304, headers=headers(validators))
+        found = validators.snapshot.lookup(ids)
+        known = {c["carpark_number"] for c in found}
+        return JSONResponse(
+            {"timestamp": validators.snapshot.timestamp, "carparks": found,
+             "missing": [i for i in ids if i not in known]},
+            headers=headers(validators),
+        )
+
+    async def feed(request):
+        try:
+            validators = await snapshot()
+        except CarparkError as e:
+            return JSONResponse({"error": str(e)}, status_code=502)
+        if validators.not_modified(request):
+            return Response(status_code=304, headers=headers(validators))
+        return Response(validators.feed(), media_type="application/json", headers=headers(validators))
+
+    async def health(request):
+        return JSONResponse({"upstream_fetches": availability.fetches, "not_modified": availability.not_modified})
+
+    async def metrics(request):
+        return Response(metrics_text(), headers={"Content-Type": CONTENT_TYPE})
+
+    return Starlette(routes=[
+        Route("/carparks", carparks),
+        Route(FEED_PATH, feed),
+        Route("/healthz", health),
+        Route("/metrics", metrics),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve carpark availability over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--upstream", default=API_URL, help="feed URL (default: $CARPARK_API_URL or data.gov.sg)")
+    parser.add_argument("--max-age", type=float, default=60.0, help="seconds a snapshot is served before refreshing")
+    args = parser.parse_args()
+    availability = CarparkAvailability(requests.Session(), url=args.upstream, max_age=args.max_age)
+    uvicorn.run(build_app(availability), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
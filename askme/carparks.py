@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+from askme.tracing import traced
+
+# Overridable so the apps can be pointed at a local stand-in of the feed
+API_URL = os.environ.get('CARPARK_API_URL', 'https://api.data.gov.sg/v1/transport/carpark-availability')
+
+
+class CarparkError(Exception):
+    """Raised when the availability feed can't be fetched and nothing is cached."""
+
+
+def iter_carparks(chunks, carpark_numbers):
+    """Yield the records for `carpark_numbers` from the feed bytes in `chunks`, stopping once all are found."""
+    wanted = set(carpark_numbers)
+    if ijson is None:
+        for carpark in json.loads(b"".join(chunks))['items'][0]['carpark_data']:
+            if carpark['carpark_number'] in wanted:
+                wanted.discard(carpark['carpark_number'])
+                yield carpark
+        return
+    for carpark in ijson.items(_ChunkReader(chunks), 'items.item.carpark_data.item'):
+        # The feed repeats a few carparks; keep the first like a linear scan would
+        if carpark['carpark_number'] in wanted:
+            wanted.discard(carpark['carpark_number'])
+            yield carpark
+            if not wanted:
+                return
+
+
+class _ChunkReader:
+    # File-like view of an iterator of byte chunks, so ijson's C backend can pull from it
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class CarparkSnapshot:
+    """One reading of the national feed, indexed by carpark number."""
+
+    def __init__(self, payload, fetched_at=None, etag=None, last_modified=None):
+        item = payload['items'][0]
+        self.timestamp = item.get('timestamp')
+        self.fetched_at = time.monotonic() if fetched_at is None else fetched_at
+        # Validators from the response, sent back on the next fetch
+        self.etag = etag
+        self.last_modified = last_modified
+        self.by_number = {}
+        for carpark in item['carpark_data']:
+            # The feed repeats a few carparks; keep the first like a linear scan would
+            self.by_number.setdefault(carpark['carpark_number'], carpark)
+
+    def get(self, carpark_number):
+        return self.by_number.get(carpark_number)
+
+    def lookup(self, carpark_numbers):
+        """Records for the given numbers, in order, skipping unknown ones."""
+        return [self.by_number[n] for n in carpark_numbers if n in self.by_number]
+
+    def __len__(self):
+        return len(self.by_number)
+
+
+class CarparkAvailability:
+    """Process-wide cache of the carpark availability feed, fetched at most once every `max_age` seconds."""
+
+    def __init__(self, session, url=API_URL, max_age=60.0, timeout=10, retry_after=10.0):
+        self.session = session
+        self.url = url
+        self.max_age = max_age
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.fetches = 0
+        self.not_modified = 0
+        self._snapshot = None
+        self._next_try = 0.0
+        self._refresh = threading.Lock()
+
+    @traced("carparks.fetch")
+    def fetch(self):
+        """Download the feed, or confirm the current snapshot if upstream says it is unchanged."""
+        headers = {'accept': '*/*'}
+        previous = self._snapshot
+        if previous is not None:
+            if previous.etag:
+                headers['If-None-Match'] = previous.etag
+            if previous.last_modified:
+                headers['If-Modified-Since'] = previous.last_modified
+        response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+        self.fetches += 1
+        if response.status_code == 304 and previous is not None:
+            self.not_modified += 1
+            previous.fetched_at = time.monotonic()
+            return previous
+        if response.status_code != 200:
+            raise CarparkError(f"Error: {response.status_code} - {response.text}")
+        return CarparkSnapshot(
+            response.json(), etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified')
+        )
+
+    @traced("carparks.stream_lookup")
+    def stream_lookup(self, carpark_numbers, chunk_size=16 * 1024):
+        """Records for `carpark_numbers`, in order, read straight off the wire.
+
+        For when there is no snapshot yet: instead of downloading and
+        indexing the whole feed, parse it as it arrives and hang up once the
+        requested carparks have all been found.
+        """
+        try:
+            with self.session.get(self.url, headers={'accept': '*/*'}, timeout=self.timeout, stream=True) as response:
+                self.fetches += 1
+                if response.status_code != 200:
+                    raise CarparkError(f"Error: {response.status_code} - {response.text}")
+                chunks = response.iter_content(chunk_size)
+                found = {c['carpark_number']: c for c in iter_carparks(chunks, carpark_numbers)}
+        except CarparkError:
+            raise
+        except Exception as e:
+            raise CarparkError(str(e)) from e
+        return [found[n] for n in carpark_numbers if n in found]
+
+    @property
+    def latest(self):
+        """The newest snapshot without refreshing it (None before the first fetch)."""
+        return self._snapshot
+
+    def update(self, snapshot):
+        """Make `snapshot` current, e.g. when a background poller fetched it."""
+        self._snapshot = snapshot
+
+    @property
+    def fresh(self):
+        """Whether `snapshot()` would return without going to the network."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return False
+        now = time.monotonic()
+        return now - snapshot.fetched_at < self.max_age or now < self._next_try
+
+    def snapshot(self):
+        if self.fresh:
+            return self._snapshot
+        # Only one caller refreshes; the rest reuse the stale snapshot if there is one
+        if not self._refresh.acquire(blocking=self._snapshot is None):
+            return self._snapshot
+        try:
+            if not self.fresh:
+                try:
+                    self._snapshot = self.fetch()
+                except Exception as e:
+                    if self._snapshot is None:
+                        raise CarparkError(str(e)) from e
+                    # Don't hammer a failing upstream; retry a little later
+                    self._next_try = time.monotonic() + self.retry_after
+                    print(f"Serving stale carpark snapshot: {e}")
+            return self._snapshot
+        finally:
+            self._refresh.release()
@@ -0,0 +1,81 @@
+import statistics
+import time
+
+import streamlit as st
+
+from askme.context import describe_usage
+from askme.tracing import observe
+
+ROLE_NAMES = {"user": "You", "assistant": "Tutor"}
+
+
+def chat_markdown(message):
+    """A finished chat turn as markdown, for the history block."""
+    text = f"**{ROLE_NAMES.get(message['role'], message['role'].title())}:**  \n{message['content']}"
+    if "usage" in message:
+        text += f"\n\n:gray[{describe_usage(message['usage'])}]"
+    return text
+
+
+def draw_chat_message(message):
+    """A chat turn as its own chat bubble, as the apps drew every turn before."""
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+        if "usage" in message:
+            st.caption(describe_usage(message["usage"]))
+
+
+def render_history(items, draw=draw_chat_message, format=chat_markdown, live=2, key="_history_block"):
+    """Draw a conversation, keeping finished turns as one cached markdown block so a rerun only adds new ones."""
+    done = max(len(items) - live, 0)
+    count, text = st.session_state.get(key, (0, ""))
+    if count > done:
+        # The history was cleared or cut; start the block again
+        count, text = 0, ""
+    if done > count:
+        text += "".join(("\n\n---\n\n" if i else "") + format(item) for i, item in enumerate(items[count:done], count))
+        st.session_state[key] = (done, text)
+    if text:
+        st.markdown(text)
+    for item in items[done:]:
+        draw(item)
+
+
+class RerunTimer:
+    """Times one script run, and the parts of it wrapped in `section()`.
+
+    Create it at the top of the script and put `finish()` in a caption at
+    the bottom; the session's last `keep` run times are kept for a median.
+    """
+
+    def __init__(self, session_state, keep=50):
+        self.started = time.perf_counter()
+        self.sections = {}
+        self.keep = keep
+        self.runs = session_state.setdefault("_rerun_times", [])
+
+    def section(self, name):
+        return _Section(self, name)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.started
+        observe("streamlit.script_run", elapsed)
+        for name, seconds in self.sections.items():
+            observe(f"streamlit.{name}", seconds)
+        self.runs.append(elapsed)
+        del self.runs[:-self.keep]
+        parts = "".join(f", {name} {seconds * 1000:.0f} ms" for name, seconds in self.sections.items())
+        return (f"Script run {elapsed * 1000:.0f} ms{parts} · median {statistics.median(self.runs) * 1000:.0f} ms "
+                f"over {len(self.runs)} reruns")
+
+
+class _Section:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.sections[self.name] = self.timer.sections.get(self.name, 0.0) + time.perf_counter() - self.started
@@ -0,0 +1,98 @@
+"""Process-wide API clients, built once and shared by every app and session."""
+import os
+
+import boto3
+import httpx
+import requests
+import streamlit as st
+from botocore.config import Config
+from openai import DefaultHttpxClient, OpenAI
+from requests.adapters import HTTPAdapter
+
+from askme.ratelimit import RateLimiter
+from askme.tracing import serve_metrics
+from askme.uploads import UploadQueue
+
+# Enough connections for a class of students streaming at once
+MAX_CONNECTIONS = 64
+# Idle connections are kept this long before being closed (seconds)
+KEEPALIVE_EXPIRY = 60.0
+# Connect quickly or fail; read is the longest gap allowed between stream chunks
+OPENAI_TIMEOUT = httpx.Timeout(connect=5.0, read=60.0, write=10.0, pool=10.0)
+S3_REGION = "ap-southeast-1"
+
+
+@st.cache_resource
+def openai_client(api_key=None):
+    """The shared OpenAI client. `api_key` defaults to $OPENAI_API_KEY."""
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=OPENAI_TIMEOUT,
+    )
+    return OpenAI(api_key=api_key or os.environ["OPENAI_API_KEY"], http_client=http_client, timeout=OPENAI_TIMEOUT)
+
+
+@st.cache_resource
+def openai_limiter():
+    """The shared OpenAI rate limiter that queues every session's chat completions.
+
+    $OPENAI_RPM and $OPENAI_TPM give starting limits until the first
+    response's rate-limit headers arrive.
+    """
+    return RateLimiter(
+        requests_per_minute=int(os.environ.get("OPENAI_RPM", 0)) or None,
+        tokens_per_minute=int(os.environ.get("OPENAI_TPM", 0)) or None,
+        max_concurrent=MAX_CONNECTIONS,
+    )
+
+
+@st.cache_resource
+def s3_client():
+    """The shared S3 client, talking straight to the askphysics bucket's region."""
+    return boto3.client(
+        "s3",
+        region_name=os.environ.get("AWS_DEFAULT_REGION", S3_REGION),
+        aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
+        aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"],
+        config=Config(
+            max_pool_connections=MAX_CONNECTIONS,
+            connect_timeout=5,
+            read_timeout=30,
+            tcp_keepalive=True,
+            retries={"max_attempts": 3, "mode": "adaptive"},
+        ),
+    )
+
+
+@st.cache_resource
+def upload_queue():
+    """The shared background queue for S3 uploads."""
+    return UploadQueue()
+
+
+@st.cache_resource
+def http_session():
+    """A shared requests session for plain HTTP APIs such as data.gov.sg."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONNECTIONS, max_retries=2)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@st.cache_resource
+def metrics_endpoint():
+    """Serve the stage timings on /metrics at $ASKME_METRICS_PORT, if set; returns the server or None."""
+    port = os.environ.get("ASKME_METRICS_PORT")
+    if not port:
+        return None
+    try:
+        return serve_metrics(int(port), host=os.environ.get("ASKME_METRICS_HOST", "127.0.0.1"))
+    except OSError as e:
+        # Another app on this host already serves the port; this one goes without /metrics
+        print(f"Not serving /metrics on port {port}: {e}")
+        return None
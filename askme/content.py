@@ -0,0 +1,91 @@
+import threading
+
+from askme.latex import map_text
+
+
+def _field(item, name, default=None):
+    # Content arrives as SDK objects from the API and as plain dicts from caches and recordings
+    if isinstance(item, dict):
+        return item.get(name, default)
+    return getattr(item, name, default)
+
+
+def _unescape(text):
+    # Some answers spell out newlines as a literal backslash-n; only fixed outside math, where \nu is \nu
+    return text.replace("\\n", "\n")
+
+
+class CitationResolver:
+    """Names of the files an assistant cites, looked up once per file id.
+
+    Shared by every session: the first message citing a file asks the API
+    for its name and later ones reuse it.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def filename(self, file_id):
+        with self._lock:
+            if file_id in self._names:
+                return self._names[file_id]
+        try:
+            name = self.client.files.retrieve(file_id).filename
+        except Exception as e:
+            # Show the id this time and try again for the next message
+            print(f"Could not look up cited file {file_id}: {e}")
+            return file_id
+        with self._lock:
+            self._names[file_id] = name
+        return name
+
+
+def _cite(value, annotations, citations, numbers, notes):
+    # Replace citation markers such as 【4:0†source】 with numbered references
+    out = []
+    position = 0
+    for annotation in sorted(annotations, key=lambda a: _field(a, "start_index") or 0):
+        start, end = _field(annotation, "start_index"), _field(annotation, "end_index")
+        reference = _field(annotation, _field(annotation, "type") or "")
+        file_id = _field(reference, "file_id")
+        # Skip overlapping or stale annotations rather than cut the text in the wrong place
+        if file_id is None or start is None or end is None or start < position or value[start:end] != _field(
+            annotation, "text"
+        ):
+            continue
+        if file_id not in numbers:
+            numbers[file_id] = len(numbers) + 1
+            name = citations.filename(file_id) if citations is not None else file_id
+            notes.append(f"[{numbers[file_id]}] {name}")
+        out.append(value[position:start])
+        out.append(f" [{numbers[file_id]}]")
+        position = end
+    out.append(value[position:])
+    return "".join(out)
+
+
+def normalise_content(blocks, citations=None):
+    """Markdown for an Assistants message's content blocks (text with its cited sources, and images)."""
+    if blocks is None:
+        return ""
+    if not isinstance(blocks, list):
+        blocks = [blocks]
+    parts, notes, numbers = [], [], {}
+    for block in blocks:
+        kind = _field(block, "type") or ("text" if _field(block, "text") is not None else None)
+        if kind == "text":
+            text = _field(block, "text")
+            value = _field(text, "value", "") or ""
+            annotations = _field(text, "annotations") or []
+            if annotations:
+                value = _cite(value, annotations, citations, numbers, notes)
+            parts.append(map_text(value, _unescape) if "\\n" in value else value)
+        elif kind == "image_file":
+            file_id = _field(_field(block, "image_file"), "file_id")
+            name = citations.filename(file_id) if citations is not None else file_id
+            parts.append(f"\n\n*[image: {name}]*\n\n")
+    if notes:
+        parts.append("\n\nSources:  \n" + "  \n".join(notes))
+    return "".join(parts)
@@ -0,0 +1,179 @@
+import collections
+import functools
+import hashlib
+import time
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Tokens the chat format adds around every message and to prime the reply,
+# as in OpenAI's "How to count tokens with tiktoken" cookbook
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+
+@functools.lru_cache(maxsize=8)
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads its vocabulary on first use; estimate if that fails
+        print(f"Could not load tokenizer for {model}: {e}")
+        return None
+
+
+@functools.lru_cache(maxsize=4096)
+def count_text(text, model="gpt-3.5-turbo"):
+    """Number of tokens in `text`; about 4 characters a token without tiktoken."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def count_messages(messages, model="gpt-3.5-turbo"):
+    """Prompt tokens the chat completions API will bill for `messages`."""
+    return TOKENS_PER_REPLY + sum(TOKENS_PER_MESSAGE + count_text(m["content"], model) for m in messages)
+
+
+class ContextWindow:
+    """Trims chat history to a prompt-token budget, keeping system messages and the latest message."""
+
+    def __init__(self, budget=3000, model="gpt-3.5-turbo", summarise=None, summary_tokens=200):
+        self.budget = budget
+        self.model = model
+        self.summarise = summarise
+        self.summary_tokens = summary_tokens
+        self._summaries = collections.OrderedDict()
+
+    def _summary(self, dropped):
+        # Summaries are keyed by the dropped messages, which always start at the oldest turn,
+        # so the longest one already made only needs the turns dropped since added to it
+        keys, digest = [], hashlib.sha1()
+        for m in dropped:
+            digest.update((m["role"] + "\x00" + m["content"] + "\x00").encode())
+            keys.append(digest.hexdigest())
+        start, previous = 0, None
+        for i in range(len(keys), 0, -1):
+            if keys[i - 1] in self._summaries:
+                start, previous = i, self._summaries[keys[i - 1]]
+                self._summaries.move_to_end(keys[i - 1])
+                break
+        if start < len(dropped):
+            previous = self._clip(self.summarise(dropped[start:], previous))
+            self._summaries[keys[-1]] = previous
+            if len(self._summaries) > 256:
+                self._summaries.popitem(last=False)
+        return previous
+
+    def _clip(self, text):
+        # A summariser that ignores its length limit mustn't push the prompt over budget
+        while count_text(text, self.model) > self.summary_tokens:
+            text = text[:len(text) * self.summary_tokens // count_text(text, self.model)]
+        return text
+
+    def _keep(self, messages, pinned, budget):
+        used = count_messages([messages[i] for i in pinned], self.model)
+        kept = set(pinned)
+        for i in range(len(messages) - 1, -1, -1):
+            if i in kept:
+                continue
+            cost = TOKENS_PER_MESSAGE + count_text(messages[i]["content"], self.model)
+            if used + cost > budget and len(kept) > len(pinned):
+                break
+            kept.add(i)
+            used += cost
+        return kept, used
+
+    def fit(self, messages):
+        """Return `(messages_to_send, stats)` for the given history."""
+        messages = [{"role": m["role"], "content": m["content"]} for m in messages]
+        pinned = [i for i, m in enumerate(messages) if m["role"] == "system"]
+        kept, used = self._keep(messages, pinned, self.budget)
+        if len(kept) < len(messages) and self.summarise is not None:
+            # Leave room for the summary
+            note_tokens = TOKENS_PER_MESSAGE + count_text(_SUMMARY_PREFIX, self.model) + self.summary_tokens
+            kept, used = self._keep(messages, pinned, self.budget - note_tokens)
+        dropped = [m for i, m in enumerate(messages) if i not in kept]
+
+        window = [m for i, m in enumerate(messages) if i in kept]
+        if dropped and self.summarise is not None:
+            note = {"role": "system", "content": _SUMMARY_PREFIX + self._summary(dropped)}
+            # Put the summary right after the leading system prompt
+            window.insert(1 if window and window[0]["role"] == "system" else 0, note)
+            used += TOKENS_PER_MESSAGE + count_text(note["content"], self.model)
+        return window, {"prompt_tokens": used, "dropped": len(dropped), "summarised": bool(dropped and self.summarise)}
+
+
+_SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+
+def openai_summariser(client, model="gpt-3.5-turbo", max_tokens=200):
+    """A `summarise` callable for ContextWindow that asks `model` for a recap of at most `max_tokens`."""
+
+    def summarise(dropped, previous=None):
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in dropped)
+        if previous:
+            transcript = f"Summary so far: {previous}\n\nThen:\n{transcript}"
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "Summarise this tutoring conversation in a few sentences, "
+                                              "keeping what the student has understood and still finds hard."},
+                {"role": "user", "content": transcript},
+            ],
+            max_tokens=max_tokens,
+        )
+        return response.choices[0].message.content
+
+    return summarise
+
+
+def delta_text(stream):
+    """Yield the text of each chunk of a streamed chat completion."""
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def timed_text(texts, usage, started):
+    """Pass on streamed text, timing it into `usage`.
+
+    `started` is the `time.perf_counter()` reading taken just before the
+    request. Sets `usage["ttft"]`, the seconds until the first text, and
+    `usage["generation_seconds"]`, the seconds from there to the last.
+    """
+    first = None
+    for text in texts:
+        now = time.perf_counter()
+        if first is None:
+            first = now
+            usage["ttft"] = now - started
+        usage["generation_seconds"] = now - first
+        yield text
+
+
+def describe_usage(usage):
+    """One-line token accounting for a turn, for `st.caption`."""
+    if usage.get("cached"):
+        return f"Answered from cache · {usage['prompt_tokens']} prompt + {usage['reply_tokens']} reply tokens saved"
+    text = f"{usage['prompt_tokens']} prompt + {usage['reply_tokens']} reply tokens"
+    if usage["dropped"]:
+        text += f" · {usage['dropped']} older messages {'summarised' if usage['summarised'] else 'left out'}"
+    if usage.get("model"):
+        text += f" · {usage['model']}"
+    if usage.get("shared"):
+        text += " · shared with an identical question"
+    if usage.get("queued", 0) >= 0.1:
+        text += f" · queued {usage['queued']:.1f}s"
+    if "ttft" in usage:
+        text += f" · first token {usage['ttft']:.2f}s"
+        if usage.get("generation_seconds"):
+            text += f" · {usage['reply_tokens'] / usage['generation_seconds']:.0f} tokens/s"
+    return text
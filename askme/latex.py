@@ -0,0 +1,71 @@
+import functools
+import re
+
+# One pass over a message finds every TeX delimiter the assistant uses.
+# Alternatives are tried left to right, so $$ wins over $ and an escaped
+# dollar is never taken as the start of math. Like Pandoc, inline $...$
+# must not start or end with a space or be followed by a digit, so
+# "$5 and $10" stays text.
+_TOKEN = re.compile(
+    r"(?P<escaped>\\\$)"
+    r"|\$\$(?P<display>.+?)\$\$"
+    r"|\\\[(?P<bracket>.+?)\\\]"
+    r"|\\\((?P<paren>.+?)\\\)"
+    r"|\$(?P<inline>[^\s$](?:[^$\n]*?[^\s$])?)\$(?!\d)",
+    re.S,
+)
+_KIND = {"escaped": "text", "display": "display", "bracket": "display", "paren": "inline", "inline": "inline"}
+
+
+@functools.lru_cache(maxsize=2048)
+def segments(text):
+    """Split `text` into `(kind, body)` pairs; kind is "text", "inline" or "display".
+
+    Handles `$...$`, `$$...$$`, `\\(...\\)`, `\\[...\\]` and escaped `\\$`.
+    Results are memoised by message content, so each message is parsed once
+    however many reruns draw it.
+    """
+    parts = []
+    position = 0
+    for match in _TOKEN.finditer(text):
+        if match.start() > position:
+            parts.append(("text", text[position:match.start()]))
+        group = match.lastgroup
+        body = "$" if group == "escaped" else match.group(group).strip()
+        if _KIND[group] == "text" and parts and parts[-1][0] == "text":
+            parts[-1] = ("text", parts[-1][1] + body)
+        else:
+            parts.append((_KIND[group], body))
+        position = match.end()
+    if position < len(text):
+        if parts and parts[-1][0] == "text":
+            parts[-1] = ("text", parts[-1][1] + text[position:])
+        else:
+            parts.append(("text", text[position:]))
+    return tuple(parts)
+
+
+@functools.lru_cache(maxsize=2048)
+def to_markdown(text):
+    """`text` as one Streamlit markdown string, with math in KaTeX's `$`/`$$` form."""
+    out = []
+    for kind, body in segments(text):
+        if kind == "text":
+            out.append(body.replace("$", "\\$"))
+        elif kind == "inline":
+            out.append(f"${body}$")
+        else:
+            out.append(f"\n$$\n{body}\n$$\n")
+    return "".join(out)
+
+
+def map_text(text, fn):
+    """Apply `fn` to the parts of `text` outside math, leaving math and escaped dollars as they are."""
+    out = []
+    position = 0
+    for match in _TOKEN.finditer(text):
+        out.append(fn(text[position:match.start()]))
+        out.append(match.group())
+        position = match.end()
+    out.append(fn(text[position:]))
+    return "".join(out)
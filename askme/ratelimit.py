@@ -0,0 +1,297 @@
+"""A process-wide gate in front of the OpenAI API, shared fairly between sessions."""
+import collections
+import random
+import re
+import threading
+import time
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value):
+    """Seconds in a rate-limit reset header such as "20ms", "1.5s" or "6m0s"."""
+    if not value:
+        return None
+    parts = _DURATION.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(number) * _UNITS[unit] for number, unit in parts)
+
+
+def retry_after(headers, attempt):
+    """Seconds to wait after a 429: the server's hint, else jittered exponential backoff."""
+    if headers is not None:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            try:
+                return float(headers["retry-after"])
+            except ValueError:
+                pass
+    return min(2 ** attempt, 30) * (0.5 + random.random() / 2)
+
+
+class TokenBucket:
+    """`capacity` units that refill continuously over `period` seconds."""
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, amount, now):
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self._refill(now)
+        # A request bigger than the whole bucket goes through once it is full
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+
+    def sync(self, limit, remaining, reset, now):
+        """Correct the bucket from a response's limit, remaining and reset headers.
+
+        The headers count requests the server has seen, not ones still on
+        their way, so the lower of the two levels is kept.
+        """
+        self._refill(now)
+        self.capacity = limit
+        if reset and remaining < limit:
+            self.rate = max(self.rate, (limit - remaining) / reset)
+        self.level = min(self.level, remaining)
+
+
+class _Ticket:
+    def __init__(self, session, tokens):
+        self.session = session
+        self.tokens = tokens
+        self.queued = time.monotonic()
+
+
+class RateLimiter:
+    """Shares the OpenAI request and token budgets between all sessions.
+
+    Wrap each request in `with limiter.slot(session, tokens, on_wait=show) as slot:`; `on_wait` is told
+    its place in the queue and the expected wait whenever they change.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_concurrent=64, max_retries=5,
+                 poll=0.5):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.poll = poll
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.granted = 0
+        self.throttled = 0
+        self.waited = 0.0
+        self._queues = collections.OrderedDict()
+        self._cond = threading.Condition()
+
+    def slot(self, session, tokens=0, on_wait=None):
+        return _Slot(self, session, tokens, on_wait)
+
+    def _order(self):
+        # Round-robin: every session's first waiting request, then every second one, ...
+        queues = list(self._queues.values())
+        return [q[i] for i in range(max((len(q) for q in queues), default=0)) for q in queues if i < len(q)]
+
+    def position(self, ticket):
+        with self._cond:
+            return self._order().index(ticket) + 1
+
+    def depth(self):
+        """Number of requests waiting for a slot."""
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+    def _delay(self, ticket, now):
+        # Seconds before `ticket` may go, or None if another request is ahead of it
+        queue = next(iter(self._queues.values()))
+        if queue[0] is not ticket:
+            return None
+        delays = [self.paused_until - now]
+        if self.requests is not None:
+            delays.append(self.requests.wait(1, now))
+        if self.tokens is not None:
+            delays.append(self.tokens.wait(ticket.tokens, now))
+        return max(delays)
+
+    def _enqueue(self, ticket, front=False):
+        queue = self._queues.setdefault(ticket.session, collections.deque())
+        if front:
+            queue.appendleft(ticket)
+            self._queues.move_to_end(ticket.session, last=False)
+        else:
+            queue.append(ticket)
+
+    def _dequeue(self, ticket):
+        queue = self._queues.get(ticket.session)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if queue:
+                # This session has more waiting; the other sessions go first
+                self._queues.move_to_end(ticket.session)
+            else:
+                del self._queues[ticket.session]
+        self._cond.notify_all()
+
+    def acquire(self, ticket, on_wait=None, front=False):
+        with self._cond:
+            self._enqueue(ticket, front)
+        shown = None
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    delay = self._delay(ticket, now) if self.in_flight < self.max_concurrent else None
+                    if delay is not None and delay <= 0:
+                        self._dequeue(ticket)
+                        self.in_flight += 1
+                        self.granted += 1
+                        self.waited += now - ticket.queued
+                        if self.requests is not None:
+                            self.requests.take(1, now)
+                        if self.tokens is not None:
+                            self.tokens.take(ticket.tokens, now)
+                        return now - ticket.queued
+                    position = self._order().index(ticket) + 1
+                    if on_wait is None or position == shown:
+                        self._cond.wait(min(delay or self.poll, self.poll))
+                        continue
+                shown = position
+                # Outside the lock: on_wait may draw to the page, or be interrupted by a rerun
+                on_wait(position, delay)
+        except BaseException:
+            with self._cond:
+                self._dequeue(ticket)
+            raise
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def update(self, headers):
+        """Resize the buckets from a response's `x-ratelimit-*` headers."""
+        now = time.monotonic()
+        with self._cond:
+            for name in ("requests", "tokens"):
+                limit = headers.get(f"x-ratelimit-limit-{name}")
+                remaining = headers.get(f"x-ratelimit-remaining-{name}")
+                if limit is None or remaining is None:
+                    continue
+                bucket = getattr(self, name)
+                if bucket is None:
+                    bucket = TokenBucket(int(limit))
+                    setattr(self, name, bucket)
+                bucket.sync(int(limit), int(remaining), parse_duration(headers.get(f"x-ratelimit-reset-{name}")), now)
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """Hold every queued request for `seconds`, after a 429."""
+        with self._cond:
+            self.throttled += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": sum(len(q) for q in self._queues.values()),
+                "in_flight": self.in_flight,
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "mean_wait": self.waited / self.granted if self.granted else 0.0,
+                "requests_left": int(self.requests.level) if self.requests is not None else None,
+                "tokens_left": int(self.tokens.level) if self.tokens is not None else None,
+            }
+
+
+def _rate_limited(error):
+    # 429s for exhausted quota won't clear by waiting, so only retry the rate-limit kind
+    return getattr(error, "status_code", None) == 429 and getattr(error, "code", None) != "insufficient_quota"
+
+
+class _Slot:
+    def __init__(self, limiter, session, tokens, on_wait):
+        self.limiter = limiter
+        self.ticket = _Ticket(session, tokens)
+        self.on_wait = on_wait
+        self.held = False
+        self.waited = 0.0
+
+    def open(self):
+        """Wait for a turn; `close()` gives it back. The `with` block does both."""
+        self.waited += self.limiter.acquire(self.ticket, self.on_wait)
+        self.held = True
+        return self
+
+    def close(self):
+        if self.held:
+            self.held = False
+            self.limiter.release()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def call(self, request, quiet=False):
+        """Run `request()`, a `with_raw_response` API call, and return its parsed result, retrying 429s."""
+        for attempt in range(self.limiter.max_retries + 1):
+            try:
+                raw = request()
+            except Exception as e:
+                if not _rate_limited(e) or attempt == self.limiter.max_retries:
+                    raise
+                response = getattr(e, "response", None)
+                headers = response.headers if response is not None else None
+                if headers is not None:
+                    self.limiter.update(headers)
+                self.limiter.pause(retry_after(headers, attempt))
+                self.held = False
+                self.limiter.release()
+                self.ticket.queued = time.monotonic()
+                self.waited += self.limiter.acquire(self.ticket, None if quiet else self.on_wait, front=True)
+                self.held = True
+                continue
+            self.limiter.update(raw.headers)
+            return raw.parse()
+
+    def stream(self, request):
+        """Open the slot and return `call(request)`'s stream, which gives the slot back when closed."""
+        self.open()
+        try:
+            return _Held(self.call(request, quiet=True), self)
+        except BaseException:
+            self.close()
+            raise
+
+
+class _Held:
+    def __init__(self, stream, slot):
+        self.stream = stream
+        self.slot = slot
+
+    def __iter__(self):
+        return iter(self.stream)
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.slot.close()
@@ -0,0 +1,280 @@
+"""Deadlines, hedging, retries and a circuit breaker for streamed completions."""
+import queue
+import threading
+import time
+
+import openai
+
+_END = object()
+
+
+class StreamTimeout(Exception):
+    """Raised when a streamed completion misses its first-token or stall deadline."""
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit breaker is open."""
+
+    def __init__(self, message, retry_in=0.0):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+
+def _counted(error):
+    # Failures that say the API is unreachable or unwell; a 400 or a 429 means it answered
+    return isinstance(error, (StreamTimeout, openai.APIConnectionError, openai.InternalServerError))
+
+
+class CircuitBreaker:
+    """Stops sending requests after `failures` consecutive failures, for `reset_after` seconds."""
+
+    def __init__(self, failures=5, reset_after=30.0):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.consecutive = 0
+        self.trips = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if self.trial or time.monotonic() >= self.opened_at + self.reset_after else "open"
+
+    def allow(self):
+        """Raise CircuitOpenError unless a request may be sent now; True if it is the half-open trial."""
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.opened_at + self.reset_after - time.monotonic()
+            if remaining > 0 or self.trial:
+                raise CircuitOpenError("OpenAI is failing; not sending more requests for now", max(remaining, 0.0))
+            # Half-open: this request decides whether to close the circuit again
+            self.trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.consecutive = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.trial or (self.opened_at is None and self.consecutive >= self.failures):
+                self.trips += 1
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+    def abandon(self):
+        # The request was stopped by us (a rerun, or a hedge won), so it says nothing about the API
+        with self._lock:
+            self.trial = False
+
+
+class _Attempt:
+    def __init__(self, hedge):
+        self.hedge = hedge
+        self.stream = None
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            stream, self.stream = self.stream, None
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+
+class RequestPolicy:
+    """First-token and stall deadlines, retries and hedging for streamed requests; failures count against `breaker`."""
+
+    def __init__(self, first_token=20.0, stall=20.0, hedge_after=None, retries=1, breaker=None):
+        self.first_token = first_token
+        self.stall = stall
+        self.hedge_after = hedge_after
+        self.retries = retries
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.counts = {"sent": 0, "retried": 0, "hedged": 0, "hedges_won": 0, "timed_out": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def settle(self, error=None):
+        """Tell the breaker how a request ended (None: it answered)."""
+        if error is None or (isinstance(error, Exception) and not _counted(error)):
+            self.breaker.success()
+        elif isinstance(error, Exception):
+            self.breaker.failure()
+        else:
+            self.breaker.abandon()
+
+    def stream(self, open_stream, hedge=None):
+        """Send the request and return an iterator over the chunks of whichever copy wins; close it to hang up."""
+        # Even the first copy is opened on the race's thread, so a stall before the headers
+        # counts against the first-token deadline and can be hedged
+        trial = self.breaker.allow()
+        self._count("sent")
+        return _Race(self, open_stream, hedge, self.retries, trial)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, breaker=self.breaker.state, trips=self.breaker.trips)
+
+
+class _Race:
+    # Iterates the chunks of the first attempt to produce one, enforcing the policy's deadlines
+    def __init__(self, policy, open_stream, hedge, retries, trial):
+        self.policy = policy
+        self.open_stream = open_stream
+        self.hedge = hedge
+        self.retries = retries
+        self.trial = trial
+        self.settled = False
+        self.events = queue.Queue()
+        self.attempts = []
+        self.winner = None
+        self.done = False
+        self._launch(False)
+
+    def _launch(self, hedge):
+        attempt = _Attempt(hedge)
+        self.attempts.append(attempt)
+        threading.Thread(target=self._read, args=(attempt,), name="request-policy-stream", daemon=True).start()
+        now = time.monotonic()
+        if not hedge:
+            self.deadline = now + self.policy.first_token
+            after = self.policy.hedge_after
+            self.hedge_at = now + after if after is not None and self.hedge is not None else None
+
+    def _read(self, attempt):
+        try:
+            stream = (self.hedge if attempt.hedge else self.open_stream)()
+            if stream is None:
+                attempt.closed = True
+                return
+            with attempt.lock:
+                closed = attempt.closed
+                if not closed:
+                    attempt.stream = stream
+            if closed:
+                stream.close()
+                return
+            for chunk in stream:
+                if attempt.closed:
+                    return
+                self.events.put((attempt, chunk))
+            self.events.put((attempt, _END))
+        except Exception as e:
+            if not attempt.closed:
+                self.events.put((attempt, e))
+
+    def _live(self):
+        return [a for a in self.attempts if not a.closed]
+
+    def _settle(self, error=None):
+        self.settled = True
+        self.policy.settle(error)
+
+    def _retry(self, error):
+        # Replace the failed attempts with a new request, or give up with `error`
+        if not self.retries:
+            raise error
+        self.retries -= 1
+        self.trial = self.policy.breaker.allow()
+        self.settled = False
+        self.policy._count("retried")
+        self.policy._count("sent")
+        self._launch(False)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.done:
+            raise StopIteration
+        try:
+            return self._next()
+        except BaseException:
+            self.close()
+            raise
+
+    def _next(self):
+        policy = self.policy
+        if self.winner is not None:
+            # Time spent by the reader between chunks isn't the upstream stalling
+            self.deadline = time.monotonic() + policy.stall
+        while True:
+            wake = self.deadline if self.hedge_at is None else min(self.deadline, self.hedge_at)
+            try:
+                attempt, item = self.events.get(timeout=max(wake - time.monotonic(), 0))
+            except queue.Empty:
+                now = time.monotonic()
+                if self.hedge_at is not None and now >= self.hedge_at:
+                    self.hedge_at = None
+                    if self.winner is None and policy.breaker.state == "closed":
+                        policy._count("hedged")
+                        policy._count("sent")
+                        self._launch(True)
+                    continue
+                if now < self.deadline:
+                    continue
+                policy._count("timed_out")
+                if self.winner is not None:
+                    error = StreamTimeout(f"No data from OpenAI for {policy.stall:g}s; the answer stopped")
+                    self._settle(error)
+                    raise error
+                error = StreamTimeout(f"No answer from OpenAI within {policy.first_token:g}s")
+                # One failure for the breaker however many copies were sent
+                self._settle(error)
+                for stalled in self._live():
+                    stalled.close()
+                self._retry(error)
+                continue
+
+            if attempt.closed:
+                continue
+            if item is _END:
+                if self.winner is None or attempt is self.winner:
+                    self._settle()
+                    self.close()
+                    raise StopIteration
+                continue
+            if isinstance(item, Exception):
+                attempt.close()
+                if attempt is not self.winner and self._live():
+                    # The other copy may still answer
+                    continue
+                self._settle(item)
+                if attempt is self.winner or not _counted(item):
+                    raise item
+                self._retry(item)
+                continue
+            if self.winner is None:
+                self.winner = attempt
+                if attempt.hedge:
+                    policy._count("hedges_won")
+                self.hedge_at = None
+                for other in self.attempts:
+                    if other is not attempt:
+                        other.close()
+            return item
+
+    def close(self):
+        if not self.done:
+            self.done = True
+            for attempt in self.attempts:
+                attempt.close()
+            if self.trial and not self.settled:
+                # Hung up before the half-open trial finished; let the next request try
+                self.policy.breaker.abandon()
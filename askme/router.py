@@ -0,0 +1,134 @@
+"""Pick the chat model for each turn from cheap local features of the question."""
+import json
+import re
+import threading
+import time
+
+from askme.context import count_text
+from askme.tracing import observe
+
+# USD per million prompt and reply tokens; [router.prices] in tutors.toml adds to these
+PRICES = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4-turbo": (10.0, 30.0),
+}
+
+_MATHS = re.compile(
+    r"\$|\\(?:frac|sqrt|int|sum|vec|Delta|theta|lambda|omega|times)"
+    r"|\d\s*[-+*/^=]\s*\d|[=²³√∫∑±×÷]|\b(?:sin|cos|tan|log|ln)\b|\d\s*(?:m/s|m|s|kg|g|N|J|W|Hz|V|A|Ω|K|°C)\b"
+)
+_WORKING = re.compile(
+    r"\b(?:derive|derivation|prove|show that|calculate|compute|solve|determine|work out|find the"
+    r"|step[- ]by[- ]step|how (?:much|many|long|far|fast|high))\b",
+    re.IGNORECASE,
+)
+_PICTURE = re.compile(r"\b(?:image|picture|photo|diagram|graph)\b", re.IGNORECASE)
+
+
+def turn_features(prompt, history_turns=0, picture=False, queue_depth=0):
+    """What `ModelRouter.choose` looks at, for the student's `prompt`.
+
+    `history_turns` is the number of earlier questions in the chat,
+    `picture` whether the tutor was given an image's description for this
+    turn, and `queue_depth` the requests waiting at the OpenAI rate limiter.
+    """
+    return {
+        "tokens": count_text(prompt),
+        "maths": bool(_MATHS.search(prompt)),
+        "working": bool(_WORKING.search(prompt)),
+        "picture": picture or bool(_PICTURE.search(prompt)),
+        "follow_up": history_turns > 0,
+        "queue_depth": queue_depth,
+    }
+
+
+class Route:
+    """The route a turn took: its name, model and why."""
+
+    def __init__(self, name, model, reason):
+        self.name = name
+        self.model = model
+        self.reason = reason
+
+
+class _Totals:
+    def __init__(self):
+        self.turns = 0
+        self.seconds = 0.0
+        self.first_token = 0.0
+        self.prompt_tokens = 0
+        self.reply_tokens = 0
+        self.cost = 0.0
+        self.models = set()
+
+
+class ModelRouter:
+    """Routes a turn to the tutor's model, or to `strong_model` for derivations, long questions and pictures."""
+
+    def __init__(self, strong_model=None, long_prompt_tokens=120, busy_queue=16, prices=None, log_path=None):
+        self.strong_model = strong_model
+        self.long_prompt_tokens = long_prompt_tokens
+        self.busy_queue = busy_queue
+        self.prices = dict(PRICES)
+        self.prices.update({model: tuple(price) for model, price in (prices or {}).items()})
+        self.log_path = log_path
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def choose(self, model, features, strong_model=None):
+        """The Route for a turn with `features` of a tutor whose own model is `model`."""
+        strong = strong_model or self.strong_model
+        if not strong or strong == model:
+            return Route("fast", model, "one model")
+        if features["queue_depth"] >= self.busy_queue:
+            return Route("fast", model, "queue busy")
+        if features["working"] and (features["maths"] or not features["follow_up"]):
+            return Route("strong", strong, "derivation")
+        if features["tokens"] >= self.long_prompt_tokens:
+            return Route("strong", strong, "long question")
+        if features["picture"] and not features["follow_up"]:
+            return Route("strong", strong, "picture")
+        return Route("fast", model, "follow-up" if features["follow_up"] else "short question")
+
+    def cost(self, model, prompt_tokens, reply_tokens):
+        """USD for a call to `model`, or 0 for a model without a known price."""
+        prompt_price, reply_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + reply_tokens * reply_price) / 1e6
+
+    def record(self, route, usage, features=None, persona=None):
+        """Add a finished turn's latency, tokens and cost (from its `usage`) to `route`'s totals."""
+        first_token = usage.get("ttft", 0.0)
+        seconds = first_token + usage.get("generation_seconds", 0.0)
+        cost = self.cost(route.model, usage.get("prompt_tokens", 0), usage.get("reply_tokens", 0))
+        observe(f"route.{route.name}.first_token", first_token)
+        observe(f"route.{route.name}.answer", seconds)
+        with self._lock:
+            totals = self._totals.setdefault(route.name, _Totals())
+            totals.turns += 1
+            totals.seconds += seconds
+            totals.first_token += first_token
+            totals.prompt_tokens += usage.get("prompt_tokens", 0)
+            totals.reply_tokens += usage.get("reply_tokens", 0)
+            totals.cost += cost
+            totals.models.add(route.model)
+            if self.log_path:
+                record = {"time": round(time.time(), 3), "persona": persona, "route": route.name,
+                          "model": route.model, "reason": route.reason, "features": features,
+                          "first_token": round(first_token, 3), "seconds": round(seconds, 3),
+                          "prompt_tokens": usage.get("prompt_tokens", 0),
+                          "reply_tokens": usage.get("reply_tokens", 0), "cost": round(cost, 6)}
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+        return cost
+
+    def stats(self):
+        """`{route: {"turns", "models", "mean_seconds", "mean_first_token", "tokens", "cost"}}`."""
+        with self._lock:
+            return {
+                name: {"turns": t.turns, "models": sorted(t.models), "mean_seconds": t.seconds / t.turns,
+                       "mean_first_token": t.first_token / t.turns, "tokens": t.prompt_tokens + t.reply_tokens,
+                       "cost": t.cost}
+                for name, t in sorted(self._totals.items())
+            }
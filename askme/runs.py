@@ -0,0 +1,123 @@
+import random
+import time
+
+from askme.tracing import traced
+
+# Run states that mean the assistant is still working on our request
+ACTIVE_STATES = ("queued", "in_progress", "cancelling")
+
+
+class RunError(Exception):
+    """Raised when an Assistants run ends in a state other than completed."""
+
+    def __init__(self, message, run=None):
+        super().__init__(message)
+        self.run = run
+
+
+def _describe(run):
+    error = getattr(run, "last_error", None)
+    if error is not None and getattr(error, "message", None):
+        return f"Run {run.id} {run.status}: {error.message}"
+    return f"Run {run.id} {run.status}"
+
+
+def _check(run):
+    if run.status in ("failed", "cancelled", "expired"):
+        raise RunError(_describe(run), run)
+    return run
+
+
+def _tool_outputs(client, thread_id, run, tool_handler):
+    # Our assistants don't register tools, so a run asking for them is stuck
+    # until it expires. Cancel it instead of waiting out the 10 minutes.
+    if tool_handler is None:
+        client.beta.threads.runs.cancel(run_id=run.id, thread_id=thread_id)
+        raise RunError(f"Run {run.id} requires action but no tool handler was given", run)
+    calls = run.required_action.submit_tool_outputs.tool_calls
+    return [{"tool_call_id": call.id, "output": tool_handler(call)} for call in calls]
+
+
+def backoff_delays(initial=0.2, maximum=2.0, multiplier=1.6):
+    """Yield full-jitter exponential backoff delays, capped at `maximum`."""
+    delay = initial
+    while True:
+        yield random.uniform(initial / 2, delay)
+        delay = min(delay * multiplier, maximum)
+
+
+@traced("assistant.poll")
+def poll_run(client, thread_id, run, timeout=120.0, tool_handler=None, initial=0.2, maximum=2.0):
+    """Poll `run` with jittered backoff until it finishes or `timeout` seconds pass."""
+    deadline = time.monotonic() + timeout
+    delays = backoff_delays(initial, maximum)
+    while True:
+        if run.status == "requires_action":
+            outputs = _tool_outputs(client, thread_id, run, tool_handler)
+            run = client.beta.threads.runs.submit_tool_outputs(
+                run_id=run.id, thread_id=thread_id, tool_outputs=outputs
+            )
+            delays = backoff_delays(initial, maximum)
+            continue
+        if run.status not in ACTIVE_STATES:
+            return _check(run)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            client.beta.threads.runs.cancel(run_id=run.id, thread_id=thread_id)
+            raise RunError(f"Run {run.id} timed out after {timeout}s", run)
+        time.sleep(min(next(delays), remaining))
+        run = client.beta.threads.runs.retrieve(run_id=run.id, thread_id=thread_id)
+
+
+def _consume(client, thread_id, stream, deadline, on_delta, tool_handler):
+    # Returns the last run object seen on the stream, submitting tool outputs
+    # (which continues the run on a new stream) whenever the run asks for them.
+    run = None
+    while stream is not None:
+        next_stream = None
+        with stream:
+            for event in stream:
+                if event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step"):
+                    run = event.data
+                if event.event == "thread.message.delta" and on_delta is not None:
+                    for block in event.data.delta.content or []:
+                        if block.type == "text" and block.text and block.text.value:
+                            on_delta(block.text.value)
+                elif event.event == "thread.run.requires_action":
+                    outputs = _tool_outputs(client, thread_id, run, tool_handler)
+                    next_stream = client.beta.threads.runs.submit_tool_outputs(
+                        run_id=run.id, thread_id=thread_id, tool_outputs=outputs, stream=True
+                    )
+                    break
+                if time.monotonic() > deadline:
+                    if run is not None:
+                        client.beta.threads.runs.cancel(run_id=run.id, thread_id=thread_id)
+                    raise RunError(f"Run {getattr(run, 'id', '?')} timed out while streaming", run)
+        stream = next_stream
+    return run
+
+
+@traced("assistant.run")
+def run_assistant(client, thread_id, assistant_id, on_delta=None, timeout=120.0, tool_handler=None, stream=True):
+    """Start a run on `thread_id` and drive it to completion, passing streamed text to `on_delta`; raises RunError."""
+    deadline = time.monotonic() + timeout
+    if stream:
+        try:
+            events = client.beta.threads.runs.create(
+                thread_id=thread_id, assistant_id=assistant_id, stream=True
+            )
+        except TypeError:
+            # SDKs older than the streaming Assistants API don't know `stream`
+            events = None
+        if events is not None:
+            run = _consume(client, thread_id, events, deadline, on_delta, tool_handler)
+            if run is not None and run.status not in ACTIVE_STATES:
+                return _check(run)
+            if run is None:
+                raise RunError("Run stream ended before the run was created")
+            # The stream dropped early; finish the run by polling
+            return poll_run(client, thread_id, run, max(deadline - time.monotonic(), 0), tool_handler)
+
+    run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+    return poll_run(client, thread_id, run, timeout, tool_handler)
@@ -0,0 +1,174 @@
+"""Coalesce identical requests that are in flight at the same time."""
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Stream:
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.readers = 0
+        self.cancelled = False
+        self.source = None
+        self.cond = threading.Condition()
+
+
+class _Reader:
+    # One caller's iterator over a shared stream; closing it leaves the flight even before the first item
+    def __init__(self, flights, key, flight):
+        self.flights = flights
+        self.key = key
+        self.flight = flight
+        self.items = None
+        self.left = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.items)
+
+    def close(self):
+        self.items.close()
+        self.flights._leave(self)
+
+
+class SingleFlight:
+    """One upstream request per key at a time, shared by every caller that asks meanwhile."""
+
+    def __init__(self):
+        self.upstream = 0
+        self.joined = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def call(self, key, fn):
+        """Return `(fn(), shared)`, where `shared` says another caller's result was reused."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Call()
+                self.upstream += 1
+            else:
+                self.joined += 1
+        if leader:
+            try:
+                flight.result = fn()
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+            return flight.result, False
+        flight.done.wait()
+        if flight.error is not None:
+            if not isinstance(flight.error, Exception):
+                # The first caller was stopped (its page rerun), not failed; ask again ourselves
+                return self.call(key, fn)
+            raise flight.error
+        return flight.result, True
+
+    def stream(self, key, start):
+        """Return `(items, shared)`: an iterator over the shared stream for `key`.
+
+        Unless an identical stream is in flight, `start()` is called here
+        and must return the iterator to share (open the upstream request
+        inside `start`, so callers wait in its queue, not in the reader).
+        The upstream is closed once every caller has stopped reading.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None or flight.cancelled
+            if leader:
+                flight = self._flights[key] = _Stream()
+                self.upstream += 1
+            else:
+                self.joined += 1
+            flight.readers += 1
+        if leader:
+            try:
+                flight.source = start()
+            except BaseException as e:
+                self._finish(key, flight, e)
+                raise
+            threading.Thread(target=self._pump, args=(key, flight), name="single-flight-stream", daemon=True).start()
+        reader = _Reader(self, key, flight)
+        reader.items = self._read(reader, start, leader)
+        return reader, not leader
+
+    def _finish(self, key, flight, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        with flight.cond:
+            flight.error = error
+            flight.done = True
+            flight.cond.notify_all()
+
+    def _pump(self, key, flight):
+        error = None
+        try:
+            for item in flight.source:
+                with flight.cond:
+                    if flight.cancelled:
+                        break
+                    flight.items.append(item)
+                    flight.cond.notify_all()
+        except BaseException as e:
+            error = e
+        finally:
+            close = getattr(flight.source, "close", None)
+            if close is not None:
+                close()
+            self._finish(key, flight, error)
+
+    def _leave(self, reader):
+        flight = reader.flight
+        with self._lock:
+            if reader.left:
+                return
+            reader.left = True
+            flight.readers -= 1
+            if flight.readers == 0 and not flight.done:
+                # Nobody is reading any more; hang up on the upstream
+                flight.cancelled = True
+                if self._flights.get(reader.key) is flight:
+                    del self._flights[reader.key]
+
+    def _read(self, reader, start, leader):
+        flight = reader.flight
+        position = 0
+        try:
+            while True:
+                with flight.cond:
+                    while position >= len(flight.items) and not flight.done:
+                        flight.cond.wait()
+                    if position < len(flight.items):
+                        item = flight.items[position]
+                        position += 1
+                    elif flight.error is None:
+                        return
+                    elif not leader and position == 0 and not isinstance(flight.error, Exception):
+                        break
+                    else:
+                        raise flight.error
+                yield item
+        finally:
+            self._leave(reader)
+        # The first caller was stopped before anything arrived; start it again
+        items, _ = self.stream(reader.key, start)
+        yield from items
+
+    def stats(self):
+        with self._lock:
+            return {"upstream": self.upstream, "joined": self.joined, "in_flight": len(self._flights)}
@@ -0,0 +1,158 @@
+import atexit
+import collections
+import threading
+import time
+import uuid
+
+import streamlit as st
+
+from askme.clients import openai_client
+
+# Empty threads kept ready for a class opening the page at once
+SPARE_THREADS = 10
+
+
+class Lease:
+    """One session's Assistants thread. Hold `lock` while a run is active on it."""
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+
+class ThreadPool:
+    """Hands out one Assistants thread per browser session; threads of idle sessions are deleted."""
+
+    def __init__(self, client, idle_ttl=1800.0, reap_interval=60.0, spares=0, refill_workers=4):
+        self.client = client
+        self.idle_ttl = idle_ttl
+        self.reap_interval = reap_interval
+        self.spares = spares
+        self.hits = 0
+        self.misses = 0
+        self._leases = {}
+        self._ready = collections.deque()
+        self._lock = threading.Lock()
+        self._wanted = threading.Condition(self._lock)
+        self._creating = 0
+        self._closed = False
+        self._last_reap = time.monotonic()
+        for i in range(min(spares, refill_workers)):
+            threading.Thread(target=self._refill, name=f"thread-pool-refill-{i}", daemon=True).start()
+        if spares:
+            atexit.register(self.close)
+
+    def _create(self):
+        return self.client.beta.threads.create().id
+
+    def _refill(self):
+        while True:
+            with self._wanted:
+                while len(self._ready) + self._creating >= self.spares and not self._closed:
+                    self._wanted.wait()
+                if self._closed:
+                    return
+                self._creating += 1
+            try:
+                thread_id = self._create()
+            except Exception as e:
+                print(f"Could not pre-create thread: {e}")
+                thread_id = None
+            with self._lock:
+                self._creating -= 1
+                if thread_id is not None:
+                    self._ready.append(thread_id)
+            if thread_id is None:
+                time.sleep(5)
+
+    def _take(self):
+        # Prefer a pre-warmed thread; fall back to creating one inline
+        with self._wanted:
+            thread_id = self._ready.popleft() if self._ready else None
+            if thread_id is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._wanted.notify()
+        return thread_id or self._create()
+
+    def _delete(self, thread_ids):
+        for thread_id in thread_ids:
+            try:
+                self.client.beta.threads.delete(thread_id)
+            except Exception as e:
+                # The thread expires on OpenAI's side anyway
+                print(f"Could not delete thread {thread_id}: {e}")
+
+    def lease(self, key):
+        """Return the Lease for session `key`, creating its thread on first use."""
+        if time.monotonic() - self._last_reap > self.reap_interval:
+            self.reap()
+        with self._lock:
+            lease = self._leases.get(key)
+        if lease is None:
+            # Create outside the pool lock so sessions don't queue behind each other
+            created = Lease(self._take())
+            with self._lock:
+                lease = self._leases.setdefault(key, created)
+                if lease is not created:
+                    # Lost a race with another rerun of the same session
+                    self._ready.append(created.thread_id)
+        lease.last_used = time.monotonic()
+        return lease
+
+    def release(self, key):
+        """Forget session `key` and delete its thread, e.g. when the chat is cleared."""
+        with self._lock:
+            lease = self._leases.pop(key, None)
+        if lease is not None:
+            self._delete([lease.thread_id])
+
+    def reap(self):
+        """Delete the threads of sessions idle for longer than `idle_ttl`."""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            self._last_reap = now
+            for key, lease in list(self._leases.items()):
+                if now - lease.last_used > self.idle_ttl and not lease.lock.locked():
+                    expired.append(self._leases.pop(key).thread_id)
+        self._delete(expired)
+        return len(expired)
+
+    def stats(self):
+        """Return lease counts and the share of leases served from a spare thread."""
+        with self._lock:
+            taken = self.hits + self.misses
+            return {
+                "sessions": len(self._leases),
+                "spares_ready": len(self._ready),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / taken if taken else 0.0,
+            }
+
+    def close(self):
+        """Stop refilling and delete the spare threads nobody leased."""
+        with self._wanted:
+            self._closed = True
+            ready, self._ready = list(self._ready), collections.deque()
+            self._wanted.notify_all()
+        self._delete(ready)
+
+    def __len__(self):
+        return len(self._leases)
+
+
+def session_key(session_state):
+    """Return a stable id for the current Streamlit session."""
+    if "thread_key" not in session_state:
+        session_state.thread_key = uuid.uuid4().hex
+    return session_state.thread_key
+
+
+# Each browser session leases its own Assistants thread from this pool
+@st.cache_resource
+def load_thread_pool(api_key=None):
+    return ThreadPool(openai_client(api_key), spares=SPARE_THREADS)
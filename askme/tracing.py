@@ -0,0 +1,226 @@
+"""Where a turn's time goes: timing spans around the hot paths, kept as histograms."""
+import atexit
+import bisect
+import functools
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the histogram buckets, from a cache hit to a slow run
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Durations of one stage, counted into `BUCKETS`."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def add(self, seconds, error=False):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the `q` quantile (inf past the last bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Tracer:
+    """Histograms per stage, shared by every thread; `sample` is the fraction of spans timed."""
+
+    def __init__(self, sample=1.0, path=None):
+        self.sample = sample
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._file = None
+        self.path = None
+        if path:
+            self.open(path)
+
+    def open(self, path):
+        """Append every sampled span to `path` as a JSON line from now on."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self.path = path
+            self._file = open(path, "a", encoding="utf-8")
+        atexit.register(self.close)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def sampled(self):
+        return self.sample >= 1 or random.random() < self.sample
+
+    def span(self, stage):
+        return _Span(self, stage)
+
+    def traced(self, stage=None):
+        """Decorator timing every call of the function as a span of `stage` (default: its qualified name)."""
+        def decorate(function):
+            name = stage or f"{function.__module__}.{function.__qualname__}"
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with _Span(self, name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def observe(self, stage, seconds, error=False):
+        """Record `seconds` for `stage`, subject to sampling like a span."""
+        if self.sampled():
+            self._record(stage, seconds, error)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, stage, seconds, error=False, started=None, parent=None):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.add(seconds, error)
+            if self._file is not None:
+                record = {"stage": stage, "seconds": round(seconds, 6),
+                          "time": round(started if started is not None else time.time() - seconds, 3),
+                          "thread": threading.current_thread().name}
+                if parent is not None:
+                    record["parent"] = parent
+                if error:
+                    record["error"] = True
+                self._file.write(json.dumps(record) + "\n")
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+
+    def stats(self):
+        """`{stage: {"count", "errors", "mean", "p50", "p95"}}` from the histograms (bucket bounds)."""
+        with self._lock:
+            return {
+                stage: {"count": h.count, "errors": h.errors, "mean": h.sum / h.count if h.count else 0.0,
+                        "p50": h.quantile(0.5), "p95": h.quantile(0.95)}
+                for stage, h in sorted(self.histograms.items())
+            }
+
+    def metrics_text(self):
+        """The histograms in the Prometheus text exposition format."""
+        lines = [
+            "# HELP askme_stage_seconds Time spent in each traced stage.",
+            "# TYPE askme_stage_seconds histogram",
+        ]
+        errors = []
+        with self._lock:
+            for stage, h in sorted(self.histograms.items()):
+                label = stage.replace("\\", "\\\\").replace('"', '\\"')
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    lines.append(f'askme_stage_seconds_bucket{{stage="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'askme_stage_seconds_bucket{{stage="{label}",le="+Inf"}} {h.count}')
+                lines.append(f'askme_stage_seconds_sum{{stage="{label}"}} {h.sum:.6f}')
+                lines.append(f'askme_stage_seconds_count{{stage="{label}"}} {h.count}')
+                errors.append(f'askme_stage_errors_total{{stage="{label}"}} {h.errors}')
+        lines += ["# HELP askme_stage_errors_total Traced spans that ended in an exception.",
+                  "# TYPE askme_stage_errors_total counter"] + errors
+        return "\n".join(lines) + "\n"
+
+
+class _Span:
+    __slots__ = ("tracer", "stage", "started", "wall", "parent")
+
+    def __init__(self, tracer, stage):
+        self.tracer = tracer
+        self.stage = stage
+        self.started = None
+
+    def __enter__(self):
+        tracer = self.tracer
+        if not tracer.sampled():
+            return self
+        stack = tracer._stack()
+        self.parent = stack[-1] if stack else None
+        stack.append(self.stage)
+        self.wall = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, error, tb):
+        if self.started is None:
+            return
+        seconds = time.perf_counter() - self.started
+        stack = self.tracer._stack()
+        # A span in a generator can close after spans opened later on this thread
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i] == self.stage:
+                del stack[i]
+                break
+        # Streamlit stops a run by raising inside it; that is not the stage failing
+        failed = kind is not None and issubclass(kind, Exception)
+        self.tracer._record(self.stage, seconds, failed, self.wall, self.parent)
+
+
+# $ASKME_TRACE_SAMPLE is the fraction of spans timed; $ASKME_TRACE_FILE, if set, gets each one as a JSON line
+tracer = Tracer(sample=float(os.environ.get("ASKME_TRACE_SAMPLE", 1.0)), path=os.environ.get("ASKME_TRACE_FILE"))
+span = tracer.span
+traced = tracer.traced
+observe = tracer.observe
+metrics_text = tracer.metrics_text
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.tracer.metrics_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host="127.0.0.1", source=tracer):
+    """Serve `source`'s histograms on http://host:port/metrics from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.tracer = source
+    threading.Thread(target=server.serve_forever, name="metrics-endpoint", daemon=True).start()
+    return server
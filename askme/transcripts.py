@@ -0,0 +1,127 @@
+import atexit
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import wait
+from datetime import datetime
+
+from askme.tracing import traced
+
+
+class TranscriptSink:
+    """Append-only transcript of one chat session: JSONL segments in S3, merged into one object by `compact`."""
+
+    def __init__(self, s3, bucket, prefix, session_id, uploads=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.session_id = session_id
+        self.uploads = uploads
+        self.segments = []
+        self.numbered = 0
+        self.compacted = False
+        self.closed = False
+        self._pending = {}
+        self.saved = 0
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        return f"{self.prefix}/{self.session_id}.jsonl"
+
+    @traced("transcript.append")
+    def append(self, messages):
+        """Upload the messages not yet saved; returns how many were written."""
+        with self._lock:
+            self.last_used = time.monotonic()
+            if len(messages) < self.saved:
+                # The chat was cleared; keep recording into the same transcript
+                self.saved = 0
+            new = messages[self.saved:]
+            if not new:
+                return 0
+            timestamp = datetime.now().isoformat(timespec="seconds")
+            body = "".join(
+                json.dumps({"role": m["role"], "content": m["content"], "time": timestamp}) + "\n" for m in new
+            )
+            key = f"{self.prefix}/{self.session_id}/{self.numbered:05d}.jsonl"
+            upload = dict(Bucket=self.bucket, Key=key, Body=body.encode("utf-8"), ContentType="application/x-ndjson")
+            if self.uploads is None:
+                self.s3.put_object(**upload)
+            else:
+                self._pending[key] = self.uploads.submit(self.s3.put_object, **upload)
+            self.segments.append(key)
+            self.numbered += 1
+            self.saved = len(messages)
+            return len(new)
+
+    @traced("transcript.compact")
+    def compact(self):
+        """Merge the uploaded segments into one object (after any compacted before) and delete the segments."""
+        with self._lock:
+            self.closed = True
+            # Only merge segments that actually reached S3
+            wait(self._pending.values())
+            failed = {key for key, future in self._pending.items() if future.exception() is not None}
+            self._pending = {}
+            self.segments = [key for key in self.segments if key not in failed]
+            if not self.segments:
+                return self.key if self.compacted else None
+            keys = ([self.key] if self.compacted else []) + self.segments
+            body = b"".join(self.s3.get_object(Bucket=self.bucket, Key=key)["Body"].read() for key in keys)
+            self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=body, ContentType="application/x-ndjson")
+            self.s3.delete_objects(
+                Bucket=self.bucket, Delete={"Objects": [{"Key": key} for key in self.segments], "Quiet": True}
+            )
+            self.segments = []
+            self.compacted = True
+            return self.key
+
+
+class TranscriptStore:
+    """Process-wide registry of transcript sinks; idle ones are compacted by `reap()`, the rest at exit."""
+
+    def __init__(self, s3, bucket, prefix="transcripts", idle_ttl=1800.0, uploads=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.idle_ttl = idle_ttl
+        self.uploads = uploads
+        self._sinks = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def open(self, sink=None):
+        self.reap()
+        if sink is None:
+            session_id = f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{uuid.uuid4().hex[:8]}"
+            sink = TranscriptSink(self.s3, self.bucket, self.prefix, session_id, self.uploads)
+        sink.closed = False
+        sink.last_used = time.monotonic()
+        with self._lock:
+            self._sinks[sink.session_id] = sink
+        return sink
+
+    def _compact(self, sinks):
+        for sink in sinks:
+            try:
+                sink.compact()
+            except Exception as e:
+                # The segments stay in S3, so nothing is lost
+                print(f"Could not compact transcript {sink.session_id}: {e}")
+
+    def reap(self):
+        now = time.monotonic()
+        with self._lock:
+            idle = [s for s in self._sinks.values() if now - s.last_used > self.idle_ttl]
+            for sink in idle:
+                del self._sinks[sink.session_id]
+        self._compact(idle)
+        return len(idle)
+
+    def close(self):
+        with self._lock:
+            sinks, self._sinks = list(self._sinks.values()), {}
+        self._compact(sinks)
@@ -0,0 +1,300 @@
+"""One chat page for every tutor persona in tutors.toml."""
+import functools
+import json
+import os
+import time
+
+import openai
+import streamlit as st
+
+from askme.answer_cache import AnswerCache, replay, system_hash
+from askme.chat_view import RerunTimer, render_history
+from askme.clients import metrics_endpoint, openai_client, openai_limiter, s3_client, upload_queue
+from askme.context import ContextWindow, count_text, delta_text, describe_usage, openai_summariser, timed_text
+from askme.request_policy import CircuitBreaker, CircuitOpenError, RequestPolicy, StreamTimeout
+from askme.router import turn_features
+from askme.singleflight import SingleFlight
+from askme.threads import session_key
+from askme.tracing import observe, span
+from askme.transcripts import TranscriptStore
+from askme.tutors import DEFAULT_CONFIG, load_router, load_tutors
+
+# Send the system prompt plus as much recent history as fits this many tokens
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 3000))
+# With a model set, older turns that no longer fit are summarised by it instead of left out
+SUMMARY_MODEL = os.environ.get("CONTEXT_SUMMARY_MODEL")
+SUMMARY_TOKENS = int(os.environ.get("CONTEXT_SUMMARY_TOKENS", 200))
+# Tokens a reply is expected to use, charged against the tokens-per-minute budget up front
+REPLY_TOKENS = int(os.environ.get("REPLY_TOKEN_ESTIMATE", 500))
+# Seconds a reply may take to start, and may pause between chunks, before it is given up on
+FIRST_TOKEN_TIMEOUT = float(os.environ.get("CHAT_FIRST_TOKEN_TIMEOUT", 20))
+STALL_TIMEOUT = float(os.environ.get("CHAT_STALL_TIMEOUT", 20))
+# Send a second copy of a request that hasn't started streaming after this many ms (unset: never)
+HEDGE_AFTER_MS = os.environ.get("CHAT_HEDGE_AFTER_MS")
+# New requests sent for one that stalled or failed to connect before its first token
+REQUEST_RETRIES = int(os.environ.get("CHAT_RETRIES", 1))
+# Stop asking OpenAI for CHAT_BREAKER_RESET seconds after this many failures in a row
+BREAKER_FAILURES = int(os.environ.get("CHAT_BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.environ.get("CHAT_BREAKER_RESET", 30))
+# Append every routed turn's features, model, latency and cost here, to tune the router
+ROUTER_LOG = os.environ.get("ROUTER_LOG")
+
+
+# Re-read when tutors.toml changes on disk
+@st.cache_resource
+def _load_tutors(path, mtime):
+    return load_tutors(path)
+
+
+def tutors(path=DEFAULT_CONFIG):
+    return _load_tutors(path, os.path.getmtime(path))
+
+
+# The per-turn model router, from tutors.toml's [router]; its stats restart when that changes
+@st.cache_resource
+def _load_router(path, mtime):
+    return load_router(path, log_path=ROUTER_LOG)
+
+
+def model_router(path=DEFAULT_CONFIG):
+    return _load_router(path, os.path.getmtime(path))
+
+
+# The limiter retries 429s itself, after queuing behind other sessions
+@st.cache_resource
+def load_chat_client():
+    return openai_client().with_options(max_retries=0)
+
+
+# Deadlines, retries and hedging for every tutor's requests, with one circuit breaker
+@st.cache_resource
+def load_request_policy():
+    return RequestPolicy(
+        first_token=FIRST_TOKEN_TIMEOUT,
+        stall=STALL_TIMEOUT,
+        hedge_after=float(HEDGE_AFTER_MS) / 1000 if HEDGE_AFTER_MS else None,
+        retries=REQUEST_RETRIES,
+        breaker=CircuitBreaker(failures=BREAKER_FAILURES, reset_after=BREAKER_RESET),
+    )
+
+
+# One append-only transcript per session and tutor, compacted when the session ends
+@st.cache_resource
+def load_transcript_store():
+    return TranscriptStore(s3_client(), 'askphysics', uploads=upload_queue())
+
+
+# Answers to standalone first questions, shared by every session and kept on disk;
+# keyed by system prompt and model, so tutors don't answer from each other's entries
+@st.cache_resource
+def load_answer_cache():
+    return AnswerCache(similarity=0.9)
+
+
+# Identical requests in flight at once (same tutor, model and messages) share one stream
+@st.cache_resource
+def load_single_flight():
+    return SingleFlight()
+
+
+@st.cache_resource
+def load_context_window(model):
+    summarise = openai_summariser(openai_client(), SUMMARY_MODEL, SUMMARY_TOKENS) if SUMMARY_MODEL else None
+    return ContextWindow(budget=CONTEXT_TOKEN_BUDGET, model=model, summarise=summarise, summary_tokens=SUMMARY_TOKENS)
+
+
+def _show_intro(persona, state):
+    st.title(persona.title)
+    for line in persona.text:
+        st.text(line)
+    if persona.markdown:
+        st.markdown(persona.markdown)
+    if persona.image:
+        st.image(persona.image["url"], caption=persona.image.get("caption"), width=persona.image.get("width", 480))
+    if persona.gallery:
+        def step(by):
+            state["image"] = (state["image"] + by) % len(persona.gallery)
+
+        item = persona.gallery[state["image"]]
+        st.image(item["url"], width=300)
+        st.write(item.get("caption", f"Image {state['image'] + 1}"))
+        st.button("Previous", key=f"{persona.name}_previous", on_click=step, args=(-1,))
+        st.button("Next", key=f"{persona.name}_next", on_click=step, args=(1,))
+
+
+def _queue_note(placeholder):
+    def show(position, seconds):
+        if position > 1:
+            placeholder.caption(f"The tutors are busy: you are #{position} in the queue…")
+        elif seconds:
+            placeholder.caption(f"You are next in the queue, about {seconds:.0f}s…")
+        else:
+            placeholder.caption("You are next in the queue…")
+
+    return show
+
+
+def _texts(chunks, slot):
+    # The reply's text; hangs up and gives back the limiter slot once read or abandoned
+    try:
+        yield from delta_text(chunks)
+    finally:
+        chunks.close()
+        slot.close()
+
+
+def _stream_reply(persona, model, messages, usage):
+    # Stream the reply into the page; an identical request already in flight is joined instead
+    note = st.empty()
+    slot = openai_limiter().slot(session_key(st.session_state), usage["prompt_tokens"] + REPLY_TOKENS,
+                                 on_wait=_queue_note(note))
+
+    def create():
+        return load_chat_client().chat.completions.with_raw_response.create(
+            model=model,
+            messages=messages,
+            stream=True,
+        )
+
+    def hedge():
+        # A second copy goes out only while nobody is queued for the budget it uses, in a
+        # slot of its own that is given back when the copy is hung up
+        limiter = openai_limiter()
+        if limiter.depth():
+            return None
+        return limiter.slot(slot.ticket.session, slot.ticket.tokens).stream(create)
+
+    def start():
+        # Wait for a turn at the shared OpenAI budget here, where the queue note can be drawn;
+        # the request itself is sent from the policy's threads
+        slot.open()
+        try:
+            chunks = load_request_policy().stream(lambda: slot.call(create, quiet=True), hedge=hedge)
+        except BaseException:
+            slot.close()
+            raise
+        return _texts(chunks, slot)
+
+    started = time.perf_counter()
+    key = system_hash(persona.name, model, json.dumps(messages))
+    texts, shared = load_single_flight().stream(key, start)
+    try:
+        note.empty()
+        usage["queued"] = slot.waited
+        if shared:
+            usage["shared"] = True
+        observe("openai.queue_wait", slot.waited)
+        with span("chat.write_stream"):
+            response = st.write_stream(timed_text(texts, usage, started + slot.waited))
+        if "ttft" in usage:
+            observe("chat.first_token", usage["ttft"])
+        return response
+    finally:
+        # A new submission or leaving the page stops this run mid-stream; the upstream
+        # is hung up once no session is reading it
+        texts.close()
+
+
+def show_tutor(persona):
+    """Draw `persona`'s chat page and answer its latest question."""
+    timer = RerunTimer(st.session_state)
+    metrics_endpoint()
+    state = st.session_state.setdefault(f"tutor_{persona.name}", {
+        "messages": [{"role": "system", "content": persona.prompt}],
+        "image": 0,
+    })
+    if persona.transcript and "transcript" not in state:
+        state["transcript"] = load_transcript_store().open()
+    answer_cache = load_answer_cache() if persona.answer_cache else None
+    messages = state["messages"]
+
+    _show_intro(persona, state)
+    if answer_cache is not None:
+        cache_stats = answer_cache.stats()
+        st.sidebar.caption(f"Answer cache: {cache_stats['hit_rate']:.0%} hit rate, "
+                           f"{cache_stats.get('saved_tokens', 0)} tokens saved")
+
+    # Display chat messages from history on app rerun: finished turns as one
+    # cached block, only the latest exchange as chat bubbles
+    with timer.section("history"):
+        render_history([m for m in messages if m["role"] != "system"], key=f"_history_block_{persona.name}")
+
+    if prompt := st.chat_input(persona.placeholder):
+        messages.append({"role": "user", "content": prompt})
+        with st.chat_message("user"):
+            st.markdown(prompt)
+
+        description = persona.describe_image(prompt)
+        if description is not None:
+            messages.append({"role": "system", "content": description})
+
+        # A first question doesn't depend on earlier turns, so it can be answered
+        # from the cache for this system prompt and model
+        first_question = answer_cache is not None and len(messages) == 2
+        cache_key = system_hash(persona.prompt, persona.model)
+        cached = answer_cache.get(cache_key, prompt) if first_question else None
+
+        # Pick this turn's model from the question itself; a cached answer needs none
+        route = features = None
+        if cached is None:
+            features = turn_features(prompt, history_turns=sum(m["role"] == "user" for m in messages) - 1,
+                                     picture=description is not None, queue_depth=openai_limiter().depth())
+            route = model_router().choose(persona.model, features, persona.strong_model)
+
+        with st.chat_message("assistant"):
+            window, usage = load_context_window(route.model if route else persona.model).fit(messages)
+            if cached is not None:
+                response = st.write_stream(replay(cached))
+                usage["cached"] = True
+            else:
+                usage["model"] = route.model
+                try:
+                    response = _stream_reply(persona, route.model, window, usage)
+                except openai.RateLimitError:
+                    response = None
+                    st.error("The tutors are very busy right now. Please ask again in a minute.")
+                except (StreamTimeout, CircuitOpenError, openai.APIConnectionError):
+                    response = None
+                    st.error("The tutor isn't answering right now. Please ask again in a minute.")
+                except openai.APIError as e:
+                    response = None
+                    st.error(f"The tutor couldn't answer: {e.message}")
+            if response is not None:
+                usage["reply_tokens"] = count_text(response)
+                if route is not None:
+                    model_router().record(route, usage, features, persona.name)
+                st.caption(describe_usage(usage))
+        if response is not None:
+            if first_question and cached is None:
+                answer_cache.put(cache_key, prompt, response, usage["prompt_tokens"])
+            messages.append({"role": "assistant", "content": response, "usage": usage})
+            if persona.transcript:
+                if state["transcript"].closed:
+                    # Reaped while idle; carry on after the part already compacted
+                    load_transcript_store().open(state["transcript"])
+                state["transcript"].append(messages)
+
+    queue = openai_limiter().stats()
+    flights = load_single_flight().stats()
+    requests = load_request_policy().stats()
+    st.sidebar.caption(f"OpenAI: {queue['in_flight']} answering, {queue['queued']} queued, "
+                       f"{queue['throttled']} rate-limited, {requests['timed_out']} timed out, "
+                       f"{requests['hedges_won']}/{requests['hedged']} hedges won, {flights['joined']} answers shared")
+    routes = model_router().stats()
+    if routes:
+        st.sidebar.caption("Routing: " + ", ".join(
+            f"{name} {r['turns']} turns, {r['mean_seconds']:.1f}s, ${r['cost']:.4f}" for name, r in routes.items()))
+    st.sidebar.caption(timer.finish())
+
+
+def run_tutor(name):
+    """Serve the tutor called `name` as the whole app, for the single-tutor scripts."""
+    show_tutor(tutors()[name])
+
+
+def tutor_pages():
+    """An `st.Page` per persona, the first one the default, for `st.navigation`."""
+    return [
+        st.Page(functools.partial(show_tutor, persona), title=persona.label, url_path=name, default=i == 0)
+        for i, (name, persona) in enumerate(tutors().items())
+    ]
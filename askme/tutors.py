@@ -0,0 +1,69 @@
+"""The registry of tutor personas, read from tutors.toml (see the top of it for the keys)."""
+import os
+import re
+import tomllib
+
+from askme.router import ModelRouter
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tutors.toml")
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+_IMAGE_PROMPT = re.compile(r"image\s+(\d+)", re.IGNORECASE)
+
+
+class Persona:
+    """One tutor: its page, its prompt and model, and what it keeps."""
+
+    def __init__(self, name, title, prompt, label=None, text=(), markdown=None, image=None, gallery=(),
+                 placeholder="What is up?", model=DEFAULT_MODEL, strong_model=None, transcript=False,
+                 answer_cache=False):
+        self.name = name
+        self.title = title
+        self.prompt = prompt
+        self.label = label or title
+        self.text = list(text)
+        self.markdown = markdown
+        self.image = image
+        self.gallery = list(gallery)
+        self.placeholder = placeholder
+        self.model = model
+        self.strong_model = strong_model
+        self.transcript = transcript
+        self.answer_cache = answer_cache
+
+    def describe_image(self, prompt):
+        """What gallery image N shows, when the student asks about "Image N"; else None."""
+        match = _IMAGE_PROMPT.match(prompt.strip())
+        if not self.gallery or match is None:
+            return None
+        number = int(match.group(1))
+        if 1 <= number <= len(self.gallery):
+            return self.gallery[number - 1].get("description", "No description available.")
+        return "No description available."
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def load_tutors(path=DEFAULT_CONFIG):
+    """The personas in `path`, by name, in the order they are listed."""
+    config = _read(path)
+    tutors = {}
+    for name, table in config.get("tutors", {}).items():
+        try:
+            tutors[name] = Persona(name, **table)
+        except TypeError as e:
+            raise ValueError(f"{path}: tutor {name!r}: {e}") from None
+    if not tutors:
+        raise ValueError(f"{path}: no [tutors.<name>] tables")
+    return tutors
+
+
+def load_router(path=DEFAULT_CONFIG, log_path=None):
+    """A ModelRouter configured by the [router] table in `path` (all defaults without one)."""
+    try:
+        return ModelRouter(log_path=log_path, **_read(path).get("router", {}))
+    except TypeError as e:
+        raise ValueError(f"{path}: [router]: {e}") from None
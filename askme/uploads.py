@@ -0,0 +1,141 @@
+import atexit
+import collections
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from askme.tracing import observe
+
+# What submit() does when the queue is full
+POLICIES = ("block", "drop_newest", "drop_oldest")
+
+
+class UploadDropped(Exception):
+    """Set on an upload's future when the back-pressure policy discarded it."""
+
+
+class _Job:
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+
+class UploadQueue:
+    """Runs S3 uploads on background workers, with retries, and a back-pressure `policy` when full."""
+
+    def __init__(self, workers=2, max_pending=1000, retries=3, policy="block", block_timeout=5.0):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}, not {policy!r}")
+        self.retries = retries
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.counts = collections.Counter()
+        self.latencies = collections.deque(maxlen=1000)
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._work, name=f"upload-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        atexit.register(self.close)
+
+    def submit(self, fn, *args, **kwargs):
+        job = _Job(fn, args, kwargs)
+        if self._closed:
+            self._drop(job)
+            return job.future
+        with self._lock:
+            self.counts["submitted"] += 1
+        try:
+            if self.policy == "block":
+                self._queue.put(job, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(job)
+        except queue.Full:
+            if self.policy != "drop_oldest":
+                self._drop(job)
+                return job.future
+            try:
+                self._drop(self._queue.get_nowait())
+                self._queue.task_done()
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self._drop(job)
+        return job.future
+
+    def _drop(self, job):
+        with self._lock:
+            self.counts["dropped"] += 1
+        job.future.set_exception(UploadDropped("upload queue is full"))
+
+    def _run(self, job):
+        for attempt in range(self.retries + 1):
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except Exception as e:
+                if attempt == self.retries:
+                    with self._lock:
+                        self.counts["failed"] += 1
+                    print(f"Upload failed after {attempt + 1} attempts: {e}")
+                    observe("upload", time.monotonic() - job.queued_at, error=True)
+                    job.future.set_exception(e)
+                    return
+                with self._lock:
+                    self.counts["retried"] += 1
+                time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+            else:
+                latency = time.monotonic() - job.queued_at
+                with self._lock:
+                    self.counts["completed"] += 1
+                    self.latencies.append(latency)
+                observe("upload", latency)
+                job.future.set_result(result)
+                return
+
+    def _work(self):
+        # One job at a time, so an idle worker never waits behind another's backlog
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            self._run(job)
+            self._queue.task_done()
+
+    def stats(self):
+        """Queue depth, job counters and enqueue-to-done latency percentiles in seconds."""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            counts = dict(self.counts)
+        stats = {"depth": self._queue.qsize(), **counts}
+        for p in (50, 95, 99):
+            stats[f"latency_p{p}"] = latencies[min(len(latencies) - 1, len(latencies) * p // 100)] if latencies else None
+        return stats
+
+    def flush(self, timeout=None):
+        """Wait until every queued upload has finished; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout=30.0):
+        """Flush pending uploads and stop the workers."""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
@@ -0,0 +1,134 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+
+from PIL import Image, ImageOps
+
+from askme.answer_cache import system_hash
+from askme.tracing import traced
+
+VISION_MODEL = os.environ.get("VISION_MODEL", "gpt-4-vision-preview")
+QUESTION = "What’s in this image?"
+# The vision models fit high-detail images into 2048 x 2048 and then scale
+# the short side down to 768 px; anything bigger is uploaded for nothing
+MAX_SIDE = 2048
+SHORT_SIDE = 768
+# Images up to this size go inline as base64; bigger ones by presigned S3 URL
+INLINE_LIMIT = 512 * 1024
+
+
+def image_digest(data):
+    """Content hash identifying an uploaded image, whatever its file name."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def prepare_image(data, quality=85):
+    """Downscale and re-encode image bytes to what the vision model will use.
+
+    Returns `(bytes, mime_type, (width, height))`. Photos become JPEG;
+    images with transparency stay PNG.
+    """
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    width, height = image.size
+    scale = min(1.0, MAX_SIDE / max(width, height), SHORT_SIDE / min(width, height))
+    if scale < 1.0:
+        image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+    out = io.BytesIO()
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image.save(out, format="PNG", optimize=True)
+        mime = "image/png"
+    else:
+        image.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True)
+        mime = "image/jpeg"
+    return out.getvalue(), mime, image.size
+
+
+class ImagePipeline:
+    """Uploads and analyses images, doing the work once per distinct image (by content hash)."""
+
+    def __init__(self, client, s3, bucket, uploads=None, cache=None, model=VISION_MODEL, prefix="uploads",
+                 inline_limit=INLINE_LIMIT):
+        self.client = client
+        self.s3 = s3
+        self.bucket = bucket
+        self.uploads = uploads
+        self.cache = cache
+        self.model = model
+        self.prefix = prefix
+        self.inline_limit = inline_limit
+        self._uploaded = set()
+        self._uploading = set()
+        self._lock = threading.Lock()
+
+    def key(self, digest, name=""):
+        extension = os.path.splitext(name)[1].lower() or ".jpg"
+        return f"{self.prefix}/{digest}{extension}"
+
+    def upload(self, data, name=""):
+        """Store the original image once; returns its public URL."""
+        key = self.key(image_digest(data), name)
+        with self._lock:
+            fresh = key not in self._uploaded and key not in self._uploading
+            if fresh:
+                self._uploading.add(key)
+        if fresh:
+            if self.uploads is not None:
+                future = self.uploads.submit(self.s3.put_object, Bucket=self.bucket, Key=key, Body=data)
+                future.add_done_callback(lambda f: self._settle(key, f.exception() is None))
+            else:
+                try:
+                    self.s3.put_object(Bucket=self.bucket, Key=key, Body=data)
+                except BaseException:
+                    self._settle(key, False)
+                    raise
+                self._settle(key, True)
+        return f"https://{self.bucket}.s3.ap-southeast-1.amazonaws.com/{key}"
+
+    def _settle(self, key, stored):
+        # Only an upload that reached S3 is skipped next time; a failed one is tried again
+        with self._lock:
+            self._uploading.discard(key)
+            if stored:
+                self._uploaded.add(key)
+
+    def _image_url(self, digest, prepared, mime):
+        if len(prepared) <= self.inline_limit:
+            return f"data:{mime};base64,{base64.b64encode(prepared).decode()}", "inline"
+        key = f"{self.prefix}/{digest}-vision.{mime.split('/')[1]}"
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=prepared, ContentType=mime)
+        url = self.s3.generate_presigned_url("get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=600)
+        return url, "presigned URL"
+
+    @traced("vision.analyse")
+    def analyse(self, data, question=QUESTION, max_tokens=600):
+        """Return `(answer, info)`; `info` says how the image was sent, or that it was cached."""
+        digest = image_digest(data)
+        system = system_hash(self.model, question, max_tokens, MAX_SIDE, SHORT_SIDE)
+        if self.cache is not None:
+            answer = self.cache.get(system, digest)
+            if answer is not None:
+                return answer, {"digest": digest, "cached": True}
+
+        prepared, mime, size = prepare_image(data)
+        url, how = self._image_url(digest, prepared, mime)
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": question},
+                        {"type": "image_url", "image_url": {"url": url}},
+                    ],
+                }
+            ],
+            max_tokens=max_tokens,
+        )
+        answer = response.choices[0].message.content
+        if self.cache is not None:
+            prompt_tokens = response.usage.prompt_tokens if response.usage else 0
+            self.cache.put(system, digest, answer, prompt_tokens=prompt_tokens)
+        return answer, {"digest": digest, "cached": False, "sent": how, "bytes": len(prepared),
+                        "original_bytes": len(data), "size": size}
@@ -1,87 +1,116 @@
 import os
 import time
 import streamlit as st
-from openai import OpenAI
+from askme.answer_cache import AnswerCache, system_hash
+from askme.chat_view import RerunTimer, render_history
+from askme.clients import metrics_endpoint, openai_client
+from askme.content import CitationResolver, normalise_content
+from askme.latex import to_markdown
 from datetime import datetime
-import re
+from askme.runs import run_assistant
+from askme.singleflight import SingleFlight
+from askme.threads import load_thread_pool, session_key
+
+# Time each script run so slow reruns show up in the sidebar
+timer = RerunTimer(st.session_state)
+# Stage timings on /metrics when $ASKME_METRICS_PORT is set
+metrics_endpoint()
 
 # Read the OpenAI API key from Streamlit's secrets management
 OPENAI_API_KEY = st.secrets["OPENAI_API_KEY"]
 
-# Set OpenAI client, assistant AI, and assistant AI thread
+# Set OpenAI client and assistant AI, shared by every session in this process
 @st.cache_resource
 def load_openai_client_and_assistant():
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    client = openai_client(OPENAI_API_KEY)
     assistant_id = 'asst_PiOQMpZUvHq07hqakNFuKEBS'
     my_assistant = client.beta.assistants.retrieve(assistant_id)
-    thread = client.beta.threads.create()
-    return client, my_assistant, thread
+    return client, my_assistant
+
+# Answers to standalone first questions, shared by every session and kept on disk
+@st.cache_resource
+def load_answer_cache():
+    return AnswerCache(similarity=0.9)
 
-client, my_assistant, assistant_thread = load_openai_client_and_assistant()
+# Identical questions in flight at the same point of a conversation share one run
+@st.cache_resource
+def load_single_flight():
+    return SingleFlight()
+
+# Names of files the assistant cites, looked up once per process
+@st.cache_resource
+def load_citation_resolver():
+    return CitationResolver(client)
+
+client, my_assistant = load_openai_client_and_assistant()
+thread_pool = load_thread_pool(OPENAI_API_KEY)
+answer_cache = load_answer_cache()
+citations = load_citation_resolver()
+single_flight = load_single_flight()
+# Cached answers are only valid for this assistant's current setup and the
+# way answers are stored (bump the last part when preprocess_response changes)
+cache_key = system_hash(my_assistant.id, my_assistant.model, my_assistant.instructions, "markdown-v2")
 
 # Display the bot ID being used
 st.write(f"Using Bot ID: {my_assistant.id}")
 
-# Check in loop if assistant AI parses our request
-def wait_on_run(run, thread):
-    while run.status in ["queued", "in_progress"]:
-        run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-        time.sleep(0.5)
-    return run
-
-# Preprocess response to correctly render LaTeX and handle text content blocks
+# Turn a message's content blocks (text, file citations, images) into markdown
 def preprocess_response(response):
-    processed_response = ""
-    if isinstance(response, list):
-        for item in response:
-            if isinstance(item, dict) and 'text' in item:
-                processed_response += item['text']['value'].replace('\\n', '\n').replace('\\', '\\\\')
-            elif hasattr(item, 'text') and hasattr(item.text, 'value'):
-                processed_response += item.text.value.replace('\\n', '\n').replace('\\', '\\\\')
-    elif isinstance(response, dict) and 'text' in response:
-        processed_response = response['text']['value'].replace('\\n', '\n').replace('\\', '\\\\')
-    return processed_response
-
-# Function to render message parts
+    return normalise_content(response, citations)
+
+# Render a message as one markdown block with its math; each message is parsed once
 def render_message(message):
-    # Ensure the message is a string
-    message = str(message)
-    # Split the message into parts using a regex to detect LaTeX expressions
-    parts = re.split(r'(\$.*?\$)', message)
-    for part in parts:
-        if part.startswith('$') and part.endswith('$'):
-            latex_code = part[1:-1].strip()  # Remove the dollar signs and strip whitespace
-            try:
-                st.latex(latex_code)
-            except Exception as e:
-                st.error(f"Error rendering LaTeX: {e}\nLaTeX code: {latex_code}")
-        else:
-            st.markdown(part)
+    st.markdown(to_markdown(str(message)))
 
-# Initiate assistant AI response
-def get_assistant_response(user_input=""):
-    try:
+# Ask the assistant AI one question on a leased thread and return its new messages
+def ask_assistant(lease, user_input):
+    with lease.lock:
         message = client.beta.threads.messages.create(
-            thread_id=assistant_thread.id,
+            thread_id=lease.thread_id,
             role="user",
             content=user_input
         )
-        run = client.beta.threads.runs.create(
-            thread_id=assistant_thread.id,
-            assistant_id=my_assistant.id
-        )
-        run = wait_on_run(run, assistant_thread)
+        # Stream the run to completion (falls back to backoff polling)
+        run_assistant(client, lease.thread_id, my_assistant.id)
 
         # Retrieve all the messages added after our last user message
         messages = client.beta.threads.messages.list(
-            thread_id=assistant_thread.id, order="asc", after=message.id
+            thread_id=lease.thread_id, order="asc", after=message.id
         )
+    return messages.data
 
-        for msg in messages.data:
+# Initiate assistant AI response
+def get_assistant_response(user_input=""):
+    try:
+        lease = thread_pool.lease(session_key(st.session_state))
+        # A first question doesn't depend on earlier turns, so it can come from the cache
+        first_question = sum(role == "user" for role, _ in st.session_state.conversation_history) == 1
+        cached = answer_cache.get(cache_key, user_input) if first_question else None
+        if cached is not None:
+            # Record the exchange on the thread so follow-up questions keep their context
+            with lease.lock:
+                client.beta.threads.messages.create(thread_id=lease.thread_id, role="user", content=user_input)
+                client.beta.threads.messages.create(thread_id=lease.thread_id, role="assistant", content=cached)
+            st.session_state.conversation_history.append(("assistant", cached))
+            return
+        # Sessions asking the same question after the same conversation share one run
+        history_key = system_hash(cache_key, *(f"{role}: {message}" for role, message in st.session_state.conversation_history))
+        replies, shared = single_flight.call(history_key, lambda: ask_assistant(lease, user_input))
+        answers = []
+        for msg in replies:
             if msg.role == "assistant":
                 st.write(f"DEBUG: {msg.content}")  # Debugging output to inspect the structure
                 preprocessed_content = preprocess_response(msg.content)
+                answers.append(preprocessed_content)
                 st.session_state.conversation_history.append(("assistant", preprocessed_content))  # Append assistant response
+        if shared:
+            # The run was on another session's thread; record the exchange on ours as well
+            with lease.lock:
+                client.beta.threads.messages.create(thread_id=lease.thread_id, role="user", content=user_input)
+                for answer in answers:
+                    client.beta.threads.messages.create(thread_id=lease.thread_id, role="assistant", content=answer)
+        if first_question:
+            answer_cache.put(cache_key, user_input, "\n\n".join(answers))
     except Exception as e:
         st.error(f"Error in getting assistant response: {e}")
 
@@ -98,24 +127,58 @@ def submit():
         # Clear the input field
         st.session_state.query = ''
 
-# Test Case: Define rate of decay
-test_case = "define rate of decay"
-st.session_state.conversation_history.append(("user", test_case))
-get_assistant_response(test_case)
+# Opt-in self-test: with ASKME_SELF_TEST=1 the assistant answers one known
+# question once per process, on its own thread, and the result is cached
+@st.cache_resource
+def run_self_test(test_case="define rate of decay"):
+    started = time.perf_counter()
+    try:
+        messages = ask_assistant(thread_pool.lease("self-test"), test_case)
+        answer = preprocess_response([c for m in messages if m.role == "assistant" for c in m.content])
+        result = {"ok": bool(answer), "answer": answer}
+    except Exception as e:
+        result = {"ok": False, "error": str(e)}
+    finally:
+        thread_pool.release("self-test")
+    result["latency"] = time.perf_counter() - started
+    return result
 
 st.title("Physics Topic 20: Nuclear Physics Assistant")
+# Report how often new sessions got a pre-warmed thread
+pool_stats = thread_pool.stats()
+st.sidebar.caption(f"Thread pool: {pool_stats['hit_rate']:.0%} hit rate, {pool_stats['spares_ready']} spare threads ready")
+cache_stats = answer_cache.stats()
+st.sidebar.caption(f"Answer cache: {cache_stats['hit_rate']:.0%} hit rate, {cache_stats.get('saved_tokens', 0)} tokens saved")
+if os.environ.get("ASKME_SELF_TEST") == "1":
+    self_test = run_self_test()
+    status = "passed" if self_test["ok"] else f"failed ({self_test.get('error', 'empty answer')})"
+    st.sidebar.caption(f"Startup self-test {status} in {self_test['latency']:.1f}s")
 st.header('Conversation')
 
-# Render the conversation history
-for role, message in st.session_state.conversation_history:
+# Render the conversation history: finished turns as one cached block, the latest exchange live
+def draw_turn(turn):
+    role, message = turn
     if role == 'user':
         st.markdown(f"<b style='color: yellow;'>{message}</b>", unsafe_allow_html=True)
     else:
         render_message(message)
 
+def format_turn(turn):
+    role, message = turn
+    if role == 'user':
+        return ":yellow[**" + str(message).replace("]", "\\]") + "**]"
+    return to_markdown(str(message))
+
+with timer.section("history"):
+    render_history(st.session_state.conversation_history, draw=draw_turn, format=format_turn)
+
 st.text_input("How may I help you?", key='query', on_change=submit)
 
 # Add a button to clear the conversation history
 if st.button('Clear Conversation'):
     st.session_state.conversation_history = []
+    # Start the next question on a fresh thread instead of the old context
+    thread_pool.release(session_key(st.session_state))
     st.experimental_rerun()
+
+st.sidebar.caption(timer.finish())
@@ -1,55 +1,47 @@
 import os
-import time
 import streamlit as st
-from openai import OpenAI
-import boto3
+from askme.clients import openai_client
 from datetime import datetime
 import csv
+from askme.runs import RunError, run_assistant
+from askme.threads import load_thread_pool, session_key
 
 assistant_id    = st.secrets["assistant_id"]
 
 
-# Set openAi client , assistant ai and assistant ai thread
+# Set openAi client and assistant ai, shared by every session in this process
 @st.cache_resource
 def load_openai_client_and_assistant():
-    client          = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+    client          = openai_client()
     my_assistant    = client.beta.assistants.retrieve(assistant_id=os.environ['assistant_id'])
-    thread          = client.beta.threads.create()
 
-    return client , my_assistant, thread
+    return client , my_assistant
 
-client,  my_assistant, assistant_thread = load_openai_client_and_assistant()
-
-# check in loop  if assistant ai parse our request
-def wait_on_run(run, thread):
-    while run.status == "queued" or run.status == "in_progress":
-        run = client.beta.threads.runs.retrieve(
-            thread_id=thread.id,
-            run_id=run.id,
-        )
-        time.sleep(0.5)
-    return run
+client,  my_assistant = load_openai_client_and_assistant()
+thread_pool = load_thread_pool()
 
 # initiate assistant ai response
 def get_assistant_response(user_input=""):
 
-    message = client.beta.threads.messages.create(
-        thread_id=assistant_thread.id,
-        role="user",
-        content=user_input,
-    )
-
-    run = client.beta.threads.runs.create(
-        thread_id=assistant_thread.id,
-        assistant_id=assistant_id,
-    )
+    lease = thread_pool.lease(session_key(st.session_state))
+    with lease.lock:
+        message = client.beta.threads.messages.create(
+            thread_id=lease.thread_id,
+            role="user",
+            content=user_input,
+        )
 
-    run = wait_on_run(run, assistant_thread)
+        # stream the run to completion (falls back to backoff polling)
+        try:
+            run_assistant(client, lease.thread_id, assistant_id)
+        except RunError as e:
+            st.error(f"Error in getting assistant response: {e}")
+            return ""
 
-    # Retrieve all the messages added after our last user message
-    messages = client.beta.threads.messages.list(
-        thread_id=assistant_thread.id, order="asc", after=message.id
-    )
+        # Retrieve all the messages added after our last user message
+        messages = client.beta.threads.messages.list(
+            thread_id=lease.thread_id, order="asc", after=message.id
+        )
 
     return messages.data[0].content[0].text.value
 
@@ -63,6 +55,9 @@ def submit():
 
 
 st.title("Physics Tutorial Assistant")
+# report how often new sessions got a pre-warmed thread
+pool_stats = thread_pool.stats()
+st.sidebar.caption(f"Thread pool: {pool_stats['hit_rate']:.0%} hit rate, {pool_stats['spares_ready']} spare threads ready")
 
 st.text_input("Start Typing:", key='query', on_change=submit)
 
@@ -0,0 +1,94 @@
+"""Lookup time of the answer cache against its size, and which near-duplicates it matches.
+
+    python -m benchmarks.bench_answer_cache --entries 100 1000 5000
+
+Times exact and similarity lookups in an askme.answer_cache.AnswerCache
+holding N questions, then checks the similarity match: rewordings of a
+cached question must hit, and questions that differ from it in a word, a
+number or an operator must miss, since their answer is different. Also
+checks that evicted questions leave the similarity index.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from askme.answer_cache import AnswerCache
+
+SYSTEM = "tutor"
+
+# (cached question, a question that must get its answer)
+SAME = [
+    ("What is the half-life of carbon-14?", "what is the half life of carbon 14"),
+    ("Why is a soft iron core used in an electromagnet?", "Why is a soft-iron core used in an electromagnet ?"),
+    ("Explain Newton's third law.", "explain newtons third law"),
+    ("A sample has a half-life of 5 days. How much is left after 10 days?",
+     "A sample has a half life of 5 days, how much is left after 10 days"),
+]
+# (cached question, a question that must not get its answer)
+DIFFERENT = [
+    ("A sample has a half-life of 5 days. How much is left after 10 days?",
+     "A sample has a half-life of 5 days. How much is left after 15 days?"),
+    ("A sample has a half-life of 5 days. How much is left after 10 days?",
+     "A sample has a half-life of 3 days. How much is left after 10 days?"),
+    ("what is 2+3", "what is 2-3"),
+    ("A 2 kg ball falls 5 m. How fast is it moving?", "A 2 kg ball falls 50 m. How fast is it moving?"),
+    ("What is half of the wavelength?", "What is a third of the wavelength?"),
+    ("What is the SI unit of momentum?", "What is the SI unit of moment?"),
+    ("the sky is blue", "the sky is not blue"),
+]
+
+
+def check_matches(directory):
+    cache = AnswerCache(os.path.join(directory, "check.sqlite3"), similarity=0.9)
+    for i, (cached, asked) in enumerate(SAME + DIFFERENT):
+        cache.put(f"{SYSTEM}{i}", cached, f"answer to {cached}")
+    for i, (cached, asked) in enumerate(SAME):
+        assert cache.get(f"{SYSTEM}{i}", asked) == f"answer to {cached}", f"{asked!r} missed {cached!r}"
+    for i, (cached, asked) in enumerate(DIFFERENT, len(SAME)):
+        assert cache.get(f"{SYSTEM}{i}", asked) is None, f"{asked!r} got the answer to {cached!r}"
+
+
+def check_eviction(directory, entries=50):
+    cache = AnswerCache(os.path.join(directory, "evict.sqlite3"), max_entries=entries, similarity=0.9)
+    cache.get(SYSTEM, "build the index")
+    for i in range(entries * 4):
+        cache.put(SYSTEM, f"Question number {i}?", f"Answer {i}")
+    indexed = sum(len(prompts) for prompts in cache._similar[SYSTEM].values())
+    assert indexed == entries, f"{indexed} questions indexed for {entries} cached"
+
+
+def measure(directory, entries, lookups=200):
+    cache = AnswerCache(os.path.join(directory, f"{entries}.sqlite3"), max_entries=entries, similarity=0.9)
+    for i in range(entries):
+        cache.put(SYSTEM, f"Question number {i} about topic {i % 37} in unit {i % 11}?", f"Answer {i}")
+    cache.get(SYSTEM, "warm up the vectors")
+    started = time.perf_counter()
+    for i in range(lookups):
+        cache.get(SYSTEM, f"Question number {i} about topic {i % 37} in unit {i % 11}?")
+    exact = (time.perf_counter() - started) / lookups
+    started = time.perf_counter()
+    for i in range(lookups):
+        cache.get(SYSTEM, f"question number {i}, about the topic {i % 37} in unit {i % 11}")
+    similar = (time.perf_counter() - started) / lookups
+    return exact, similar
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'entries':>8} {'exact':>9} {'similar':>9}")
+        for entries in args.entries:
+            exact, similar = measure(directory, entries)
+            print(f"{entries:>8} {exact * 1000:>7.2f}ms {similar * 1000:>7.2f}ms")
+        check_matches(directory)
+        check_eviction(directory)
+    print(f"\nmatching: ok ({len(SAME)} rewordings hit, {len(DIFFERENT)} changed questions missed)")
+    print("eviction: ok (the similarity index holds only cached questions)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Peak memory and time to pull a few carparks out of the feed: full parse vs. streaming.
+
+    python -m benchmarks.bench_carpark_parse --payload recorded.json --rounds 20
+
+Fetches the feed from a local fake server (serving `--payload` if given,
+else a synthetic payload of `--carparks` entries) and looks up the same
+carparks with `response.json()` plus a scan, and with `stream_lookup`.
+"Early" asks for carparks near the start of the payload, "late" for the
+last ones, which is the streaming parser's worst case.
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+
+import requests
+
+from askme.carparks import CarparkAvailability
+from benchmarks.fake_carparks import serve
+
+
+def full_parse(session, url, numbers):
+    # What get_carpark_availability did before
+    carpark_data = session.get(url, timeout=10).json()['items'][0]['carpark_data']
+    return [c for n in numbers for c in carpark_data if c['carpark_number'] == n][:len(numbers)]
+
+
+def measure(lookup, numbers, rounds):
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        lookup(numbers)
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    lookup(numbers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payload", help="recorded feed JSON to serve")
+    parser.add_argument("--carparks", type=int, default=2000)
+    parser.add_argument("--lookup", type=int, default=3, help="carparks per lookup")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    server = serve(payload=args.payload, carparks=args.carparks, latency=0)
+    session = requests.Session()
+    body = server.current()[0]
+    carpark_data = requests.get(server.url, timeout=10).json()['items'][0]['carpark_data']
+    numbers = [c['carpark_number'] for c in carpark_data]
+    cases = {"early": numbers[:args.lookup], "late": numbers[-args.lookup:]}
+    availability = CarparkAvailability(session, url=server.url)
+
+    print(f"payload: {len(carpark_data)} carparks, {len(body) / 1024:.0f} KB; looking up {args.lookup}")
+    print(f"{'strategy':<22} {'median':>9} {'peak memory':>12}")
+    for case, wanted in cases.items():
+        for name, lookup in (("json() + scan", lambda n: full_parse(session, server.url, n)),
+                             ("stream_lookup", availability.stream_lookup)):
+            elapsed, peak = measure(lookup, wanted, args.rounds)
+            print(f"{name + ' (' + case + ')':<22} {elapsed * 1000:>7.2f}ms {peak / 1024:>9.0f} KB")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Startup and query time of the carpark location index.
+
+    python -m benchmarks.bench_carpark_places --carparks 2200 --radius 500
+
+Indexes `--csv` (the HDB Carpark Information dataset) or, by default, a
+synthetic one of `--carparks` entries, then times: building the index from
+the CSV, opening the memory-mapped index as a later process would, and
+"carparks within `--radius` metres" queries against a linear scan.
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from askme.carpark_places import CarparkPlaces, build_index
+from benchmarks.fake_carparks import synthetic_payload, synthetic_places
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", help="HDB Carpark Information CSV (default: synthetic)")
+    parser.add_argument("--carparks", type=int, default=2200)
+    parser.add_argument("--radius", type=float, default=500.0)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    csv_path = args.csv
+    if not csv_path:
+        csv_path = os.path.join(work, "hdb_carpark_info.csv")
+        numbers = [c["carpark_number"] for c in synthetic_payload(args.carparks)["items"][0]["carpark_data"]]
+        synthetic_places(csv_path, numbers)
+    index_dir = os.path.join(work, "index")
+
+    started = time.perf_counter()
+    build_index(csv_path, index_dir)
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    places = CarparkPlaces(csv_path, index_dir)
+    opened = time.perf_counter() - started
+
+    rng = random.Random(1)
+    points = [(rng.uniform(5000, 45000), rng.uniform(26000, 48000)) for _ in range(args.queries)]
+    xy = [tuple(p) for p in places.xy]
+    grid, scan, found = [], [], 0
+    for x, y in points:
+        started = time.perf_counter()
+        result = places.within(x, y, args.radius)
+        grid.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        expected = [n for n, (px, py) in zip(places.numbers, xy) if math.hypot(px - x, py - y) <= args.radius]
+        scan.append(time.perf_counter() - started)
+        assert sorted(n for n, _ in result) == sorted(expected)
+        found += len(result)
+
+    print(f"{len(places)} carparks: build from CSV {built * 1000:.1f}ms, open index {opened * 1000:.1f}ms")
+    print(f"within {args.radius:.0f} m ({found / args.queries:.1f} carparks on average):")
+    print(f"  grid index   median {statistics.median(grid) * 1000:.3f}ms  max {max(grid) * 1000:.3f}ms")
+    print(f"  linear scan  median {statistics.median(scan) * 1000:.3f}ms  max {max(scan) * 1000:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Requests/sec and latency of the carpark HTTP service under load.
+
+    python -m benchmarks.bench_carpark_service --clients 16 --duration 5
+
+Runs askme.carpark_service against a local fake feed (which changes every
+`--update-interval` seconds) and has `--clients` concurrent dashboards hit
+it for `--duration` seconds each way: plain GETs of /carparks?ids=..., the
+same with If-None-Match revalidation, and revalidating GETs of the full
+feed as the Streamlit apps make when pointed at the service.
+"""
+import argparse
+import statistics
+import threading
+import time
+
+import requests
+import uvicorn
+
+from askme.carpark_service import FEED_PATH, build_app
+from askme.carparks import CarparkAvailability
+from benchmarks.fake_carparks import serve
+
+
+def start_service(availability):
+    server = uvicorn.Server(uvicorn.Config(build_app(availability), host="127.0.0.1", port=0, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    host, port = server.servers[0].sockets[0].getsockname()[:2]
+    return server, f"http://{host}:{port}"
+
+
+def client(url, conditional, until, latencies, statuses):
+    session = requests.Session()
+    etag = None
+    while time.perf_counter() < until:
+        headers = {"If-None-Match": etag} if conditional and etag else {}
+        started = time.perf_counter()
+        response = session.get(url, headers=headers, timeout=10)
+        response.content
+        latencies.append(time.perf_counter() - started)
+        statuses.append(response.status_code)
+        etag = response.headers.get("ETag", etag)
+
+
+def load(url, clients, duration, conditional):
+    latencies, statuses = [], []
+    until = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(url, conditional, until, latencies, statuses))
+               for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    cuts = statistics.quantiles(latencies, n=100)
+    return len(latencies) / duration, cuts[49], cuts[98], statuses.count(304) / len(statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--update-interval", type=float, default=2.0)
+    parser.add_argument("--payload", help="recorded feed JSON for the fake upstream")
+    args = parser.parse_args()
+
+    upstream = serve(payload=args.payload, update_interval=args.update_interval, latency=0.05)
+    availability = CarparkAvailability(requests.Session(), url=upstream.url, max_age=args.update_interval / 2)
+    server, base = start_service(availability)
+
+    print(f"{args.clients} clients, {args.duration:.0f}s each, feed changes every {args.update_interval:.0f}s")
+    print(f"{'scenario':<26} {'req/s':>8} {'p50':>8} {'p99':>8} {'304s':>6}")
+    for name, path, conditional in (("GET /carparks", "/carparks?ids=TM44,T79,TM12", False),
+                                    ("GET /carparks + ETag", "/carparks?ids=TM44,T79,TM12", True),
+                                    ("GET feed + ETag", FEED_PATH, True)):
+        rate, p50, p99, revalidated = load(base + path, args.clients, args.duration, conditional)
+        print(f"{name:<26} {rate:>8.0f} {p50 * 1000:>6.1f}ms {p99 * 1000:>6.1f}ms {revalidated:>6.0%}")
+    print(f"\nupstream: {sum(upstream.calls.values())} requests, {upstream.not_modified} answered 304")
+    server.should_exit = True
+    upstream.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Upstream calls and lookup time for the carpark apps, old vs. snapshot cache.
+
+    python -m benchmarks.bench_carparks --sessions 20 --reruns 10
+
+Simulates `--sessions` users each rerunning the page `--reruns` times
+(every keystroke in the carpark field is a rerun) against a local fake
+feed, and times looking up `--lookup` carparks in one payload.
+"""
+import argparse
+import time
+
+import requests
+
+from askme.carparks import CarparkAvailability, CarparkSnapshot
+from benchmarks.fake_carparks import serve, synthetic_payload
+
+
+def fetch_and_scan(url, numbers):
+    # What get_carpark_availability did on every rerun
+    carpark_data = requests.get(url, timeout=10).json()['items'][0]['carpark_data']
+    return [c for n in numbers for c in carpark_data if c['carpark_number'] == n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--lookup", type=int, default=50, help="carparks per lookup in the scan benchmark")
+    args = parser.parse_args()
+
+    server = serve(latency=0.02)
+    numbers = ['TM44', 'T79', 'TM12']
+
+    started = time.perf_counter()
+    for _ in range(args.sessions * args.reruns):
+        fetch_and_scan(server.url, numbers)
+    old_time, old_calls = time.perf_counter() - started, sum(server.calls.values())
+
+    server.calls.clear()
+    availability = CarparkAvailability(requests.Session(), url=server.url)
+    started = time.perf_counter()
+    for _ in range(args.sessions * args.reruns):
+        availability.snapshot().lookup(numbers)
+    new_time, new_calls = time.perf_counter() - started, sum(server.calls.values())
+    server.shutdown()
+
+    reruns = args.sessions * args.reruns
+    print(f"{'strategy':<16} {'upstream calls':>15} {'per rerun':>10}")
+    print(f"{'fetch + scan':<16} {old_calls:>15} {old_time / reruns * 1000:>8.2f}ms")
+    print(f"{'snapshot cache':<16} {new_calls:>15} {new_time / reruns * 1000:>8.2f}ms")
+
+    payload = synthetic_payload()
+    carpark_data = payload['items'][0]['carpark_data']
+    wanted = [c['carpark_number'] for c in carpark_data[-args.lookup:]]
+    started = time.perf_counter()
+    [c for n in wanted for c in carpark_data if c['carpark_number'] == n]
+    scan = time.perf_counter() - started
+    snapshot = CarparkSnapshot(payload)
+    started = time.perf_counter()
+    snapshot.lookup(wanted)
+    indexed = time.perf_counter() - started
+    print(f"\nlooking up {args.lookup} of {len(carpark_data)} carparks: "
+          f"linear scan {scan * 1000:.2f}ms, index {indexed * 1000:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Per-rerun cost of building clients at module level vs. the shared askme.clients.
+
+    python -m benchmarks.bench_clients --reruns 50
+
+Each simulated rerun gets an OpenAI and an S3 client and makes one OpenAI
+request to a local fake API, the way an app script does on every widget
+interaction. The fake API is plain HTTP, so the TLS handshake a fresh
+client pays against api.openai.com is not included.
+"""
+import argparse
+import logging
+import os
+import statistics
+import time
+import warnings
+
+import boto3
+from openai import OpenAI
+
+from askme.clients import openai_client, s3_client
+from benchmarks.fake_openai import serve
+
+
+def module_level_clients():
+    # What every app did at the top of its script before askme.clients
+    client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    s3 = boto3.client("s3", aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
+                      aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"])
+    return client, s3
+
+
+def shared_clients():
+    return openai_client(), s3_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=50)
+    args = parser.parse_args()
+
+    # st.cache_resource outside `streamlit run` logs a warning on every call
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+    warnings.simplefilter("ignore")
+    server = serve(latency=0.0)
+    os.environ.update(OPENAI_BASE_URL=server.url, OPENAI_API_KEY="bench",
+                      AWS_ACCESS_KEY_ID="bench", AWS_SECRET_ACCESS_KEY="bench")
+
+    print(f"{'clients':<14} {'first rerun':>12} {'rerun p50':>10} {'rerun p95':>10}")
+    for name, build in (("module-level", module_level_clients), ("askme.clients", shared_clients)):
+        timings = []
+        for _ in range(args.reruns):
+            started = time.perf_counter()
+            client, s3 = build()
+            client.beta.assistants.retrieve("asst_bench")
+            timings.append(time.perf_counter() - started)
+        rest = sorted(timings[1:])
+        print(
+            f"{name:<14} {timings[0] * 1000:>10.1f}ms {statistics.median(rest) * 1000:>8.1f}ms "
+            f"{rest[int(len(rest) * 0.95)] * 1000:>8.1f}ms"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
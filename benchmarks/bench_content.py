@@ -0,0 +1,131 @@
+"""Fuzz and time the assistant's content normaliser against the old preprocess_response.
+
+    python -m benchmarks.bench_content --fuzz 2000 --blocks 1 50 500
+
+Uses the Assistants message payloads in benchmarks/data/assistant_messages.json
+(text with file citations, display and inline math, escaped dollars and an
+image block).
+
+Fuzzing mutates those payloads at random (stray backslashes and dollars,
+literal "\\n", unicode, overlapping or stale citation indices) and checks
+that normalise_content never raises, never changes the math, never doubles
+a backslash and resolves each cited file at most once.
+
+The benchmark times both implementations on messages of `--blocks` content
+blocks.
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import time
+
+from askme.content import CitationResolver, normalise_content
+from askme.latex import segments
+
+PAYLOADS = os.path.join(os.path.dirname(__file__), "data", "assistant_messages.json")
+NOISE = ["\\", "$", "$$", "\\n", "\\(", "\\)", "\\[", "\\]", "\\$", "【9:9†source】", "é", "∑", " ", "\n", "{", "}"]
+
+
+def old_preprocess_response(response):
+    # What assistant.py did before
+    processed_response = ""
+    if isinstance(response, list):
+        for item in response:
+            if isinstance(item, dict) and 'text' in item:
+                processed_response += item['text']['value'].replace('\\n', '\n').replace('\\', '\\\\')
+            elif hasattr(item, 'text') and hasattr(item.text, 'value'):
+                processed_response += item.text.value.replace('\\n', '\n').replace('\\', '\\\\')
+    elif isinstance(response, dict) and 'text' in response:
+        processed_response = response['text']['value'].replace('\\n', '\n').replace('\\', '\\\\')
+    return processed_response
+
+
+class _Files:
+    # Stands in for client.files, counting lookups per file id
+    def __init__(self):
+        self.lookups = {}
+
+    def retrieve(self, file_id):
+        self.lookups[file_id] = self.lookups.get(file_id, 0) + 1
+        return type("File", (), {"filename": f"{file_id}.pdf"})()
+
+
+def _math(text):
+    return [body for kind, body in segments(text) if kind != "text"]
+
+
+def mutate(rng, content):
+    content = copy.deepcopy(content)
+    for block in content:
+        if block.get("type") != "text":
+            continue
+        value = block["text"]["value"]
+        for _ in range(rng.randint(0, 6)):
+            at = rng.randint(0, len(value))
+            value = value[:at] + rng.choice(NOISE) + value[at:]
+        block["text"]["value"] = value
+        for annotation in block["text"]["annotations"]:
+            if rng.random() < 0.3:
+                annotation["start_index"] = rng.randint(0, len(value))
+                annotation["end_index"] = annotation["start_index"] + rng.randint(0, 20)
+    return content
+
+
+def fuzz(payloads, rounds, seed=0):
+    rng = random.Random(seed)
+    for i in range(rounds):
+        content = mutate(rng, rng.choice(payloads)["content"])
+        files = _Files()
+        resolver = CitationResolver(type("Client", (), {"files": files})())
+        try:
+            out = normalise_content(content, resolver)
+            normalise_content(content, resolver)
+        except Exception as e:
+            raise AssertionError(f"round {i}: {e!r} on {content!r}") from e
+        plain = [b for b in content if b.get("type") == "text" and not b["text"]["annotations"]]
+        if len(plain) == len(content) == 1:
+            source = plain[0]["text"]["value"]
+            assert _math(out) == _math(source), f"round {i}: math changed in {content!r}"
+            assert out.count("\\") == source.count("\\") - (source.count("\\n") - out.count("\\n")), \
+                f"round {i}: backslashes changed in {content!r}"
+        assert all(n == 1 for n in files.lookups.values()), f"round {i}: a file was looked up twice"
+    return rounds
+
+
+def timed(fn, content, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(content)
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", default=PAYLOADS)
+    parser.add_argument("--fuzz", type=int, default=2000)
+    parser.add_argument("--blocks", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with open(args.payloads) as f:
+        payloads = json.load(f)
+    print(f"fuzz: {fuzz(payloads, args.fuzz)} mutated payloads normalised without a failure")
+
+    blocks = [b for p in payloads for b in p["content"] if b["type"] == "text" and not b["text"]["annotations"]]
+    resolver = CitationResolver(type("Client", (), {"files": _Files()})())
+    print(f"\n{'blocks':>7} {'old':>10} {'new':>10}")
+    for count in args.blocks:
+        content = [blocks[i % len(blocks)] for i in range(count)]
+        old = timed(old_preprocess_response, content, args.repeat)
+        new = timed(lambda c: normalise_content(c, resolver), content, args.repeat)
+        print(f"{count:>7} {old * 1e6:>8.0f}us {new * 1e6:>8.0f}us")
+
+    example = payloads[2]["content"]
+    print("\nold:", old_preprocess_response(example)[-60:])
+    print("new:", normalise_content(example)[-60:])
+
+
+if __name__ == "__main__":
+    main()
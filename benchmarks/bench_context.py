@@ -0,0 +1,63 @@
+"""Prompt tokens and fit time of askme.context.ContextWindow as a conversation grows.
+
+    python -m benchmarks.bench_context --turns 40 --budget 1000
+
+Plays a conversation of `--turns` questions and answers through a
+ContextWindow, with older turns left out and with them summarised by a
+local stand-in for openai_summariser, and prints the prompt tokens sent,
+the turns summarised and the time `fit` takes per turn. Checks that the
+prompt stays within the budget, summary included, and that each turn only
+summarises the turns dropped since the last summary.
+"""
+import argparse
+import time
+
+from askme.context import ContextWindow
+
+QUESTION = "Why does the current in the coil fall to zero more slowly when the iron core is left in? "
+ANSWER = "Think about what the changing magnetic flux does in the coil itself. What does Lenz's law say? " * 3
+
+
+def summariser(calls):
+    def summarise(dropped, previous=None):
+        calls.append(len(dropped))
+        return (previous or "") + f" {len(dropped)} more messages about coils and cores." * 3
+
+    return summarise
+
+
+def play(window, turns):
+    messages = [{"role": "system", "content": "Speak like a physics teacher. Ask one question at a time."}]
+    tokens, seconds = [], 0.0
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"{QUESTION}({turn})"})
+        started = time.perf_counter()
+        _, usage = window.fit(messages)
+        seconds += time.perf_counter() - started
+        tokens.append(usage["prompt_tokens"])
+        messages.append({"role": "assistant", "content": ANSWER})
+    return tokens, usage["dropped"], seconds / turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--budget", type=int, default=1000)
+    args = parser.parse_args()
+
+    calls = []
+    print(f"{'':>10} {'last prompt':>12} {'largest':>8} {'summarised':>11} {'fit':>8}")
+    for name, window in (("dropped", ContextWindow(budget=args.budget)),
+                         ("summarised", ContextWindow(budget=args.budget, summarise=summariser(calls),
+                                                      summary_tokens=120))):
+        tokens, dropped, per_turn = play(window, args.turns)
+        assert max(tokens) <= args.budget, f"{name}: {max(tokens)} prompt tokens over a {args.budget} budget"
+        summarised = f"{sum(calls)} in {len(calls)}" if window.summarise else "-"
+        print(f"{name:>10} {tokens[-1]:>12} {max(tokens):>8} {summarised:>11} {per_turn * 1000:>6.2f}ms")
+    # Each message is summarised once, as it falls out of the window
+    assert sum(calls) == dropped, (calls, dropped)
+    print(f"\nbudget: ok (every prompt within {args.budget} tokens, each dropped message summarised once)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Rerun time of drawing the chat history against its length, per-turn vs. incremental.
+
+    python -m benchmarks.bench_history --lengths 10 50 200
+
+Runs a page holding a conversation of N messages through Streamlit's
+AppTest and times a rerun when every message is drawn as its own chat
+bubble (what the apps did) and when askme.chat_view.render_history draws
+finished turns as one cached block.
+"""
+import argparse
+import statistics
+import time
+
+from streamlit.testing.v1 import AppTest
+
+REPLY = ("The activity is $A = \\lambda N$, where $\\lambda$ is the decay constant. "
+         "Integrating gives $N = N_0 e^{-\\lambda t}$, so the half-life is $\\ln 2 / \\lambda$.")
+
+
+def page(length, incremental, reply):
+    import streamlit as st
+
+    from askme.chat_view import draw_chat_message, render_history
+
+    if "messages" not in st.session_state:
+        st.session_state.messages = [
+            {"role": "user", "content": f"Question {i}?"} if i % 2 == 0 else
+            {"role": "assistant", "content": reply, "usage": {"prompt_tokens": 100 + i, "reply_tokens": 40,
+                                                               "dropped": 0, "summarised": False}}
+            for i in range(length)
+        ]
+    if incremental:
+        render_history(st.session_state.messages)
+    else:
+        for message in st.session_state.messages:
+            draw_chat_message(message)
+    st.chat_input("What is up?")
+
+
+def measure(length, incremental, reruns):
+    at = AppTest.from_function(page, kwargs={"length": length, "incremental": incremental, "reply": REPLY},
+                               default_timeout=120)
+    at.run()
+    times = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--reruns", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'messages':>9} {'per turn':>10} {'incremental':>12}")
+    for length in args.lengths:
+        old = measure(length, False, args.reruns)
+        new = measure(length, True, args.reruns)
+        print(f"{length:>9} {old * 1000:>8.1f}ms {new * 1000:>10.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
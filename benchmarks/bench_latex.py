@@ -0,0 +1,72 @@
+"""Rerun time of the assistant's conversation rendering against history length.
+
+    python -m benchmarks.bench_latex --lengths 10 50 200
+
+Runs a page that draws a conversation of N assistant answers (each with
+inline and display math, like the nuclear physics assistant's) through
+Streamlit's AppTest, once with the old per-fragment `render_message` and
+once with the tokenizer's single markdown block, and reports the median
+rerun time and the number of elements drawn.
+"""
+import argparse
+import statistics
+import time
+
+from streamlit.testing.v1 import AppTest
+
+ANSWER = (
+    "The activity is $A = \\lambda N$, where $\\lambda$ is the decay constant and $N$ the number of "
+    "undecayed nuclei. Integrating gives\n\n$$N = N_0 e^{-\\lambda t}$$\n\nso the half-life is "
+    "\\(t_{1/2} = \\ln 2 / \\lambda\\). A sample costing \\$5 with $N_0 = 10^{20}$ nuclei..."
+)
+
+
+def page(answers, new):
+    import re
+
+    import streamlit as st
+
+    from askme.latex import to_markdown
+
+    def render_old(message):
+        # What render_message did: one element per fragment, re-split every rerun
+        for part in re.split(r'(\$.*?\$)', str(message)):
+            if part.startswith('$') and part.endswith('$'):
+                st.latex(part[1:-1].strip())
+            else:
+                st.markdown(part)
+
+    for message in answers:
+        if new:
+            st.markdown(to_markdown(message))
+        else:
+            render_old(message)
+
+
+def measure(length, new, reruns):
+    answers = [f"{ANSWER} ({i})" for i in range(length)]
+    at = AppTest.from_function(page, kwargs={"answers": answers, "new": new}, default_timeout=120)
+    at.run()
+    times = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), len(at.markdown) + len(at.latex)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--reruns", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'answers':>8} {'old rerun':>10} {'elements':>9} {'new rerun':>10} {'elements':>9}")
+    for length in args.lengths:
+        old, old_elements = measure(length, False, args.reruns)
+        new, new_elements = measure(length, True, args.reruns)
+        print(f"{length:>8} {old * 1000:>8.1f}ms {old_elements:>9} {new * 1000:>8.1f}ms {new_elements:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""A class asking at once against a rate-limited API, with and without the shared limiter.
+
+    python -m benchmarks.bench_ratelimit --sessions 40 --questions 3 --rpm 30 --minute 6
+
+Starts the fake OpenAI server with a requests-per-minute limit (and a
+`--minute` shortened so the run takes seconds) and has `--sessions`
+students each ask `--questions` questions back to back, all starting
+together, streaming every answer.
+
+"direct" is what the apps did: each session calls the API on its own,
+with the SDK's default retries. "limiter" sends every request through one
+askme.ratelimit.RateLimiter. Reported: answers that failed, 429s the
+server sent, answer latency percentiles and the gap between the first and
+last session to finish (how fairly the wait was shared).
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from openai import OpenAI
+
+from askme.ratelimit import RateLimiter
+from benchmarks.fake_openai import serve
+
+MESSAGES = [{"role": "user", "content": "What is the rate of decay?"}]
+
+
+def ask_direct(client, limiter, session):
+    stream = client.chat.completions.create(model="gpt-3.5-turbo", messages=MESSAGES, stream=True)
+    return "".join(chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
+
+
+def ask_limited(client, limiter, session):
+    with limiter.slot(session, 100) as slot:
+        stream = slot.call(lambda: client.chat.completions.with_raw_response.create(
+            model="gpt-3.5-turbo", messages=MESSAGES, stream=True))
+        return "".join(chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
+
+
+def run(server, ask, client, limiter, sessions, questions):
+    latencies, failures, finished = [], [], {}
+    lock = threading.Lock()
+    start = threading.Barrier(sessions)
+
+    def student(i):
+        start.wait()
+        for _ in range(questions):
+            started = time.perf_counter()
+            try:
+                ask(client, limiter, f"session-{i}")
+            except Exception as e:
+                with lock:
+                    failures.append(type(e).__name__)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+        with lock:
+            finished[i] = time.perf_counter()
+
+    server.reset_calls()
+    threads = [threading.Thread(target=student, args=(i,)) for i in range(sessions)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "failed": len(failures),
+        "429s": server.rejected,
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p95": statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else float("nan"),
+        "max": max(latencies, default=float("nan")),
+        "spread": max(finished.values()) - min(finished.values()),
+        "total": time.perf_counter() - began,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--questions", type=int, default=3)
+    parser.add_argument("--rpm", type=int, default=30)
+    parser.add_argument("--minute", type=float, default=6.0)
+    args = parser.parse_args()
+
+    print(f"{'':>8} {'failed':>7} {'429s':>6} {'p50':>7} {'p95':>7} {'max':>7} {'spread':>7} {'total':>7}")
+    for name, ask, retries in (("direct", ask_direct, 2), ("limiter", ask_limited, 0)):
+        # A fresh server each time, so both start with a full budget
+        server = serve(latency=0.01, first_token=0.1, requests_per_minute=args.rpm, minute=args.minute)
+        client = OpenAI(base_url=server.url, api_key="x", max_retries=retries)
+        result = run(server, ask, client, RateLimiter(max_concurrent=64), args.sessions, args.questions)
+        server.shutdown()
+        print(f"{name:>8} {result['failed']:>7} {result['429s']:>6} {result['p50']:>6.1f}s {result['p95']:>6.1f}s "
+              f"{result['max']:>6.1f}s {result['spread']:>6.1f}s {result['total']:>6.1f}s")
+
+
+if __name__ == "__main__":
+    main()
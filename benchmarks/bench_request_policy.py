@@ -0,0 +1,210 @@
+"""Tail latency of streamed answers from an upstream that sometimes stalls, with and without a RequestPolicy.
+
+    python -m benchmarks.bench_request_policy --requests 100 --stall-rate 0.1
+
+The fake OpenAI server stalls `--stall-rate` of the streams for
+`--stall-seconds` before their first token. `--requests` answers are
+streamed, `--concurrency` at a time:
+
+  plain      the stream as the tutors read it before, with no deadline
+  retry      askme.request_policy.RequestPolicy with a `--first-token`
+             deadline and one retry
+  hedged     the same plus a hedged request after `--hedge-after` seconds
+
+Then checks that a stall before the response headers is retried within
+the first-token deadline, that a stall after the first tokens ends the
+answer with StreamTimeout, that a hedge failing doesn't fail the answer, that the
+circuit breaker opens after repeated failures and closes again once the
+API answers, and that a half-open trial hung up early lets the next
+request through.
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from openai import OpenAI
+
+from askme.context import delta_text
+from askme.request_policy import CircuitBreaker, CircuitOpenError, RequestPolicy, StreamTimeout
+from benchmarks.fake_openai import serve
+
+MESSAGES = [{"role": "user", "content": "Why is a soft iron core used in an electromagnet?"}]
+
+
+def open_stream(client):
+    return client.chat.completions.create(model="gpt-3.5-turbo", messages=MESSAGES, stream=True)
+
+
+def answer(client, policy):
+    # Seconds to the first text and to the whole answer
+    started = time.perf_counter()
+    chunks = open_stream(client) if policy is None else policy.stream(
+        lambda: open_stream(client), hedge=(lambda: open_stream(client)) if policy.hedge_after else None)
+    first = None
+    try:
+        for _ in delta_text(chunks):
+            first = first or time.perf_counter()
+    finally:
+        chunks.close()
+    return first - started, time.perf_counter() - started
+
+
+def run(server, client, policy, requests, concurrency):
+    server.reset_calls()
+    server.random.seed(0)
+    first_tokens, totals, failures = [], [], []
+    lock = threading.Lock()
+    pending = iter(range(requests))
+
+    def worker():
+        for _ in pending:
+            try:
+                first, total = answer(client, policy)
+            except Exception as e:
+                with lock:
+                    failures.append(type(e).__name__)
+                continue
+            with lock:
+                first_tokens.append(first)
+                totals.append(total)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    percentiles = statistics.quantiles(first_tokens, n=100)
+    return {
+        "ttft_p50": percentiles[49],
+        "ttft_p95": percentiles[94],
+        "ttft_p99": percentiles[98],
+        "total_max": max(totals),
+        "failures": len(failures),
+        "upstream": server.calls["POST /chat/completions"],
+        "stalled": server.stalled,
+    }
+
+
+def check_stall_before_headers(server, client):
+    server.reset_calls()
+    server.stall_rate, server.stall_headers = 1.0, True
+    policy = RequestPolicy(first_token=0.5, retries=1)
+    started = time.perf_counter()
+    try:
+        chunks = policy.stream(lambda: open_stream(client))
+        assert time.perf_counter() - started < 0.1, "stream() waited for the response headers"
+        # The first copy hangs before its headers; the retry gets through
+        while not server.stalled:
+            time.sleep(0.01)
+        server.stall_rate = 0.0
+        assert "".join(delta_text(chunks))
+    finally:
+        server.stall_rate, server.stall_headers = 0.0, False
+    assert time.perf_counter() - started < server.stall_seconds, "the first-token deadline missed the stall"
+    assert policy.counts["timed_out"] == 1 and policy.counts["retried"] == 1, policy.counts
+
+
+def check_mid_stream_stall(server, client):
+    server.stall_rate, server.stall_after = 1.0, 5
+    policy = RequestPolicy(first_token=2.0, stall=0.5)
+    texts = []
+    try:
+        for text in delta_text(policy.stream(lambda: open_stream(client))):
+            texts.append(text)
+    except StreamTimeout:
+        assert len(texts) == 5, texts
+    else:
+        raise AssertionError("a stalled answer ran to the end")
+    finally:
+        server.stall_rate, server.stall_after = 0.0, 0
+
+
+def check_hedge_failure(server, client):
+    stall_seconds = server.stall_seconds
+    server.stall_rate, server.stall_seconds = 1.0, 0.5
+
+    def hedge():
+        raise ValueError("the hedge was refused")
+
+    try:
+        policy = RequestPolicy(first_token=2.0, retries=0, hedge_after=0.1)
+        assert "".join(delta_text(policy.stream(lambda: open_stream(client), hedge=hedge)))
+    finally:
+        server.stall_rate, server.stall_seconds = 0.0, stall_seconds
+
+
+def check_abandoned_trial(server, client):
+    breaker = CircuitBreaker(failures=1, reset_after=0.2)
+    policy = RequestPolicy(first_token=2.0, retries=0, breaker=breaker)
+    breaker.failure()
+    time.sleep(0.3)
+    # The trial request is hung up before it answers, as on a rerun
+    policy.stream(lambda: open_stream(client)).close()
+    assert not breaker.trial
+    assert "".join(delta_text(policy.stream(lambda: open_stream(client))))
+    assert breaker.state == "closed"
+
+
+def check_breaker(server, client):
+    breaker = CircuitBreaker(failures=3, reset_after=0.5)
+    policy = RequestPolicy(first_token=1.0, retries=0, breaker=breaker)
+    server.stall_rate = 1.0
+    for _ in range(3):
+        try:
+            list(policy.stream(lambda: open_stream(client)))
+        except StreamTimeout:
+            pass
+    server.reset_calls()
+    try:
+        policy.stream(lambda: open_stream(client))
+    except CircuitOpenError:
+        pass
+    else:
+        raise AssertionError("the breaker let a request through while open")
+    assert server.calls["POST /chat/completions"] == 0
+    server.stall_rate = 0.0
+    time.sleep(0.6)
+    assert "".join(delta_text(policy.stream(lambda: open_stream(client))))
+    assert breaker.state == "closed"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--stall-rate", type=float, default=0.1)
+    parser.add_argument("--stall-seconds", type=float, default=8.0)
+    parser.add_argument("--first-token", type=float, default=2.0)
+    parser.add_argument("--hedge-after", type=float, default=0.8)
+    args = parser.parse_args()
+
+    server = serve(latency=0.01, first_token=0.3, token_rate=200.0, stall_rate=args.stall_rate,
+                   stall_seconds=args.stall_seconds)
+    client = OpenAI(base_url=server.url, api_key="x", max_retries=0)
+
+    policies = (
+        ("plain", None),
+        ("retry", RequestPolicy(first_token=args.first_token, retries=1)),
+        ("hedged", RequestPolicy(first_token=args.first_token, retries=1, hedge_after=args.hedge_after)),
+    )
+    print(f"{'':>8} {'ttft p50':>9} {'p95':>7} {'p99':>7} {'slowest':>8} {'failed':>7} {'upstream':>9} {'stalled':>8}")
+    for name, policy in policies:
+        r = run(server, client, policy, args.requests, args.concurrency)
+        print(f"{name:>8} {r['ttft_p50']:>8.2f}s {r['ttft_p95']:>6.2f}s {r['ttft_p99']:>6.2f}s "
+              f"{r['total_max']:>7.2f}s {r['failures']:>7} {r['upstream']:>9} {r['stalled']:>8}")
+
+    check_stall_before_headers(server, client)
+    print("\nstall before headers: ok (timed out and retried within the first-token deadline)")
+    check_mid_stream_stall(server, client)
+    print("mid-stream stall: ok (ends with StreamTimeout after the text already sent)")
+    check_hedge_failure(server, client)
+    print("hedge failure: ok (the first copy still answers)")
+    check_breaker(server, client)
+    print("circuit breaker: ok (opens after 3 timeouts, closes on the next answer)")
+    check_abandoned_trial(server, client)
+    print("abandoned trial: ok (the next request is let through)")
+
+
+if __name__ == "__main__":
+    main()
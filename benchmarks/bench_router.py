@@ -0,0 +1,84 @@
+"""How askme.router routes typical questions, and what a router log says about each route.
+
+    python -m benchmarks.bench_router
+    python -m benchmarks.bench_router --log routes.jsonl
+
+Without `--log`, routes a fixed set of student questions (openers,
+Socratic follow-ups, derivations, picture questions) with the [router]
+settings in tutors.toml and prints each decision, the share of turns per
+route and the time a decision takes. With `--log`, summarises a file the
+tutors wrote with $ROUTER_LOG set: turns, first-token and answer latency
+and cost per route and reason, to tune the thresholds from real traffic.
+"""
+import argparse
+import collections
+import json
+import statistics
+import time
+
+from askme.router import turn_features
+from askme.tutors import DEFAULT_MODEL, load_router
+
+# (question, earlier questions in the chat, the tutor was told about a picture)
+QUESTIONS = [
+    ("What is inertia?", 0, False),
+    ("why?", 1, False),
+    ("Can you give me an example?", 2, False),
+    ("So is friction a force?", 3, False),
+    ("What happens if the mass doubles?", 2, False),
+    ("Derive the period of a simple pendulum, $T = 2\\pi\\sqrt{l/g}$", 0, False),
+    ("Calculate the speed of a 2 kg ball dropped from 5 m, ignoring air resistance", 0, False),
+    ("How long does it take to fall 20 m?", 1, False),
+    ("Show that the kinetic energy is 1/2 m v^2 from the work done", 1, False),
+    ("A 1200 kg car accelerates from rest to 25 m/s in 8 s. Find the resultant force, the distance travelled "
+     "and the average power, and explain which assumptions you made about friction and air resistance at each "
+     "step so I can check my working against the mark scheme.", 0, False),
+    ("Image 3 is wrong because the cart should pull the horse", 0, True),
+    ("And image 4?", 1, True),
+    ("I think heavier objects fall faster", 0, False),
+    ("ok", 4, False),
+]
+
+
+def route_questions(router):
+    reasons = collections.Counter()
+    print(f"{'route':<7} {'reason':<15} question")
+    for question, history, picture in QUESTIONS:
+        route = router.choose(DEFAULT_MODEL, turn_features(question, history, picture))
+        reasons[route.name] += 1
+        print(f"{route.name:<7} {route.reason:<15} {question[:70]}")
+    print("\n" + ", ".join(f"{name} {count / len(QUESTIONS):.0%}" for name, count in sorted(reasons.items())))
+
+    started = time.perf_counter()
+    for _ in range(100):
+        for question, history, picture in QUESTIONS:
+            router.choose(DEFAULT_MODEL, turn_features(question, history, picture))
+    print(f"decision: {(time.perf_counter() - started) / (100 * len(QUESTIONS)) * 1e6:.0f}us per turn")
+
+
+def summarise(path):
+    groups = collections.defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            groups[(record["route"], record["reason"], record["model"])].append(record)
+    print(f"{'route':<7} {'reason':<15} {'model':<16} {'turns':>6} {'first token':>12} {'answer':>8} {'$/turn':>9}")
+    for (name, reason, model), records in sorted(groups.items()):
+        print(f"{name:<7} {reason:<15} {model:<16} {len(records):>6} "
+              f"{statistics.mean(r['first_token'] for r in records):>11.2f}s "
+              f"{statistics.mean(r['seconds'] for r in records):>7.2f}s "
+              f"{statistics.mean(r['cost'] for r in records):>9.5f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", help="a $ROUTER_LOG file to summarise")
+    args = parser.parse_args()
+    if args.log:
+        summarise(args.log)
+    else:
+        route_questions(load_router())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Compare ways of waiting for an Assistants run against a local fake API.
+
+    python -m benchmarks.bench_runs --answers 20 --first-token 0.4
+
+Reports time-to-first-token (when the first piece of the answer could be
+shown) and upstream calls per answer for the old fixed 0.5s poll, the
+backoff poller and the streaming driver.
+"""
+import argparse
+import statistics
+import time
+
+from openai import OpenAI
+
+from askme.runs import poll_run, run_assistant
+from benchmarks.fake_openai import serve
+
+
+def fixed_poll(client, thread_id, assistant_id):
+    # The loop the apps used before askme.runs
+    run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+    while run.status == "queued" or run.status == "in_progress":
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+        time.sleep(0.5)
+    return run
+
+
+def backoff_poll(client, thread_id, assistant_id):
+    run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+    return poll_run(client, thread_id, run)
+
+
+def answer(client, thread_id, strategy):
+    started = time.perf_counter()
+    first = []
+    message = client.beta.threads.messages.create(thread_id=thread_id, role="user", content="define rate of decay")
+    if strategy == "stream":
+        run_assistant(client, thread_id, "asst_bench", on_delta=lambda text: first or first.append(time.perf_counter()))
+    else:
+        STRATEGIES[strategy](client, thread_id, "asst_bench")
+    messages = client.beta.threads.messages.list(thread_id=thread_id, order="asc", after=message.id)
+    done = time.perf_counter()
+    assert messages.data, "run finished without an answer"
+    return (first[0] if first else done) - started, done - started
+
+
+STRATEGIES = {"fixed-0.5s": fixed_poll, "backoff": backoff_poll, "stream": None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--answers", type=int, default=10)
+    parser.add_argument("--first-token", type=float, default=0.4, help="fake model thinking time in seconds")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="fake model tokens per second")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake network latency per request")
+    args = parser.parse_args()
+
+    server = serve(latency=args.latency, first_token=args.first_token, token_rate=args.token_rate)
+    client = OpenAI(base_url=server.url, api_key="bench", max_retries=0)
+    print(f"{'strategy':<12} {'ttft p50':>9} {'ttft max':>9} {'total p50':>10} {'calls/answer':>13}")
+    for strategy in STRATEGIES:
+        thread = client.beta.threads.create()
+        server.reset_calls()
+        ttfts, totals = [], []
+        for _ in range(args.answers):
+            ttft, total = answer(client, thread.id, strategy)
+            ttfts.append(ttft)
+            totals.append(total)
+        calls = sum(server.calls.values()) / args.answers
+        print(
+            f"{strategy:<12} {statistics.median(ttfts) * 1000:>7.0f}ms {max(ttfts) * 1000:>7.0f}ms "
+            f"{statistics.median(totals) * 1000:>8.0f}ms {calls:>13.1f}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Upstream calls and answer latency for a burst of identical questions, with and without coalescing.
+
+    python -m benchmarks.bench_singleflight --sessions 40 --unique 3
+
+`--sessions` students ask within `--spread` seconds of each other, drawing
+their question from `--unique` distinct prompts (a projected question most
+of them copy). Each answer is streamed from the fake OpenAI server, either
+on its own ("separate", what the tutors did) or through
+askme.singleflight.SingleFlight ("coalesced"), which shares one stream
+between identical requests in flight.
+
+Also checks that a reader leaving early doesn't stop the others, and that
+the upstream is hung up once every reader has left, even one that never
+started reading.
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from openai import OpenAI
+
+from askme.context import delta_text
+from askme.singleflight import SingleFlight
+from benchmarks.fake_openai import serve
+
+
+def open_stream(client, prompt):
+    return delta_text(client.chat.completions.create(
+        model="gpt-3.5-turbo", messages=[{"role": "user", "content": prompt}], stream=True))
+
+
+def run(server, client, flights, prompts, sessions, spread, seed=0):
+    rng = random.Random(seed)
+    arrivals = sorted((rng.uniform(0, spread), rng.choice(prompts)) for _ in range(sessions))
+    first_tokens, totals, answers = [], [], set()
+    lock = threading.Lock()
+    began = time.perf_counter()
+
+    def student(at, prompt):
+        time.sleep(max(at - (time.perf_counter() - began), 0))
+        started = time.perf_counter()
+        if flights is None:
+            texts = open_stream(client, prompt)
+        else:
+            texts, _ = flights.stream(prompt, lambda: open_stream(client, prompt))
+        first, parts = None, []
+        for text in texts:
+            first = first or time.perf_counter()
+            parts.append(text)
+        with lock:
+            first_tokens.append(first - started)
+            totals.append(time.perf_counter() - started)
+            answers.add("".join(parts))
+
+    server.reset_calls()
+    threads = [threading.Thread(target=student, args=arrival) for arrival in arrivals]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The fake gives every prompt the same answer, so anything else is a cut-off stream
+    assert len(answers) == 1, "a reader got a partial answer"
+    return {
+        "upstream": server.calls["POST /chat/completions"],
+        "ttft_p50": statistics.median(first_tokens),
+        "ttft_p95": statistics.quantiles(first_tokens, n=20)[-1],
+        "total_p95": statistics.quantiles(totals, n=20)[-1],
+    }
+
+
+def check_cancellation(server, client):
+    flights = SingleFlight()
+    server.reset_calls()
+    first, _ = flights.stream("q", lambda: open_stream(client, "q"))
+    second, shared = flights.stream("q", lambda: open_stream(client, "q"))
+    assert shared
+    next(first)
+    first.close()
+    rest = "".join(second)
+    assert rest and flights.stats()["in_flight"] == 0, "a reader leaving stopped the others"
+
+    third, _ = flights.stream("r", lambda: open_stream(client, "r"))
+    next(third)
+    third.close()
+    time.sleep(0.2)
+    assert flights.stats()["in_flight"] == 0, "the upstream was kept open with nobody reading"
+
+    # A page stopped before it started reading must still hang up
+    fourth, _ = flights.stream("s", lambda: open_stream(client, "s"))
+    fourth.close()
+    assert flights.stats()["in_flight"] == 0, "a reader closed before reading kept the upstream open"
+    return server.calls["POST /chat/completions"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--unique", type=int, default=3)
+    parser.add_argument("--spread", type=float, default=2.0)
+    args = parser.parse_args()
+
+    # Slow enough to first token that a burst overlaps, like the real API under load
+    server = serve(latency=0.01, first_token=1.0, token_rate=100.0)
+    client = OpenAI(base_url=server.url, api_key="x")
+    prompts = [f"Why is a soft iron core used in an electromagnet? ({i})" for i in range(args.unique)]
+
+    print(f"{'':>10} {'upstream':>9} {'ttft p50':>9} {'ttft p95':>9} {'total p95':>10}")
+    for name, flights in (("separate", None), ("coalesced", SingleFlight())):
+        result = run(server, client, flights, prompts, args.sessions, args.spread)
+        print(f"{name:>10} {result['upstream']:>9} {result['ttft_p50']:>8.2f}s {result['ttft_p95']:>8.2f}s "
+              f"{result['total_p95']:>9.2f}s")
+    print(f"\ncancellation: ok ({check_cancellation(server, client)} upstream calls for 4 readers)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Cost of askme.tracing spans on a hot path, at different sampling rates.
+
+    python -m benchmarks.bench_tracing --calls 200000
+
+Times `--calls` calls of a trivial function bare, and wrapped in
+`@traced` with $ASKME_TRACE_SAMPLE at 0, 0.01 and 1, with and without the
+JSONL span file, from `--threads` threads at once. Then checks /metrics
+serves what was recorded.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+
+from askme.tracing import Tracer, serve_metrics
+
+
+def work(x):
+    return x + 1
+
+
+def timed(function, calls, threads):
+    def loop():
+        for i in range(calls // threads):
+            function(i)
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - started) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    bare = timed(work, args.calls, args.threads)
+    print(f"{'':>22} {'per call':>9} {'overhead':>9}")
+    print(f"{'bare':>22} {bare * 1e6:>7.2f}us")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, sample, path in (("sample 0", 0.0, None), ("sample 0.01", 0.01, None), ("sample 1", 1.0, None),
+                                   ("sample 1 + JSONL file", 1.0, os.path.join(directory, "spans.jsonl"))):
+            tracer = Tracer(sample=sample, path=path)
+            per_call = timed(tracer.traced("bench.work")(work), args.calls, args.threads)
+            tracer.close()
+            print(f"{name:>22} {per_call * 1e6:>7.2f}us {(per_call - bare) * 1e6:>7.2f}us")
+
+    tracer = Tracer()
+    for seconds in (0.002, 0.02, 0.3, 4.0):
+        tracer.observe("bench.stage", seconds)
+    server = serve_metrics(0, source=tracer)
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+        text = response.read().decode()
+    server.shutdown()
+    assert 'askme_stage_seconds_count{stage="bench.stage"} 4' in text
+    assert 'askme_stage_seconds_bucket{stage="bench.stage",le="0.5"} 3' in text
+    print(f"\n/metrics: ok ({len(text.splitlines())} lines)")
+
+
+if __name__ == "__main__":
+    main()
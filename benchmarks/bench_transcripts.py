@@ -0,0 +1,85 @@
+"""Bytes uploaded per conversation: whole-CSV rewrites vs. append-only segments.
+
+    python -m benchmarks.bench_transcripts --turns 30
+
+Runs against moto's in-process S3, so no AWS credentials are needed. Then
+checks that a session reaped while idle and carried on afterwards keeps
+its whole transcript in one object.
+"""
+import argparse
+import csv
+import io
+import json
+import time
+
+import boto3
+from moto import mock_aws
+
+from askme.transcripts import TranscriptStore
+
+REPLY = "What happens to the magnetic domains in soft iron when the current is switched off? " * 4
+
+
+def rewrite_csv(s3, messages):
+    # What save_messages_to_csv_and_upload did every turn, minus the local file
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for message in messages:
+        writer.writerow([message["role"], message["content"]])
+    body = buffer.getvalue().encode("utf-8")
+    s3.put_object(Bucket="askphysics", Key=f"conversation_history_{len(messages)}.csv", Body=body)
+    return len(body)
+
+
+def check_reaped_session(s3):
+    store = TranscriptStore(s3, "askphysics", idle_ttl=0.0)
+    sink = store.open()
+    messages = [{"role": "user", "content": "first"}, {"role": "assistant", "content": "answer 1"}]
+    sink.append(messages)
+    store.reap()
+    assert sink.closed
+    messages += [{"role": "user", "content": "second"}, {"role": "assistant", "content": "answer 2"}]
+    store.open(sink)
+    sink.append(messages)
+    assert sink.segments == [f"{sink.prefix}/{sink.session_id}/00001.jsonl"], sink.segments
+    store.close()
+    body = s3.get_object(Bucket="askphysics", Key=sink.key)["Body"].read().decode()
+    assert [json.loads(line)["content"] for line in body.splitlines()] == [m["content"] for m in messages], body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=30)
+    args = parser.parse_args()
+
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="askphysics")
+        sink = TranscriptStore(s3, "askphysics").open()
+        messages = [{"role": "system", "content": "Speak like a teacher..."}]
+        old_bytes = new_bytes = 0
+        old_time = new_time = 0.0
+        for turn in range(args.turns):
+            messages.append({"role": "user", "content": f"Is it because iron is magnetic? ({turn})"})
+            messages.append({"role": "assistant", "content": REPLY})
+
+            started = time.perf_counter()
+            old_bytes += rewrite_csv(s3, messages)
+            old_time += time.perf_counter() - started
+
+            started = time.perf_counter()
+            before = len(sink.segments)
+            sink.append(messages)
+            new_time += time.perf_counter() - started
+            new_bytes += s3.head_object(Bucket="askphysics", Key=sink.segments[before])["ContentLength"]
+        sink.compact()
+        check_reaped_session(s3)
+
+    print(f"{'strategy':<14} {'bytes uploaded':>15} {'upload time':>12}")
+    print(f"{'rewrite csv':<14} {old_bytes:>15,} {old_time * 1000:>10.0f}ms")
+    print(f"{'append jsonl':<14} {new_bytes:>15,} {new_time * 1000:>10.0f}ms")
+    print("\nreaped session: ok (carries on after the compacted transcript)")
+
+
+if __name__ == "__main__":
+    main()
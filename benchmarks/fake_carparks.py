@@ -0,0 +1,156 @@
+"""A local stand-in for data.gov.sg's carpark-availability feed.
+
+Serves a recorded payload (`payload=` a JSON file path) or a synthetic one
+with the real schema and size (about 2,000 carparks). Readings change every
+`update_interval` seconds, like the real feed. Responses carry an ETag and
+Last-Modified and conditional requests get 304 Not Modified. Requests are
+counted in `server.calls`, 304s in `server.not_modified`.
+"""
+import collections
+import csv
+import json
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SGT = timezone(timedelta(hours=8))
+PATH = "/v1/transport/carpark-availability"
+
+
+def synthetic_payload(carparks=2000, seed=0, when=None):
+    """A payload shaped like the real feed, with `carparks` entries."""
+    rng = random.Random(seed)
+    when = when or datetime.now(SGT)
+    data = []
+    for i in range(carparks):
+        # A few well-known numbers first so the apps' defaults resolve
+        number = ("TM44", "T79", "TM12", "T18")[i] if i < 4 else f"{rng.choice('ABCHJKMPSTUWY')}{rng.choice('ABMT')}{i}"
+        lots = []
+        for lot_type in ("C", "Y", "H")[:rng.choice((1, 1, 2, 3))]:
+            total = rng.randint(10, 900)
+            lots.append({"total_lots": str(total), "lot_type": lot_type, "lots_available": str(rng.randint(0, total))})
+        updated = when - timedelta(seconds=rng.randint(0, 600))
+        data.append({"carpark_info": lots, "carpark_number": number,
+                     "update_datetime": updated.strftime("%Y-%m-%dT%H:%M:%S")})
+    return {"items": [{"timestamp": when.isoformat(timespec="seconds"), "carpark_data": data}],
+            "api_info": {"status": "healthy"}}
+
+
+def synthetic_places(path, numbers, seed=0, centre=(41386.0, 37709.0)):
+    """Write an HDB Carpark Information CSV locating `numbers` around Singapore.
+
+    The first four are put within 600 m of `centre` (Temasek JC in SVY21),
+    the rest anywhere on the island.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["car_park_no", "address", "x_coord", "y_coord", "car_park_type"])
+        for i, number in enumerate(numbers):
+            if i < 4:
+                x, y = centre[0] + rng.uniform(-400, 400), centre[1] + rng.uniform(-400, 400)
+            else:
+                x, y = rng.uniform(5000, 45000), rng.uniform(26000, 48000)
+            writer.writerow([number, f"BLK {rng.randint(1, 999)} STREET {i}", f"{x:.4f}", f"{y:.4f}", "SURFACE CAR PARK"])
+
+
+class FakeCarparks(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), payload=None, carparks=2000, update_interval=60.0, latency=0.05):
+        super().__init__(address, _Handler)
+        self.carparks = carparks
+        self.update_interval = update_interval
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.not_modified = 0
+        self.lock = threading.Lock()
+        self.recorded = None
+        if payload:
+            with open(payload) as f:
+                self.recorded = json.load(f)
+        self._version = None
+        self._body = None
+        self._modified = None
+
+    def handle_error(self, request, client_address):
+        # Streaming clients hang up once they have what they need; that's expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{PATH}"
+
+    def current(self):
+        """(body bytes, version, last-modified datetime) of the reading being served."""
+        version = int(time.time() // self.update_interval) if self.update_interval else 0
+        with self.lock:
+            if version != self._version:
+                self._modified = datetime.now(timezone.utc).replace(microsecond=0)
+                payload = self.recorded or synthetic_payload(self.carparks, seed=version)
+                if self.recorded and version:
+                    payload = _shuffle_readings(payload, version)
+                self._body = json.dumps(payload).encode()
+                self._version = version
+            return self._body, self._version, self._modified
+
+
+def _shuffle_readings(payload, seed):
+    # Vary a recorded payload's availability so consecutive readings differ
+    rng = random.Random(seed)
+    payload = json.loads(json.dumps(payload))
+    for carpark in payload["items"][0]["carpark_data"]:
+        for info in carpark["carpark_info"]:
+            info["lots_available"] = str(rng.randint(0, int(info["total_lots"] or 0)))
+    return payload
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.calls[self.path.split("?")[0]] += 1
+        time.sleep(self.server.latency)
+        if self.path.split("?")[0] != PATH:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body, version, modified = self.server.current()
+        etag = f'"{version}"'
+        since = self.headers.get("If-Modified-Since")
+        if self.headers.get("If-None-Match") == etag or (
+            "If-None-Match" not in self.headers and since and parsedate_to_datetime(since) >= modified
+        ):
+            with self.server.lock:
+                self.server.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", format_datetime(modified, usegmt=True))
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(**options):
+    """Start a FakeCarparks server on a free local port in a background thread."""
+    server = FakeCarparks(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,372 @@
+"""A local stand-in for the parts of the OpenAI API the apps use.
+
+Start it with `serve()` and point an `OpenAI(base_url=server.url, api_key="x")`
+client at it. Every request is counted in `server.calls` so benchmarks can
+report upstream calls per answer.
+
+With `requests_per_minute` / `tokens_per_minute` set, chat completions are
+rate limited like the real API: every response carries `x-ratelimit-*`
+headers and a request over budget gets a 429 with `retry-after-ms`
+(counted in `server.rejected`). `minute` shortens the limit window so a
+benchmark doesn't have to run for minutes.
+
+With `stall_rate` set, that fraction of streamed chat completions stall:
+after `stall_after` tokens the server goes quiet for `stall_seconds`
+(counted in `server.stalled`), like an upstream connection that hangs.
+With `stall_headers` they go quiet before sending the response headers.
+"""
+import collections
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ANSWER = (
+    "The rate of decay, or activity, is the number of nuclei that decay per unit time. "
+    "It is given by $A = \\lambda N$, where $\\lambda$ is the decay constant and $N$ is "
+    "the number of undecayed nuclei."
+)
+
+
+def _duration(seconds):
+    # Formatted like the API's reset headers: "20ms", "1.5s", "1m3s"
+    if seconds < 1:
+        return f"{seconds * 1000:.0f}ms"
+    minutes, seconds = divmod(seconds, 60)
+    return f"{minutes:.0f}m{seconds:.0f}s" if minutes else f"{seconds:.3g}s"
+
+
+class _Budget:
+    # One of the server's limits, refilling continuously over a minute
+    def __init__(self, limit, minute):
+        self.limit = limit
+        self.rate = limit / minute
+        self.level = float(limit)
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.limit, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def short(self, amount):
+        # Seconds until `amount` is available
+        return max(min(amount, self.limit) - self.level, 0) / self.rate
+
+    def headers(self, name):
+        return {
+            f"x-ratelimit-limit-{name}": str(self.limit),
+            f"x-ratelimit-remaining-{name}": str(max(int(self.level), 0)),
+            f"x-ratelimit-reset-{name}": _duration((self.limit - self.level) / self.rate),
+        }
+
+
+class FakeOpenAI(ThreadingHTTPServer):
+    daemon_threads = True
+    # A whole class connects at once; the default backlog of 5 resets most of them
+    request_queue_size = 128
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.02, first_token=0.4, token_rate=200.0, answer=ANSWER,
+                 requests_per_minute=None, tokens_per_minute=None, minute=60.0, stall_rate=0.0, stall_after=0,
+                 stall_seconds=30.0, stall_headers=False, seed=0):
+        super().__init__(address, _Handler)
+        self.latency = latency  # seconds added to every request
+        self.first_token = first_token  # seconds before the model emits its first token
+        self.token_rate = token_rate  # tokens per second once it starts
+        self.answer = answer
+        self.calls = collections.Counter()
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.threads = {}
+        self.runs = {}
+        self.last_request = None
+        self.budgets = {}
+        if requests_per_minute:
+            self.budgets["requests"] = _Budget(requests_per_minute, minute)
+        if tokens_per_minute:
+            self.budgets["tokens"] = _Budget(tokens_per_minute, minute)
+        self.rejected = 0
+        self.stall_rate = stall_rate
+        self.stall_after = stall_after
+        self.stall_seconds = stall_seconds
+        self.stall_headers = stall_headers
+        self.stalled = 0
+        self.random = random.Random(seed)
+
+    def handle_error(self, request, client_address):
+        # Streaming clients hang up once they have what they need; that's expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def tokens(self):
+        words = self.answer.split(" ")
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    def run_seconds(self):
+        return self.first_token + len(self.tokens()) / self.token_rate
+
+    def new_id(self, prefix):
+        with self.lock:
+            return f"{prefix}_{next(self.ids)}"
+
+    def reset_calls(self):
+        with self.lock:
+            self.calls.clear()
+            self.rejected = 0
+            self.stalled = 0
+
+    def stalls(self):
+        """Whether the next streamed completion should stall."""
+        with self.lock:
+            stall = self.stall_rate > 0 and self.random.random() < self.stall_rate
+            if stall:
+                self.stalled += 1
+            return stall
+
+    def admit(self, body):
+        """Charge a chat completion to the budgets; returns `(ok, headers)`."""
+        # Billed like the API: prompt characters / 4 plus the most the reply may use
+        cost = {"requests": 1,
+                "tokens": sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+                + (body.get("max_tokens") or len(self.tokens()))}
+        with self.lock:
+            for budget in self.budgets.values():
+                budget.refill()
+            wait = max((b.short(cost[name]) for name, b in self.budgets.items()), default=0)
+            if not wait:
+                for name, budget in self.budgets.items():
+                    budget.level -= cost[name]
+            else:
+                self.rejected += 1
+            headers = {k: v for name, b in self.budgets.items() for k, v in b.headers(name).items()}
+        if wait:
+            headers["retry-after-ms"] = str(int(wait * 1000) + 1)
+        return not wait, headers
+
+
+def _message(message_id, thread_id, role, text):
+    return {
+        "id": message_id,
+        "object": "thread.message",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "role": role,
+        "status": "completed",
+        "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _json(self, payload, status=200, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_events(self, headers=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.close_connection = True
+
+    def _event(self, data, event=None):
+        chunk = (f"event: {event}\n" if event else "") + f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+        self.wfile.write(chunk.encode())
+        self.wfile.flush()
+
+    def _route(self, method):
+        server = self.server
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p][1:]  # drop the "v1" prefix
+        key = method + " /" + "/".join("{id}" if "_" in p else p for p in parts)
+        with server.lock:
+            server.calls[key] += 1
+        time.sleep(server.latency)
+        handler = getattr(self, "_" + key.replace(" /", "_").replace("/", "_").replace("{id}", "id").replace(".", "_"), None)
+        if handler is None:
+            return self._json({"error": {"message": f"unknown route {key}"}}, status=404)
+        return handler(parts, parse_qs(url.query))
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+    # Chat completions ---------------------------------------------------
+
+    def _POST_chat_completions(self, parts, query):
+        body = self._body()
+        self.server.last_request = body
+        ok, headers = self.server.admit(body)
+        if not ok:
+            return self._json({"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                         "param": None, "code": "rate_limit_exceeded"}}, status=429, headers=headers)
+        completion_id = self.server.new_id("chatcmpl")
+        if not body.get("stream"):
+            time.sleep(self.server.run_seconds())
+            return self._json({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": self.server.answer}}],
+            }, headers=headers)
+
+        stall = self.server.stalls()
+        if stall and self.server.stall_headers:
+            time.sleep(self.server.stall_seconds)
+            stall = False
+        self._start_events(headers)
+        time.sleep(self.server.first_token)
+        chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                 "model": body.get("model")}
+        for i, token in enumerate(self.server.tokens()):
+            if stall and i == self.server.stall_after:
+                time.sleep(self.server.stall_seconds)
+            self._event({**chunk, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+            time.sleep(1 / self.server.token_rate)
+        self._event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self._event("[DONE]")
+
+    # Assistants ---------------------------------------------------------
+
+    def _GET_assistants_id(self, parts, query):
+        self._json({"id": parts[1], "object": "assistant", "model": "gpt-3.5-turbo", "tools": []})
+
+    def _POST_threads(self, parts, query):
+        self._body()
+        thread_id = self.server.new_id("thread")
+        with self.server.lock:
+            self.server.threads[thread_id] = []
+        self._json({"id": thread_id, "object": "thread", "created_at": int(time.time())})
+
+    def _DELETE_threads_id(self, parts, query):
+        with self.server.lock:
+            self.server.threads.pop(parts[1], None)
+        self._json({"id": parts[1], "object": "thread.deleted", "deleted": True})
+
+    def _POST_threads_id_messages(self, parts, query):
+        body = self._body()
+        message = _message(self.server.new_id("msg"), parts[1], "user", body.get("content", ""))
+        with self.server.lock:
+            self.server.threads.setdefault(parts[1], []).append(message)
+        self._json(message)
+
+    def _GET_threads_id_messages(self, parts, query):
+        self._sync_runs(parts[1])
+        with self.server.lock:
+            messages = list(self.server.threads.get(parts[1], []))
+        after = query.get("after", [None])[0]
+        if after:
+            ids = [m["id"] for m in messages]
+            messages = messages[ids.index(after) + 1:] if after in ids else []
+        if query.get("order", ["desc"])[0] == "desc":
+            messages.reverse()
+        self._json({"object": "list", "data": messages, "has_more": False})
+
+    def _run(self, run_id):
+        run = self.server.runs[run_id]
+        return {
+            "id": run_id,
+            "object": "thread.run",
+            "thread_id": run["thread_id"],
+            "assistant_id": run["assistant_id"],
+            "status": run["status"],
+            "created_at": int(run["started"]),
+        }
+
+    def _sync_runs(self, thread_id):
+        # Poll-mode runs complete on the wall clock, like the real API
+        now = time.monotonic()
+        with self.server.lock:
+            for run_id, run in self.server.runs.items():
+                if run["thread_id"] != thread_id or run["status"] not in ("queued", "in_progress"):
+                    continue
+                if now - run["started"] >= self.server.run_seconds():
+                    run["status"] = "completed"
+                    self.server.threads[thread_id].append(
+                        _message(self.server.new_id("msg"), thread_id, "assistant", self.server.answer)
+                    )
+                elif now - run["started"] >= self.server.latency:
+                    run["status"] = "in_progress"
+
+    def _POST_threads_id_runs(self, parts, query):
+        body = self._body()
+        thread_id = parts[1]
+        run_id = self.server.new_id("run")
+        with self.server.lock:
+            self.server.runs[run_id] = {
+                "thread_id": thread_id,
+                "assistant_id": body.get("assistant_id"),
+                "status": "queued",
+                "started": time.monotonic(),
+            }
+        if not body.get("stream"):
+            return self._json(self._run(run_id))
+
+        self._start_events()
+        self._event(self._run(run_id), "thread.run.created")
+        with self.server.lock:
+            self.server.runs[run_id]["status"] = "in_progress"
+        self._event(self._run(run_id), "thread.run.in_progress")
+        time.sleep(self.server.first_token)
+        message_id = self.server.new_id("msg")
+        for token in self.server.tokens():
+            self._event(
+                {"id": message_id, "object": "thread.message.delta",
+                 "delta": {"content": [{"index": 0, "type": "text", "text": {"value": token}}]}},
+                "thread.message.delta",
+            )
+            time.sleep(1 / self.server.token_rate)
+        with self.server.lock:
+            self.server.threads[thread_id].append(_message(message_id, thread_id, "assistant", self.server.answer))
+            self.server.runs[run_id]["status"] = "completed"
+        self._event(self._run(run_id), "thread.run.completed")
+        self._event("[DONE]", "done")
+
+    def _GET_threads_id_runs_id(self, parts, query):
+        self._sync_runs(parts[1])
+        with self.server.lock:
+            self._json(self._run(parts[3]))
+
+    def _POST_threads_id_runs_id_cancel(self, parts, query):
+        with self.server.lock:
+            self.server.runs[parts[3]]["status"] = "cancelled"
+            self._json(self._run(parts[3]))
+
+
+def serve(**options):
+    """Start a FakeOpenAI server on a free local port in a background thread."""
+    server = FakeOpenAI(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,401 @@
+"""Load test the apps with many concurrent users against local stand-ins for every service.
+
+    pip install -r requirements-dev.txt                   # adds moto, for the mock S3
+    python -m benchmarks.loadtest tutor chatwr --users 50 --turns 3
+    python -m benchmarks.loadtest --users 20 --save       # every scenario, results kept
+
+Starts, in this process:
+- the fake OpenAI server (chat completions, Assistants; vision requests
+  are chat completions with an image) with `--latency`, `--first-token`,
+  `--token-rate` and, with `--rpm`, a requests-per-minute limit;
+- S3 through moto's in-process mock, with the askphysics bucket;
+- the fake data.gov.sg carpark feed and a synthetic HDB carpark dataset.
+
+Each scenario then runs `--users` headless sessions of its app through
+Streamlit's AppTest at once, each taking `--turns` turns, all sharing the
+process's cached clients like users of one Streamlit server would:
+
+  tutor      tutor.py, the default tutor; a new question each turn
+  chatwr     chatwr.py, a tutor that keeps transcripts in S3
+  assistant  assistant.py, the Assistants API tutor
+  vision     solve.py, uploading a new picture and pressing Analyze
+  carparks   carparksneartj.py, rerunning the page
+
+Reported per scenario:
+  first token  p50/p95/p99 seconds from submitting to the first token, as the
+               app measured it (queue wait included); for apps that don't
+               stream, the time until the answer was on the page
+  rerun        p50/p95/p99 seconds of the script run that answered the turn
+  memory       growth of the process's resident memory per session
+  calls/turn   upstream OpenAI and carpark feed requests per turn
+  stages       count, mean and p50/p95 bucket bounds of each askme.tracing
+               stage the scenario went through
+
+With `--save` each scenario's result is appended to
+benchmarks/results/loadtest.jsonl with the commit it ran on, and the last
+saved run with the same settings is printed next to it; `--check` exits
+non-zero if a p95, the memory or the calls per turn got worse by more
+than `--tolerance`.
+"""
+import argparse
+import atexit
+import datetime
+import gc
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from askme.tracing import tracer
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(REPO, "benchmarks", "results", "loadtest.jsonl")
+# What --check compares, each with an absolute slack on top of --tolerance for run-to-run noise
+COMPARED = {"first_token_p95": 0.05, "rerun_p95": 0.05, "memory_per_session_mb": 0.5, "openai_calls_per_turn": 0.0}
+
+
+def percentile(values, p):
+    # Nearest-rank percentile; fine for the few hundred samples a run takes
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered) + 0.5) - 1))]
+
+
+def resident_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        # Peak rather than current outside Linux, which still shows growth
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def image_bytes(seed):
+    from PIL import Image
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (320, 240), tuple(rng.randrange(256) for _ in range(3)))
+    image.putpixel((rng.randrange(320), rng.randrange(240)), (255, 255, 255))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+# Scenarios: the app to run and how one user takes turn `n` on it -------------
+
+WORDS = ("iron core magnet current field coil domain voltage decay nucleus wave lens force mass energy "
+         "momentum pressure charge circuit resistance heat light sound orbit").split()
+
+
+def question(user, n):
+    # Different enough per student that the answer cache's similarity match doesn't pair them up
+    rng = random.Random(user * 1000 + n)
+    return "Why does the " + " ".join(rng.sample(WORDS, 6)) + f" matter? ({user}.{n})"
+
+
+def _tutor_ttft(at, name):
+    usage = at.session_state[f"tutor_{name}"]["messages"][-1].get("usage", {})
+    if "ttft" not in usage:
+        return None
+    return usage.get("queued", 0.0) + usage["ttft"]
+
+
+def tutor_turn(at, user, n):
+    at.chat_input[0].set_value(question(user, n)).run()
+    return _tutor_ttft(at, "main")
+
+
+def chatwr_turn(at, user, n):
+    at.chat_input[0].set_value(question(user, n)).run()
+    return _tutor_ttft(at, "chatwr")
+
+
+def assistant_turn(at, user, n):
+    at.text_input[0].input(question(user, n)).run()
+    return None
+
+
+def vision_turn(at, user, n):
+    at.file_uploader[0].set_value((f"question-{user}-{n}.png", image_bytes(user * 1000 + n), "image/png")).run()
+    at.button[0].click().run()
+    return None
+
+
+def carparks_turn(at, user, n):
+    at.run()
+    return None
+
+
+SCENARIOS = {
+    "tutor": ("tutor.py", tutor_turn),
+    "chatwr": ("chatwr.py", chatwr_turn),
+    "assistant": ("assistant.py", assistant_turn),
+    "vision": ("solve.py", vision_turn),
+    "carparks": ("carparksneartj.py", carparks_turn),
+}
+
+
+class Stack:
+    """The fake OpenAI server, moto's S3 and the fake carpark feed, with the apps pointed at them."""
+
+    def __init__(self, workdir, latency, first_token, token_rate, rpm):
+        import boto3
+        from moto import mock_aws
+
+        from benchmarks import fake_carparks, fake_openai
+
+        self.openai = fake_openai.serve(latency=latency, first_token=first_token, token_rate=token_rate,
+                                        requests_per_minute=rpm)
+        self.carparks = fake_carparks.serve(latency=latency)
+        self.aws = mock_aws()
+        self.aws.start()
+        places = os.path.join(workdir, "hdb_carpark_info.csv")
+        numbers = [c["carpark_number"] for c in fake_carparks.synthetic_payload()["items"][0]["carpark_data"]]
+        fake_carparks.synthetic_places(places, numbers)
+        os.environ.update(
+            OPENAI_BASE_URL=self.openai.url, OPENAI_API_KEY="x",
+            AWS_ACCESS_KEY_ID="x", AWS_SECRET_ACCESS_KEY="x", AWS_DEFAULT_REGION="ap-southeast-1",
+            CARPARK_API_URL=self.carparks.url, CARPARK_INFO_CSV=places,
+            CARPARK_HISTORY_DIR=os.path.join(workdir, "carparks"),
+        )
+        boto3.client("s3", region_name="ap-southeast-1").create_bucket(
+            Bucket="askphysics", CreateBucketConfiguration={"LocationConstraint": "ap-southeast-1"})
+
+    def reset(self):
+        self.openai.reset_calls()
+        self.carparks.calls.clear()
+
+    def calls(self):
+        return sum(self.openai.calls.values()), sum(self.carparks.calls.values())
+
+    def close(self):
+        self.aws.stop()
+        self.openai.shutdown()
+        self.carparks.shutdown()
+
+
+def concurrent_apptest():
+    """Let AppTest sessions run at the same time, as a Streamlit server's do.
+
+    AppTest installs a stand-in Streamlit runtime when a run starts and
+    removes it when the run ends, while other sessions' runs may still need
+    one; once a runtime has been seen it is handed to any run that finds
+    the slot empty. It also compiles the script afresh on every run, which
+    on Python 3.11 can fail when two threads do it at once; like the
+    server, all runs share one bytecode cache.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    seen = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            seen[:] = [cls._instance]
+        elif not seen:
+            raise RuntimeError("Runtime hasn't been created!")
+        return cls._instance or seen[0]
+
+    bytecode, lock = {}, threading.Lock()
+
+    def shared_cache(self):
+        self._cache = bytecode
+        self._lock = lock
+
+    Runtime.instance = classmethod(instance)
+    ScriptCache.__init__ = shared_cache
+
+
+def session(app, turn, user, turns, start, timings, failures, sessions, lock):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(REPO, app), default_timeout=120)
+    at.secrets["OPENAI_API_KEY"] = "x"
+    start.wait()
+    try:
+        at.run()
+        for n in range(turns):
+            started = time.perf_counter()
+            ttft = turn(at, user, n)
+            rerun = time.perf_counter() - started
+            if at.exception:
+                raise RuntimeError(at.exception[0].message)
+            with lock:
+                timings.append((rerun if ttft is None else ttft, rerun))
+    except Exception as e:
+        with lock:
+            failures.append(f"{type(e).__name__}: {e}")
+    # Kept alive until everyone is done, so memory is measured with every session open
+    with lock:
+        sessions.append(at)
+
+
+def run_scenario(stack, name, users, turns, ramp):
+    app, turn = SCENARIOS[name]
+    # One user first, so imports and process-wide caches aren't charged to the sessions
+    session(app, turn, -1, 1, threading.Barrier(1), [], [], [], threading.Lock())
+    stack.reset()
+    tracer.reset()
+    gc.collect()
+    memory_before = resident_mb()
+
+    timings, failures, sessions, lock = [], [], [], threading.Lock()
+    start = threading.Barrier(users) if not ramp else _Ramp(ramp / users)
+    threads = [threading.Thread(target=session, args=(app, turn, user, turns, start, timings, failures, sessions, lock))
+               for user in range(users)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    gc.collect()
+    memory = resident_mb() - memory_before
+    openai_calls, carpark_calls = stack.calls()
+    done = len(timings) or 1
+    first_tokens = [t for t, _ in timings]
+    reruns = [r for _, r in timings]
+    return {
+        "scenario": name,
+        "users": users,
+        "turns": turns,
+        "completed_turns": len(timings),
+        "failures": len(failures),
+        "failure_examples": sorted(set(failures))[:3],
+        "first_token_p50": percentile(first_tokens, 50),
+        "first_token_p95": percentile(first_tokens, 95),
+        "first_token_p99": percentile(first_tokens, 99),
+        "rerun_p50": percentile(reruns, 50),
+        "rerun_p95": percentile(reruns, 95),
+        "rerun_p99": percentile(reruns, 99),
+        "memory_per_session_mb": memory / users,
+        "openai_calls_per_turn": openai_calls / done,
+        "carpark_calls_per_turn": carpark_calls / done,
+        "seconds": elapsed,
+        "stages": tracer.stats(),
+    }
+
+
+class _Ramp:
+    # Stands in for the start barrier: lets sessions in one at a time, `gap` seconds apart
+    def __init__(self, gap):
+        self.gap = gap
+        self.next = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            at, self.next = self.next, max(self.next, time.monotonic()) + self.gap
+        time.sleep(max(at - time.monotonic(), 0))
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous(result, path=RESULTS):
+    """The last saved result with the same scenario and settings, or None."""
+    if not os.path.exists(path):
+        return None
+    same = None
+    with open(path) as f:
+        for line in f:
+            saved = json.loads(line)
+            if all(saved.get(k) == result.get(k) for k in ("scenario", "users", "turns", "options")):
+                same = saved
+    return same
+
+
+def save(result, path=RESULTS):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(result, sort_keys=True) + "\n")
+
+
+def regressions(result, before, tolerance):
+    worse = []
+    for key, slack in COMPARED.items():
+        old, new = before.get(key), result.get(key)
+        if old is not None and new is not None and new > max(old, 0) * (1 + tolerance) + slack:
+            worse.append(f"{key} {old:.3g} -> {new:.3g}")
+    return worse
+
+
+def _fmt(value, unit="s"):
+    return "-" if value is None else f"{value:.2f}{unit}"
+
+
+def report(result, before=None):
+    print(f"\n{result['scenario']}: {result['users']} users × {result['turns']} turns in {result['seconds']:.1f}s, "
+          f"{result['completed_turns']} turns answered, {result['failures']} failed")
+    for example in result["failure_examples"]:
+        print(f"  failure: {example}")
+    rows = [("", result)] if before is None else [("now", result), (f"was ({before.get('commit')})", before)]
+    print(f"  {'':<14} {'first token p50/p95/p99':>26} {'rerun p50/p95/p99':>22} {'MB/session':>11} {'calls/turn':>11}")
+    for label, r in rows:
+        first = "/".join(_fmt(r[f"first_token_p{p}"]) for p in (50, 95, 99))
+        rerun = "/".join(_fmt(r[f"rerun_p{p}"]) for p in (50, 95, 99))
+        print(f"  {label:<14} {first:>26} {rerun:>22} {r['memory_per_session_mb']:>10.2f} "
+              f"{r['openai_calls_per_turn'] + r['carpark_calls_per_turn']:>11.2f}")
+    for stage, s in result.get("stages", {}).items():
+        print(f"  {stage:<26} {s['count']:>6} × mean {_fmt(s['mean'])}, p50 ≤{_fmt(s['p50'])}, p95 ≤{_fmt(s['p95'])}"
+              + (f", {s['errors']} errors" if s["errors"] else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", metavar="scenario", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which users arrive (0: all at once)")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--first-token", type=float, default=0.4)
+    parser.add_argument("--token-rate", type=float, default=100.0)
+    parser.add_argument("--rpm", type=int, default=None, help="fake OpenAI requests-per-minute limit")
+    parser.add_argument("--save", action="store_true", help=f"append results to {os.path.relpath(RESULTS, REPO)}")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a p95 regressed against the last saved run")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario {', '.join(sorted(unknown))}")
+
+    options = {k: getattr(args, k) for k in ("ramp", "latency", "first_token", "token_rate", "rpm")}
+    # Caches the apps keep on disk go in a scratch directory, so every run starts cold
+    workdir = tempfile.mkdtemp(prefix="askme-loadtest-")
+    os.chdir(workdir)
+    sys.path.insert(0, REPO)
+    concurrent_apptest()
+    stack = Stack(workdir, args.latency, args.first_token, args.token_rate, args.rpm)
+    # Stopped at exit after the apps' own exit handlers, which still write transcripts to S3
+    atexit.register(stack.close)
+    worse = []
+    for name in args.scenarios or SCENARIOS:
+        result = run_scenario(stack, name, args.users, args.turns, args.ramp)
+        result.update(options=options, commit=commit(),
+                      time=datetime.datetime.now().isoformat(timespec="seconds"))
+        before = previous(result)
+        report(result, before)
+        if before is not None:
+            worse += [f"{name}: {w}" for w in regressions(result, before, args.tolerance)]
+        if args.save:
+            save(result)
+    for line in worse:
+        print(f"regression: {line}")
+    if args.check and worse:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
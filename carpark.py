@@ -1,32 +1,25 @@
-import requests
-from datetime import datetime
 import streamlit as st
-import pytz
+from askme.carparks import CarparkAvailability, CarparkError
+from askme.clients import http_session
 
-# Define the Singapore timezone
-singapore_tz = pytz.timezone('Asia/Singapore')
+
+# One cached, indexed copy of the national feed serves every session
+@st.cache_resource
+def load_carpark_availability():
+    return CarparkAvailability(http_session())
 
 
 # Function to get the carpark availability for a given carpark number
 def get_carpark_availability(carpark_number='T18'):
-    url = 'https://api.data.gov.sg/v1/transport/carpark-availability'
-    headers = {'accept': '*/*'}
-    date_time = datetime.now(singapore_tz).strftime('%Y-%m-%dT%H:%M:%S')
-    params = {'date_time': date_time}
-
-    response = requests.get(url, headers=headers, params=params)
+    try:
+        snapshot = load_carpark_availability().snapshot()
+    except CarparkError as e:
+        return str(e)
 
-    if response.status_code == 200:
-        data = response.json()
-        carpark_data = data['items'][0]['carpark_data']
-        
-        for carpark in carpark_data:
-            if carpark['carpark_number'] == carpark_number:
-                return carpark
-        
+    carpark = snapshot.get(carpark_number)
+    if carpark is None:
         return f"No data found for carpark number: {carpark_number}"
-    else:
-        return f"Error: {response.status_code} - {response.text}"
+    return carpark
 
 # Streamlit app
 st.title("HDB Carpark Availability Checker")
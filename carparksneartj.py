@@ -1,62 +1,91 @@
-import requests
-from datetime import datetime
+import os
+import time
 import streamlit as st
-import pytz
 import pandas as pd
 import streamlit.components.v1 as components
+from askme.carpark_history import CarparkHistory, CarparkPoller
+from askme.carpark_places import DEFAULT_CSV, LANDMARKS, CarparkPlaces
+from askme.carparks import CarparkAvailability, CarparkError
+from askme.clients import http_session, metrics_endpoint
 
-# Define the Singapore timezone
-singapore_tz = pytz.timezone('Asia/Singapore')
-
-# Carpark details
+# Used until the HDB carpark dataset has been downloaded
 carpark_details = {
     'TM44': 'Blk 499 Tampines Ave 9',
     'T79': 'Blk 460 Tampines St 42',
     'TM12': 'Blk 390A Tampines Ave 7'
 }
 
+# One cached, indexed copy of the national feed serves every session
+@st.cache_resource
+def load_carpark_availability():
+    return CarparkAvailability(http_session())
+
+# One background poller per process keeps the snapshot fresh and records history
+@st.cache_resource
+def load_carpark_poller():
+    history = CarparkHistory(os.environ.get('CARPARK_HISTORY_DIR', os.path.join('.askme_cache', 'carparks')))
+    return CarparkPoller(load_carpark_availability(), history)
+
+# Carpark locations, indexed once per process; None without the HDB dataset
+@st.cache_resource
+def load_carpark_places():
+    try:
+        return CarparkPlaces(os.environ.get('CARPARK_INFO_CSV', DEFAULT_CSV))
+    except FileNotFoundError:
+        print("No HDB carpark dataset; run `python -m askme.carpark_places download`")
+        return None
+
+def block_address(carpark_number):
+    places = load_carpark_places()
+    if places is None:
+        return carpark_details.get(carpark_number, 'Unknown')
+    return places.address(carpark_number, carpark_details.get(carpark_number, 'Unknown'))
+
 # Function to get the carpark availability for a given list of carpark numbers
 def get_carpark_availability(carpark_numbers):
-    url = 'https://api.data.gov.sg/v1/transport/carpark-availability'
-    headers = {'accept': '*/*'}
-    date_time = datetime.now(singapore_tz).strftime('%Y-%m-%dT%H:%M:%S')
-    params = {'date_time': date_time}
-
-    response = requests.get(url, headers=headers, params=params)
-
-    if response.status_code == 200:
-        data = response.json()
-        carpark_data = data['items'][0]['carpark_data']
-        results = []
-        
-        for carpark_number in carpark_numbers:
-            for carpark in carpark_data:
-                if carpark['carpark_number'] == carpark_number:
-                    carpark_info = {
-                        'carpark_number': carpark['carpark_number'],
-                        'update_datetime': carpark['update_datetime'],
-                        'block_number': carpark_details.get(carpark['carpark_number'], 'Unknown'),
-                        'lots_available': []
-                    }
-                    for info in carpark['carpark_info']:
-                        carpark_info['lots_available'].append({
-                            'lot_type': info['lot_type'],
-                            'total_lots': info['total_lots'],
-                            'lots_available': info['lots_available']
-                        })
-                    results.append(carpark_info)
-                    break
-        
-        return results
-    else:
-        return f"Error: {response.status_code} - {response.text}"
+    availability = load_carpark_availability()
+    try:
+        # Read what the poller fetched; before its first poll, stream just these carparks
+        if availability.latest is not None:
+            carparks = availability.latest.lookup(carpark_numbers)
+        else:
+            carparks = availability.stream_lookup(carpark_numbers)
+    except CarparkError as e:
+        return str(e)
+
+    results = []
+    for carpark in carparks:
+        carpark_info = {
+            'carpark_number': carpark['carpark_number'],
+            'update_datetime': carpark['update_datetime'],
+            'block_number': block_address(carpark['carpark_number']),
+            'lots_available': []
+        }
+        for info in carpark['carpark_info']:
+            carpark_info['lots_available'].append({
+                'lot_type': info['lot_type'],
+                'total_lots': info['total_lots'],
+                'lots_available': info['lots_available']
+            })
+        results.append(carpark_info)
+    return results
 
 # Streamlit app
 st.title("HDB Carpark Availability Checker")
 st.header("Carparks near TemaseK JC")
 
-# List of carparks to monitor
-predefined_carparks = ['TM44', 'T79', 'TM12']
+poller = load_carpark_poller()
+
+# Carparks to monitor: those near the school, or a fixed few without the dataset
+places = load_carpark_places()
+distances = {}
+if places is not None:
+    radius = st.slider("Carparks within this many metres of Temasek JC", 100, 1500, 500, step=50)
+    distances = dict(places.near(*LANDMARKS['Temasek Junior College'], radius))
+else:
+    st.info("Showing three fixed Tampines carparks: the HDB carpark dataset isn't downloaded. "
+            "Run `python -m askme.carpark_places download` to list the carparks near the school.")
+predefined_carparks = list(distances) or list(carpark_details)
 
 # Input field for additional carpark numbers
 additional_carparks_input = st.text_input("Enter additional carpark numbers (comma-separated)", "")
@@ -70,6 +99,18 @@ else:
 # Combine predefined carparks with user-entered carparks
 carparks_to_monitor = predefined_carparks + additional_carparks
 
+# Stage timings on /metrics when $ASKME_METRICS_PORT is set
+metrics_endpoint()
+
+# Say how old the numbers are, and warn once the poller has missed a few polls
+latest = load_carpark_availability().latest
+if latest is not None:
+    age = time.monotonic() - latest.fetched_at
+    if age > 3 * poller.interval:
+        st.warning(f"These numbers are {age / 60:.0f} min old; the availability feed isn't answering.")
+    else:
+        st.caption(f"Availability as of {latest.timestamp}")
+
 # Get availability data upon loading
 carpark_data = get_carpark_availability(carparks_to_monitor)
 if isinstance(carpark_data, list):
@@ -80,6 +121,7 @@ if isinstance(carpark_data, list):
             rows.append({
                 'Carpark Number': carpark['carpark_number'],
                 'Block Number': carpark['block_number'],
+                'Distance (m)': round(distances[carpark['carpark_number']]) if carpark['carpark_number'] in distances else None,
                 'Update Time': carpark['update_datetime'],
                 'Lot Type': lot['lot_type'],
                 'Total Lots': lot['total_lots'],
@@ -91,6 +133,20 @@ if isinstance(carpark_data, list):
 else:
     st.write(carpark_data)
 
+# Chart the recorded history from local data
+hours = st.slider("Availability over the last N hours", 1, 24, 3)
+history = poller.history
+keys = [history.key(number, lot_type) for number in carparks_to_monitor for lot_type in history.lot_types(number)]
+times, series = history.window(keys, hours)
+if len(times) > 1:
+    chart = pd.DataFrame(
+        {key.replace('/', ' (') + ')': values for key, values in series.items()},
+        index=pd.to_datetime(times, unit='s', utc=True).tz_convert('Asia/Singapore'),
+    )
+    st.line_chart(chart)
+else:
+    st.write("Not enough history recorded yet for a chart.")
+
 
 # Embed Google Maps iframe
 map_iframe = """
@@ -1,52 +1,5 @@
-import os
-import streamlit as st
-from openai import OpenAI
-# from openai import OpenAI
-client = OpenAI(
-	api_key=os.environ['OPENAI_API_KEY'], 
-)
+from askme.tutor_page import run_tutor
 
-# Initialize OpenAI
-# openai.api_key = os.getenv('OPENAI_API_KEY')
-
-
-st.title("Physics Tutor")
-st.text("Ask me a Physics question!")
-#Change here onwards
-
-	
-# Set a default model
-if "openai_model" not in st.session_state:
-    st.session_state["openai_model"] = "gpt-3.5-turbo"
-
-# Initialize chat history
-if "messages" not in st.session_state:
-    st.session_state.messages = [{"role": "system", "content": "Speak like a teacher who uses socratic questioning for physics. Guide the user to design an experimental plan. Display answers with mathematical content using LaTeX markup."},]
-
-# Display chat messages from history on app rerun
-for message in st.session_state.messages:
-    if message["role"] != "system":
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-
-# Accept user input
-if prompt := st.chat_input("What is up?"):
-    # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    # Display user message in chat message container
-    with st.chat_message("user"):
-        st.markdown(prompt)
-	    
-    with st.chat_message("assistant"):
-        stream = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": m["role"], "content": m["content"]}
-                for m in st.session_state.messages
-            ],
-            stream=True,
-        )
-        response = st.write_stream(stream)
-    
-    st.session_state.messages.append({"role": "assistant", "content": response})
-	
+# The "planning" tutor on its own; its prompt, page and media are in tutors.toml.
+# tutor.py serves it together with the other tutors from one process.
+run_tutor("planning")
@@ -1,65 +1,38 @@
-import os
-import boto3
 import streamlit as st
 from PIL import Image
-from openai import OpenAI
-# from openai import OpenAI
-client = OpenAI(
-	api_key=os.environ['OPENAI_API_KEY'], 
-)
+from askme.answer_cache import AnswerCache
+from askme.clients import metrics_endpoint, openai_client, s3_client, upload_queue
+from askme.vision import ImagePipeline
+# Shared, pooled OpenAI client, built once per process instead of every rerun
+client = openai_client()
 import requests
 import io
 import tempfile
 import shutil
 from PIL import UnidentifiedImageError
 
-# Currently not analysing the image. Image is available in S3.
+# Each distinct image is uploaded and analysed once, whichever session sends it
+@st.cache_resource
+def load_image_pipeline():
+    return ImagePipeline(client, s3_client(), "askphysics", uploads=upload_queue(), cache=AnswerCache())
 
-s3_client = boto3.client('s3', aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'], aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'])
-
-def upload_to_s3(uploaded_file, bucket_name, object_name=None):
-
-    if object_name is None:
-        object_name = uploaded_file.name
-
-    uploaded_file.seek(0)  # Reset file pointer
-    try:
-        # Upload the file
-        s3_client.upload_fileobj(uploaded_file, "askphysics", object_name)
-        return f"https://askphysics.s3.ap-southeast-1.amazonaws.com/{object_name}"
-    except Exception as e:
-        print(e)
-        return None
-
-def analyze_image():
-    """ Function to analyze the image using an AI model """ 
+def analyze_image(data):
+    """ Function to analyze the image using an AI model """
     try:
-        response = client.chat.completions.create(
-            model="gpt-4-vision-preview",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "What’s in this image?"},
-                        {"type": "image_url", "image_url": "https://askphysics.s3.ap-southeast-1.amazonaws.com/{object_name}"}
-                    ]
-                }
-            ],
-            max_tokens=600
-        )
-
-        if response.status_code == 200:
-            return response.json()  # Adjust based on actual response format
-        else:
-            # Detailed error message
-            print("API Response Error:", response.json())  # Log the error response
-            raise Exception("Error in API response")
+        return load_image_pipeline().analyse(data)
     except Exception as e:
         # Detailed exception message
         st.error(f"An error occurred: {str(e)}")
-        return None
+        return None, None
+
 def main():
+    # Stage timings on /metrics when $ASKME_METRICS_PORT is set
+    metrics_endpoint()
     st.title("Physics Tutor")
+    uploads = upload_queue().stats()
+    p95 = f"{uploads['latency_p95']:.1f}s" if uploads["latency_p95"] is not None else "-"
+    st.sidebar.caption(f"S3 uploads: {uploads['depth']} queued, {uploads.get('completed', 0)} done "
+                       f"(p95 {p95}), {uploads.get('failed', 0)} failed, {uploads.get('dropped', 0)} dropped")
 
     uploaded_file = st.file_uploader("Choose an image...", type=["jpg", "jpeg", "png"])
     if uploaded_file is not None:
@@ -68,31 +41,35 @@ def main():
         # st.write(file_details)
 
         # Display the image
-        image = Image.open(uploaded_file)
+        data = uploaded_file.getvalue()
+        try:
+            image = Image.open(io.BytesIO(data))
+        except UnidentifiedImageError:
+            st.error("That file doesn't look like an image.")
+            return
         st.image(image, caption='Uploaded Image', use_column_width=True)
 
-        # Upload to S3
-        s3_bucket_name = "askphysics"  # replace with your bucket name
-        file_url = upload_to_s3(uploaded_file, s3_bucket_name)
-        if file_url:
-            st.success(f"Uploaded to S3 at URL: {file_url}")
-        else:
-            st.error("Failed to upload to S3.")
+        # Upload to S3; reruns and repeat uploads of the same picture are skipped
+        file_url = load_image_pipeline().upload(data, uploaded_file.name)
+        st.success(f"Uploading to S3 at URL: {file_url}")
 
         if st.button('Analyze'):
-            try:
-                # Analyze the image using its URL
-                results = analyze_image()
-                display_results(results)
-            except Exception as e:
-                st.error(f"An error occurred: {e}")
+            results, info = analyze_image(data)
+            if results is not None:
+                display_results(results, info)
 
 
 
-def display_results(results):
+def display_results(results, info):
     """ Function to display the analysis results """
     st.write("Analysis Results:")
     st.write(results)
+    if info["cached"]:
+        st.caption("Answered from cache: this image was analysed before")
+    else:
+        width, height = info["size"]
+        st.caption(f"Sent {width}x{height}, {info['bytes'] // 1024} KB ({info['original_bytes'] // 1024} KB uploaded) "
+                   f"as {info['sent']}")
 	
 if __name__ == "__main__":
     main()
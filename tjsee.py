@@ -1,58 +1,54 @@
-import os
-import time
 import streamlit as st
-from openai import OpenAI
-import boto3
+from askme.chat_view import RerunTimer, render_history
+from askme.clients import metrics_endpoint, openai_client
 from datetime import datetime
 import csv
+from askme.runs import RunError, run_assistant
+from askme.threads import load_thread_pool, session_key
 import re
 
 # Assistant agents do not produce better results than in the playground. https://community.openai.com/t/why-does-my-assistant-find-the-right-answer-from-file-on-playground-but-not-via-api/491778/2
 # It also does not render equations in latex.
 assistant_id    = st.secrets["assistant_id"]
+# Time each script run so slow reruns show up in the sidebar
+timer = RerunTimer(st.session_state)
+# Stage timings on /metrics when $ASKME_METRICS_PORT is set
+metrics_endpoint()
 
 
-# Set openAi client , assistant ai and assistant ai thread
+# Set openAi client and assistant ai, shared by every session in this process
 @st.cache_resource
 def load_openai_client_and_assistant():
-    client          = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+    client          = openai_client()
     my_assistant    = client.beta.assistants.retrieve(st.secrets['assistant_id'])
-    thread          = client.beta.threads.create()
 
-    return client , my_assistant, thread
+    return client , my_assistant
 
-client,  my_assistant, assistant_thread = load_openai_client_and_assistant()
-
-# check in loop  if assistant ai parse our request
-def wait_on_run(run, thread):
-    while run.status == "queued" or run.status == "in_progress":
-        run = client.beta.threads.runs.retrieve(
-            thread_id=thread.id,
-            run_id=run.id,
-        )
-        time.sleep(0.5)
-    return run
+client,  my_assistant = load_openai_client_and_assistant()
+thread_pool = load_thread_pool()
 
 # initiate assistant ai response
 def get_assistant_response(user_input=""):
 
-    message = client.beta.threads.messages.create(
-        thread_id=assistant_thread.id,
-        role="user",
-        content=user_input,
-    )
-
-    run = client.beta.threads.runs.create(
-        thread_id=assistant_thread.id,
-        assistant_id=assistant_id,
-    )
+    lease = thread_pool.lease(session_key(st.session_state))
+    with lease.lock:
+        message = client.beta.threads.messages.create(
+            thread_id=lease.thread_id,
+            role="user",
+            content=user_input,
+        )
 
-    run = wait_on_run(run, assistant_thread)
+        # stream the run to completion (falls back to backoff polling)
+        try:
+            run_assistant(client, lease.thread_id, assistant_id)
+        except RunError as e:
+            st.error(f"Error in getting assistant response: {e}")
+            return
 
-    # Retrieve all the messages added after our last user message
-    messages = client.beta.threads.messages.list(
-        thread_id=assistant_thread.id, order="asc", after=message.id
-    )
+        # Retrieve all the messages added after our last user message
+        messages = client.beta.threads.messages.list(
+            thread_id=lease.thread_id, order="asc", after=message.id
+        )
 
     
     # Append the assistant's responses to the session state
@@ -75,14 +71,29 @@ def submit():
         st.session_state.query = ''
 
 st.title("Temasek JC Q&A")
+# report how often new sessions got a pre-warmed thread
+pool_stats = thread_pool.stats()
+st.sidebar.caption(f"Thread pool: {pool_stats['hit_rate']:.0%} hit rate, {pool_stats['spares_ready']} spare threads ready")
 
 st.header('Conversation', divider='rainbow')
-for role, message in st.session_state.conversation_history:
+# Finished turns go out as one cached block; only the latest exchange is drawn turn by turn
+def draw_turn(turn):
+    role, message = turn
     if role == 'user':
         message = f"<b style='color: yellow;'>{message}</b>"
         st.markdown(message, unsafe_allow_html=True)
     else:
         st.markdown(message)
 
+def format_turn(turn):
+    role, message = turn
+    if role == 'user':
+        return ":yellow[**" + str(message).replace("]", "\\]") + "**]"
+    return str(message)
+
+with timer.section("history"):
+    render_history(st.session_state.conversation_history, draw=draw_turn, format=format_turn)
+
 st.text_input("Ask me about TJC!", key='query', on_change=submit)
 
+st.sidebar.caption(timer.finish())
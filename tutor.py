@@ -0,0 +1,6 @@
+import streamlit as st
+from askme.tutor_page import tutor_pages
+
+# Every tutor in tutors.toml as a page of one app, sharing one process,
+# its clients and caches, and the OpenAI rate limiter
+st.navigation(tutor_pages()).run()